@@ -0,0 +1,72 @@
+# Per-user limits on expensive actions (Arbor scrapes, diagnostics, account setup)
+import os
+from clock import get_clock
+from cache_utils import LRUCache, MISSING
+from outbox import TokenBucket
+
+# (burst, seconds per extra run) for each guarded action
+ACTION_LIMITS = {
+    "fetch": (3, int(os.getenv("FETCH_COOLDOWN_SECONDS", "300"))),
+    "debug": (2, 600),
+    "setup": (3, 600)
+}
+
+# Requests for an action this soon after the last one started are treated as the same request
+DEBOUNCE_SECONDS = 10
+
+ACTION_NAMES = {"fetch": "fetching your assignments", "debug": "running diagnostics", "setup": "setting up your account"}
+
+class ActionGuard:
+    """Stops one user starting the same expensive action over and over.
+
+    Slash commands and natural-language requests both go through begin()/end(). While an action
+    is running for a user, or within DEBOUNCE_SECONDS of it starting, another request is refused
+    as already in progress. Beyond that each user has a token bucket per action.
+    """
+
+    def __init__(self, limits=None, max_users=4096):
+        self.limits = limits or ACTION_LIMITS
+        self.buckets = LRUCache(max_users)
+        # (action, user) -> when it started, for actions still running
+        self.in_flight = {}
+        self.last_started = LRUCache(max_users)
+        self.refused = {"busy": 0, "limited": 0}
+
+    def _bucket(self, action, user_id):
+        bucket = self.buckets.get((action, user_id))
+        if bucket is MISSING:
+            burst, seconds = self.limits[action]
+            bucket = TokenBucket(1 / seconds, burst)
+            self.buckets.put((action, user_id), bucket)
+        return bucket
+
+    def begin(self, action, user_id):
+        """Start an action for a user; return None if it may go ahead, otherwise a reply explaining why not"""
+        key = (action, str(user_id))
+        now = get_clock().monotonic()
+        started = self.last_started.get(key)
+        if key in self.in_flight or (started is not MISSING and now - started < DEBOUNCE_SECONDS):
+            self.refused["busy"] += 1
+            return f"I'm already {ACTION_NAMES.get(action, action)} for you. Hang on, it'll be with you shortly!"
+
+        wait = self._bucket(*key).try_acquire()
+        if wait:
+            self.refused["limited"] += 1
+            minutes = max(1, round(wait / 60))
+            return f"You've done that a lot recently. Please try again in about {minutes} minute{'s' if minutes != 1 else ''}."
+
+        self.in_flight[key] = now
+        self.last_started.put(key, now)
+        return None
+
+    def end(self, action, user_id):
+        self.in_flight.pop((action, str(user_id)), None)
+
+    def stats(self):
+        return {"in_flight": len(self.in_flight), **self.refused}
+
+_guard = ActionGuard()
+
+# The process-wide guard
+def get_action_guard():
+    return _guard
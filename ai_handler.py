@@ -4,6 +4,10 @@ import discord
 import asyncio
 from embed_utils import create_basic_embed, COLORS
 from database import user_exists
+from assignment_query import parse_query, is_specific, answer_query, fresh_sync_time, describe_query, search_terms, search_query
+from intent_router import IntentRouter
+from action_guard import get_action_guard
+from intent_classifier import load_classifier
 
 # Define patterns and responses for natural language processing
 PATTERNS = {
@@ -149,9 +153,38 @@ PATTERNS = {
         "Let me check if you have any assignments in that subject. I'll need to fetch your current assignments...",
         "I can look for subject-specific homework. Let me retrieve your assignments...",
         "I'll check your assignments and filter for that subject. One moment..."
+    ],
+    
+    # Looking for a particular assignment by name
+    r"(?i)(\b(find|search( for)?|look up|where('s| is)) (my|the|for|a)\b|\bwhen do i (hand in|submit)\b)": [
+        "Let me search your assignments for that...",
+        "I'll look through your assignments for it..."
     ]
 }
 
+# Intent names for PATTERNS, in the same order; these are also the intent classifier's labels
+INTENTS = [
+    "greeting", "help", "assignment_chat", "fetch", "due", "reminder_info", "set_reminder", "view_reminders",
+    "setup", "change_credentials", "delete_account", "debug", "status", "capability", "gratitude", "farewell",
+    "confusion", "subject_homework", "search"
+]
+
+# What each classified intent does; anything not listed gets its canned responses
+INTENT_ACTIONS = {
+    "help": "help",
+    "fetch": "fetch",
+    "due": "due",
+    "set_reminder": "set_reminder",
+    "view_reminders": "view_reminders",
+    "setup": "setup",
+    "change_credentials": "change_credentials",
+    "delete_account": "delete_account",
+    "debug": "debug",
+    "capability": "help",
+    "subject_homework": "subject_fetch",
+    "search": "search"
+}
+
 # Base class for mock interactions
 class BaseMockInteraction:
     def __init__(self, message, response_msg):
@@ -162,16 +195,16 @@ class BaseMockInteraction:
         self.followup = self
         self._response_done = False
         
-    async def send(self, content=None, embed=None, ephemeral=False):
-        await self.response_msg.edit(content=content, embed=embed)
+    async def send(self, content=None, embed=None, ephemeral=False, view=None):
+        await self.response_msg.edit(content=content, embed=embed, view=view)
         self._response_done = True
         
-    async def send_message(self, content=None, embed=None, ephemeral=False):
-        await self.response_msg.edit(content=content, embed=embed)
+    async def send_message(self, content=None, embed=None, ephemeral=False, view=None):
+        await self.response_msg.edit(content=content, embed=embed, view=view)
         self._response_done = True
         
-    async def response_send_message(self, content=None, embed=None, ephemeral=False):
-        await self.response_msg.edit(content=content, embed=embed)
+    async def response_send_message(self, content=None, embed=None, ephemeral=False, view=None):
+        await self.response_msg.edit(content=content, embed=embed, view=view)
         self._response_done = True
         
     async def response_defer(self, ephemeral=False):
@@ -186,13 +219,17 @@ class BaseMockInteraction:
         
     def is_done(self):
         return self._response_done
+    
+    # The message a view sent through this interaction is attached to
+    async def original_response(self):
+        return self.response_msg
         
-    async def followup_send(self, content=None, embed=None, ephemeral=False):
-        await self.response_msg.edit(content=content, embed=embed)
+    async def followup_send(self, content=None, embed=None, ephemeral=False, view=None):
+        await self.response_msg.edit(content=content, embed=embed, view=view)
         
     # Make sure we have a proper implementation for the send method on followup
-    async def send(self, content=None, embed=None, ephemeral=False):
-        await self.response_msg.edit(content=content, embed=embed)
+    async def send(self, content=None, embed=None, ephemeral=False, view=None):
+        await self.response_msg.edit(content=content, embed=embed, view=view)
 
 # Function to process natural language input
 async def process_message(message, bot):
@@ -211,125 +248,30 @@ async def process_message(message, bot):
     # Remove the bot mention from the message
     content = content.replace(f'<@{bot.user.id}>', '').strip()
     
-    # Check if user exists in database before processing commands that require an account
-    user_registered = user_exists(user_id)
-    
-    # Extract potential subject from message for subject-specific queries
-    subjects = ["math", "english", "science", "history", "geography", "art", "music", "pe", 
-               "physics", "chemistry", "biology", "computer science", "french", "spanish", "german"]
-    mentioned_subject = None
-    for subject in subjects:
-        if subject in content:
-            mentioned_subject = subject
-            break
-    
-    # Check for command-like patterns
-    for pattern, responses in PATTERNS.items():
-        match = re.search(pattern, content)
-        if match:
-            # Handle special cases that require actions
-            
-            # Assignment related actions - expanded to catch more variations
-            if ("assignment" in pattern or "homework" in pattern) and ("what" in pattern or "show" in pattern or "get" in pattern or "fetch" in pattern) and match:
-                if not user_registered:
-                    await send_registration_required(message)
-                    return
-                await handle_fetch_request(message, bot)
-                return
-                
-            # Subject-specific homework inquiries
-            elif mentioned_subject and ("homework" in content or "assignment" in content or "work" in content or "task" in content):
-                if not user_registered:
-                    await send_registration_required(message)
-                    return
-                # We'll still use the regular fetch but inform the user to look for that subject
-                embed = create_basic_embed("Subject-Specific Homework", 
-                                          f"I'll fetch all your assignments. Please look for {mentioned_subject.capitalize()} in the results.", 
-                                          "info")
-                await message.channel.send(embed=embed)
-                await handle_fetch_request(message, bot)
-                return
-                
-            # Due date specific inquiries
-            elif ("due" in pattern or "deadline" in pattern) and match:
-                if not user_registered:
-                    await send_registration_required(message)
-                    return
-                await handle_fetch_request(message, bot)
-                return
-                
-            # Reminder related actions - improved pattern matching
-            elif ("set" in pattern or "create" in pattern) and ("reminder" in pattern or "alert" in pattern) and match:
-                if not user_registered:
-                    await send_registration_required(message)
-                    return
-                # Extract the number of days from the match
-                # The group index might vary based on the regex pattern
-                days_group = None
-                for i in range(len(match.groups())):
-                    group = match.group(i+1)
-                    if group and group.isdigit():
-                        days_group = int(group)
-                        break
-                
-                if days_group:
-                    await handle_set_reminder(message, bot, days_group)
-                else:
-                    # Default to 1 day if we couldn't extract a number
-                    await handle_set_reminder(message, bot, 1)
-                return
-                
-            elif ("view" in pattern or "show" in pattern or "check" in pattern or "list" in pattern) and ("reminder" in pattern or "alert" in pattern) and match:
-                if not user_registered:
-                    await send_registration_required(message)
-                    return
-                await handle_view_reminders(message, bot)
-                return
-                
-            # Account management actions - improved pattern matching
-            elif ("setup" in pattern or "create" in pattern or "register" in pattern) and ("account" in pattern or "profile" in pattern) and match:
-                await handle_setup(message, bot)
-                return
-                
-            elif ("change" in pattern or "update" in pattern or "modify" in pattern) and ("credentials" in pattern or "password" in pattern or "login" in pattern) and match:
-                if not user_registered:
-                    await send_registration_required(message)
-                    return
-                await handle_change_credentials(message, bot)
-                return
-                
-            elif ("delete" in pattern or "remove" in pattern) and ("account" in pattern or "profile" in pattern) and match:
-                if not user_registered:
-                    await send_registration_required(message)
-                    return
-                await handle_delete_account(message, bot)
-                return
-                
-            # Debug actions
-            elif ("debug" in pattern or "diagnose" in pattern or "test" in pattern or "troubleshoot" in pattern) and match:
-                await handle_debug(message, bot)
-                return
-                
-            # Help actions
-            elif ("help" in pattern or "guide" in pattern or "how" in pattern or "what can you do" in pattern) and match:
-                await handle_help(message, bot)
-                return
-            
+    route = router.route(content)
+    if route.intent is not None:
+        # Only actions on the user's own data need an account
+        if route.action in REGISTERED_ACTIONS and not user_exists(user_id):
+            await send_registration_required(message)
+            return
+
+        if route.action in ("fetch", "due", "subject_fetch", "search"):
+            await handle_assignment_question(message, bot, content, route)
+        elif route.action == "set_reminder":
+            # Default to 1 day if we couldn't extract a number
+            days = int(route.number) if route.number else 0
+            await handle_set_reminder(message, bot, days or 1)
+        elif route.action in ACTION_HANDLERS:
+            await ACTION_HANDLERS[route.action](message, bot)
+        else:
             # For simple responses
-            response = random.choice(responses)
-            
-            # Format response if it contains placeholders
-            if match.groups() and '{0}' in response:
-                # Find the first numeric group to use for formatting
-                for i in range(len(match.groups())):
-                    group = match.group(i+1)
-                    if group and group.isdigit():
-                        response = response.format(group)
-                        break
-                
+            response = random.choice(router.responses[route.intent])
+            # Format response with the first numeric group if it has a placeholder
+            if route.number and '{0}' in response:
+                response = response.format(route.number)
             embed = create_basic_embed("ArborAlert Assistant", response, "info")
             await message.channel.send(embed=embed)
-            return
+        return
     
     # Default response if no pattern matches - more varied responses
     default_responses = [
@@ -344,6 +286,54 @@ async def process_message(message, bot):
     await message.channel.send(embed=embed)
 
 # Handler functions for specific actions
+async def handle_assignment_question(message, bot, content, route):
+    """Answer what's-due and subject questions from stored assignments, only scraping when they're stale"""
+    from arbor_processor import refresh_assignments
+    from embed_utils import create_stored_assignments_embed, create_search_results_embed
+    
+    query = parse_query(content)
+    terms = search_terms(content)
+    # A plain "show my assignments" is still a fetch
+    if route.action == "fetch" and not is_specific(query) and not terms:
+        await handle_fetch_request(message, bot)
+        return
+    
+    discord_id = str(message.author.id)
+    synced_at = fresh_sync_time(discord_id)
+    # Refresh stale data first, unless a scrape is already running or the user is over their limit
+    if synced_at is None and get_action_guard().begin("fetch", discord_id) is None:
+        embed = create_basic_embed("Checking Arbor", "Your saved assignments are out of date, so I'm checking Arbor first...", "info")
+        await message.channel.send(embed=embed)
+        try:
+            await refresh_assignments(discord_id)
+            synced_at = fresh_sync_time(discord_id)
+        except Exception as e:
+            print(f"Error refreshing assignments for user {discord_id}: {e}")
+        finally:
+            get_action_guard().end("fetch", discord_id)
+    
+    # Questions naming an assignment ("when is the mask evaluation due?") are searched for;
+    # if nothing matches the words, answer from the dates and subjects alone
+    found = search_query(discord_id, query, terms) if terms else []
+    if found:
+        embed = create_search_results_embed(" ".join(terms), found)
+    else:
+        assignments = answer_query(discord_id, query)
+        embed = create_stored_assignments_embed(assignments)
+        embed.title = describe_query(query)
+        if not assignments:
+            embed.description = "You don't have any assignments matching that."
+        elif terms:
+            embed.description = f"Nothing matched \"{' '.join(terms)}\", here's what you have instead."
+    if synced_at is not None:
+        embed.set_footer(text=f"ArborAlert • Checked with Arbor {synced_at.strftime('%d %b %H:%M')}")
+    
+    # Assignments are only ever sent by DM, like /fetch
+    await message.author.send(embed=embed)
+    if not isinstance(message.channel, discord.DMChannel):
+        embed = create_basic_embed("Sent!", "I've sent you a DM with your answer.", "success")
+        await message.channel.send(embed=embed)
+
 async def handle_fetch_request(message, bot):
     """Handle a natural language request to fetch assignments"""
     from bot_commands import fetch_command
@@ -483,4 +473,20 @@ async def handle_help(message, bot):
         await help_command(mock_interaction)
     except Exception as e:
         embed = create_basic_embed("Error", f"I encountered an error while displaying help: {str(e)}", "error")
-        await response_msg.edit(embed=embed)
\ No newline at end of file
+        await response_msg.edit(embed=embed)
+
+# Actions that work on the user's stored account, so need one
+REGISTERED_ACTIONS = {"fetch", "due", "subject_fetch", "search", "set_reminder", "view_reminders", "change_credentials", "delete_account"}
+
+# Actions handled by a plain (message, bot) handler
+ACTION_HANDLERS = {
+    "view_reminders": handle_view_reminders,
+    "setup": handle_setup,
+    "change_credentials": handle_change_credentials,
+    "delete_account": handle_delete_account,
+    "debug": handle_debug,
+    "help": handle_help
+}
+
+# Patterns are compiled, their actions worked out and the intent model loaded once, at import
+router = IntentRouter(PATTERNS, classifier=load_classifier(), intents=INTENTS, intent_actions=INTENT_ACTIONS)
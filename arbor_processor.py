@@ -7,8 +7,25 @@ from selenium.webdriver.firefox.options import Options
 import os
 import re
 import datetime
+import asyncio
+import time
 from time import sleep
-from database import get_credentials, get_reminder_days, clear_user_reminders, add_reminder
+from database import (
+    get_credentials, get_reminder_days, clear_user_reminders, add_reminder,
+    sync_assignments, get_user_assignments
+)
+from clock import get_clock
+from metrics import get_metrics
+
+SCRAPES = get_metrics().counter(
+    "arboralert_scrapes_total", "Arbor scrapes, by outcome (ok, failed, unrecognised_page)", ("outcome",)
+)
+SCRAPE_SECONDS = get_metrics().histogram(
+    "arboralert_scrape_seconds", "Time taken to start a browser, log in to Arbor and read the page"
+)
+
+# In-flight background refreshes, so concurrent requests for one user share a single scrape
+_refresh_tasks = {}
 
 # Process Arbor Data
 def process_arbor_data(discord_id):
@@ -19,8 +36,10 @@ def process_arbor_data(discord_id):
     # Set up Firefox options for headless mode
     options = Options()
     options.headless = True
-    driver = webdriver.Firefox(options=options)
+    started = time.perf_counter()
+    driver = None
     try:
+        driver = webdriver.Firefox(options=options)
         driver.get(os.getenv("arborurl"))
 
         email_input = WebDriverWait(driver, 10).until(
@@ -34,18 +53,48 @@ def process_arbor_data(discord_id):
         sleep(3)  # Wait for login to complete
 
         visible_text = driver.find_element(By.TAG_NAME, "body").text
-        with open("arbor_text.txt", "w", encoding="utf-8") as file:
-            file.write(visible_text)
 
         print("Text extracted successfully!")
 
     except Exception as e:
+        SCRAPES.labels("failed").inc()
         print(f"An error occurred during Arbor processing: {e}")
         raise  # Re-raise the exception to be handled by the caller
     finally:
-        driver.quit()
+        if driver is not None:
+            driver.quit()
+        SCRAPE_SECONDS.observe(time.perf_counter() - started)
+
+    # Parse straight from memory; the assignments table is the stored copy
+    processed_content = process_text(visible_text, discord_id)
+    SCRAPES.labels("ok" if processed_content is not None else "unrecognised_page").inc()
+    return processed_content
+
+# Cut the homework section out of the page text
+def extract_assignments_text(content):
+    start_index = content.find("Overdue Assignments")
+    end_index = content.find("Submitted Assignments")
+    if start_index == -1 or end_index == -1:
+        print("Key phrases not found in the document.")
+        return None
 
-    process_document("arbor_text.txt", "arbor_processed_text.txt", discord_id)
+    content = content.replace("Overdue Assignments", "Overdue Assignments:")
+    content = content.replace("Assignments that are due", "Assignments that are due:")
+    start_index = content.find("Overdue Assignments:")
+    end_index = content.find("Submitted Assignments")
+    processed_content = content[start_index + len("Overdue Assignments:"):end_index].strip()
+    processed_content = processed_content.replace("Assignments that are due:", "", 1).strip()
+    return processed_content
+
+# Process the scraped page text: store assignments and schedule reminders
+def process_text(content, discord_id):
+    processed_content = extract_assignments_text(content)
+    if processed_content is None:
+        return None
+
+    # Parse assignments and due dates for reminders
+    parse_assignments_and_schedule(processed_content, discord_id)
+    return processed_content
 
 # Process document function
 def process_document(file_path, output_path, discord_id):
@@ -53,30 +102,35 @@ def process_document(file_path, output_path, discord_id):
         with open(file_path, "r", encoding="utf-8") as file:
             content = file.read()
 
-        start_index = content.find("Overdue Assignments")
-        end_index = content.find("Submitted Assignments")
-        if start_index == -1 or end_index == -1:
-            print("Key phrases not found in the document.")
+        processed_content = process_text(content, discord_id)
+        if processed_content is None:
             return False
 
-        content = content.replace("Overdue Assignments", "Overdue Assignments:")
-        content = content.replace("Assignments that are due", "Assignments that are due:")
-        start_index = content.find("Overdue Assignments:")
-        processed_content = content[start_index + len("Overdue Assignments:"):end_index].strip()
-        processed_content = processed_content.replace("Assignments that are due:", "", 1).strip()
-
         with open(output_path, "w", encoding="utf-8") as file:
             file.write(processed_content)
 
         print(f"Processed text saved to {output_path}")
-        
-        # Parse assignments and due dates for reminders
-        parse_assignments_and_schedule(processed_content, discord_id)
         return True
     except Exception as e:
         print(f"Error processing document: {e}")
         return False
 
+# Scrape Arbor without blocking the event loop and return the stored assignments.
+# Concurrent calls for the same user share one scrape.
+async def refresh_assignments(discord_id):
+    task = _refresh_tasks.get(discord_id)
+    if task is None:
+        loop = asyncio.get_running_loop()
+        task = asyncio.ensure_future(loop.run_in_executor(None, process_arbor_data, discord_id))
+        _refresh_tasks[discord_id] = task
+        task.add_done_callback(lambda _: _refresh_tasks.pop(discord_id, None))
+    await asyncio.shield(task)
+    return get_user_assignments(discord_id)
+
+# Status of an assignment still on the user's Arbor list
+def assignment_status(due_date):
+    return "overdue" if due_date.date() < get_clock().now().date() else "upcoming"
+
 # Parse assignments and schedule reminders
 def parse_assignments_and_schedule(content, discord_id):
     # Get user's reminder preference
@@ -85,6 +139,10 @@ def parse_assignments_and_schedule(content, discord_id):
     # Clear existing reminders for this user
     clear_user_reminders(discord_id)
     
+    # Every assignment seen in this scrape, as (subject_code, title, due_date, status)
+    seen_assignments = []
+    seen_at = get_clock().now().isoformat(sep=' ')
+    
     # Parse assignments and due dates
     lines = content.split('\n')
     current_assignment = None
@@ -109,12 +167,15 @@ def parse_assignments_and_schedule(content, discord_id):
             try:
                 # Parse the due date
                 due_date = datetime.datetime.strptime(due_date_str, '%d %b %Y')
+                seen_assignments.append(
+                    (subject_code, assignment_name, due_date.strftime('%Y-%m-%d'), assignment_status(due_date))
+                )
                 
                 # Calculate reminder date
                 reminder_date = due_date - datetime.timedelta(days=reminder_days)
                 
                 # Only schedule if the reminder date is in the future
-                if reminder_date > datetime.datetime.now():
+                if reminder_date > get_clock().now():
                     add_reminder(
                         discord_id, 
                         current_assignment, 
@@ -143,12 +204,15 @@ def parse_assignments_and_schedule(content, discord_id):
                 try:
                     # Parse the ISO format date
                     due_date = datetime.datetime.strptime(due_date_str, '%Y-%m-%d')
+                    seen_assignments.append(
+                        (subject_code, assignment_name, due_date_str, assignment_status(due_date))
+                    )
                     
                     # Calculate reminder date
                     reminder_date = due_date - datetime.timedelta(days=reminder_days)
                     
                     # Only schedule if the reminder date is in the future
-                    if reminder_date > datetime.datetime.now():
+                    if reminder_date > get_clock().now():
                         add_reminder(
                             discord_id, 
                             current_assignment, 
@@ -172,12 +236,15 @@ def parse_assignments_and_schedule(content, discord_id):
             try:
                 # Parse the due date
                 due_date = datetime.datetime.strptime(due_date_str, '%d/%m/%Y')
+                seen_assignments.append(
+                    ("", current_assignment, due_date.strftime('%Y-%m-%d'), assignment_status(due_date))
+                )
                 
                 # Calculate reminder date
                 reminder_date = due_date - datetime.timedelta(days=reminder_days)
                 
                 # Only schedule if the reminder date is in the future
-                if reminder_date > datetime.datetime.now():
+                if reminder_date > get_clock().now():
                     add_reminder(
                         discord_id, 
                         current_assignment, 
@@ -187,4 +254,7 @@ def parse_assignments_and_schedule(content, discord_id):
             except ValueError:
                 print(f"Could not parse date: {due_date_str}")
         
-        i += 1
\ No newline at end of file
+        i += 1
+    
+    # Store every assignment, including those whose reminder date has already passed
+    sync_assignments(discord_id, seen_assignments, seen_at)
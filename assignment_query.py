@@ -0,0 +1,179 @@
+# Answer questions about due dates and subjects from stored assignments
+import datetime
+import os
+import re
+from collections import namedtuple
+from clock import get_clock
+from database import query_assignments, search_assignments, get_assignments_synced_at
+
+# Stored assignments older than this are refreshed from Arbor before answering; the daily fetch
+# keeps them younger, with some slack for how long it takes to run
+ASSIGNMENTS_MAX_AGE_HOURS = float(os.getenv("ASSIGNMENTS_MAX_AGE_HOURS", "26"))
+
+# A question about assignments: a due-date range (either end may be None), the subjects asked
+# about, and how to describe the range ("this week"), or None for all outstanding assignments
+AssignmentQuery = namedtuple("AssignmentQuery", ["start", "end", "subjects", "label"])
+
+# Subject words, and the Arbor subject codes (the part after "/" in "7X/Ar") that go with them
+SUBJECT_CODES = {
+    "maths": {"ma"}, "math": {"ma"}, "english": {"en"}, "science": {"sc"}, "history": {"hi"},
+    "geography": {"gg", "ge"}, "art": {"ar"}, "music": {"mu"}, "pe": {"pe"}, "physical education": {"pe"},
+    "physics": {"ph"}, "chemistry": {"ch"}, "biology": {"bi"}, "computer science": {"cs", "co", "pc"},
+    "computing": {"cs", "co", "pc"}, "french": {"fr"}, "spanish": {"sp", "es"}, "german": {"gm", "de"},
+    "drama": {"dr"}, "design": {"dt"}, "religious studies": {"rs", "re"}
+}
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "ten": 10, "fourteen": 14}
+
+NUMBER = r"(\d+|" + "|".join(NUMBER_WORDS) + r")"
+
+# Date phrases, most specific first; each maps a match to (start, end, label) given today
+DATE_PHRASES = [
+    (re.compile(r"\b(overdue|late|missed)\b"),
+     lambda match, today: (None, today - datetime.timedelta(days=1), "overdue")),
+    (re.compile(r"\b(next|within|in the next) " + NUMBER + r" days?\b"),
+     lambda match, today: (today, today + datetime.timedelta(days=_number(match.group(2))), f"in the next {_number(match.group(2))} days")),
+    (re.compile(r"\bin " + NUMBER + r" days?\b"),
+     lambda match, today: _day(today + datetime.timedelta(days=_number(match.group(1))), f"in {_number(match.group(1))} days")),
+    (re.compile(r"\b(today|tonight)\b"),
+     lambda match, today: _day(today, "today")),
+    (re.compile(r"\btomorrow\b"),
+     lambda match, today: _day(today + datetime.timedelta(days=1), "tomorrow")),
+    (re.compile(r"\b(this )?weekend\b"),
+     lambda match, today: (_weekday_on_or_after(today, 5), _weekday_on_or_after(today, 6), "this weekend")),
+    (re.compile(r"\bnext week\b"),
+     lambda match, today: (_week_start(today) + datetime.timedelta(days=7), _week_start(today) + datetime.timedelta(days=13), "next week")),
+    (re.compile(r"\b(this|the) week\b"),
+     lambda match, today: (today, _week_start(today) + datetime.timedelta(days=6), "this week")),
+    (re.compile(r"\bnext month\b"),
+     lambda match, today: (_month_start(today, 1), _month_start(today, 2) - datetime.timedelta(days=1), "next month")),
+    (re.compile(r"\bthis month\b"),
+     lambda match, today: (today, _month_start(today, 1) - datetime.timedelta(days=1), "this month")),
+    (re.compile(r"\b(by|before) (" + "|".join(WEEKDAYS) + r")\b"),
+     lambda match, today: (today, _weekday_on_or_after(today, WEEKDAYS.index(match.group(2))), f"by {match.group(2).capitalize()}")),
+    (re.compile(r"\b(" + "|".join(WEEKDAYS) + r")\b"),
+     lambda match, today: _day(_weekday_on_or_after(today, WEEKDAYS.index(match.group(1))), f"on {match.group(1).capitalize()}")),
+    (re.compile(r"\b(soon|upcoming|coming up|next)\b"),
+     lambda match, today: (today, today + datetime.timedelta(days=7), "in the next week"))
+]
+
+# Words that say what kind of question it is rather than which assignment it's about
+STOP_WORDS = {
+    "a", "about", "all", "am", "an", "and", "any", "are", "at", "by", "can", "could", "do", "does", "for",
+    "from", "get", "give", "have", "homework", "hw", "i", "in", "is", "it", "list", "me", "my", "need", "of",
+    "on", "or", "please", "set", "show", "still", "tell", "that", "the", "there", "these", "this", "to",
+    "what", "whats", "when", "which", "will", "with", "you", "your", "assignment", "assignments", "task",
+    "tasks", "work", "due", "deadline", "deadlines", "date", "hand", "submit", "handed", "search", "find",
+    "today", "tonight", "tomorrow", "week", "weekend", "month", "next", "soon", "upcoming", "overdue",
+    "late", "missed", "days", "day", "before", "within", "anything", "got", "how", "many", "much", "left",
+    "outstanding", "pending", "current", "new", "yet", "be", "been", "should", "we", "our", "im", "up",
+    "coming", "check", "see", "know", "want", "pls", "hey", "hi", "ok", "thanks", "now", "remaining",
+    "coursework", "projects", "arbor", "fetch", "grab", "pull", "load", "display", "until", "long", "dates"
+}
+
+SUBJECT_PATTERN = re.compile(r"\b(" + "|".join(sorted(map(re.escape, SUBJECT_CODES), key=len, reverse=True)) + r")\b")
+
+# Subject codes typed out in full, like "7x/ar"
+CODE_PATTERN = re.compile(r"\b\d+\w*/([a-z]{2,3})\b")
+
+def _number(text):
+    return int(text) if text.isdigit() else NUMBER_WORDS[text]
+
+def _day(date, label):
+    return date, date, label
+
+def _week_start(today):
+    return today - datetime.timedelta(days=today.weekday())
+
+def _weekday_on_or_after(today, weekday):
+    return today + datetime.timedelta(days=(weekday - today.weekday()) % 7)
+
+def _month_start(today, months_ahead):
+    month = today.month - 1 + months_ahead
+    return datetime.date(today.year + month // 12, month % 12 + 1, 1)
+
+def parse_query(content, today=None):
+    """Work out the date range and subjects a message asks about"""
+    if today is None:
+        today = get_clock().now().date()
+    content = content.lower()
+
+    start = end = label = None
+    for pattern, date_range in DATE_PHRASES:
+        match = pattern.search(content)
+        if match:
+            start, end, label = date_range(match, today)
+            break
+
+    subjects = {match.group(1) for match in SUBJECT_PATTERN.finditer(content)}
+    subjects.update(f"/{match.group(1)}" for match in CODE_PATTERN.finditer(content))
+    return AssignmentQuery(start, end, frozenset(subjects), label)
+
+# Whether a query narrows things down, rather than asking for everything
+def is_specific(query):
+    return query.label is not None or bool(query.subjects)
+
+# Whether a stored (subject_code, title, ...) row is for one of the subjects asked about
+def matches_subjects(row, subjects):
+    if not subjects:
+        return True
+    subject_code, title = row[0].lower(), row[1].lower()
+    code = subject_code.rpartition("/")[2]
+    for subject in subjects:
+        if subject.startswith("/"):
+            if code == subject[1:]:
+                return True
+        elif code in SUBJECT_CODES[subject] or re.search(rf"\b{re.escape(subject)}\b", title):
+            return True
+    return False
+
+def answer_query(discord_id, query):
+    """Stored assignments matching a query, as (subject_code, title, due_date, status) rows"""
+    start = query.start.strftime('%Y-%m-%d') if query.start else None
+    end = query.end.strftime('%Y-%m-%d') if query.end else None
+    return [row for row in query_assignments(discord_id, start, end) if matches_subjects(row, query.subjects)]
+
+def search_terms(content):
+    """Words in a message that could name an assignment, e.g. ["mask", "evaluation"]"""
+    content = CODE_PATTERN.sub(" ", SUBJECT_PATTERN.sub(" ", content.lower()))
+    terms = []
+    for word in re.findall(r"\w+", content):
+        if len(word) >= 2 and word not in STOP_WORDS and word not in WEEKDAYS and word not in NUMBER_WORDS \
+                and not word.isdigit() and word not in terms:
+            terms.append(word)
+    return terms
+
+def search_query(discord_id, query, terms, limit=10):
+    """Stored assignments best matching the search terms, within the query's dates and subjects"""
+    start = query.start.strftime('%Y-%m-%d') if query.start else None
+    end = query.end.strftime('%Y-%m-%d') if query.end else None
+    # Ask for more than we need, as some are filtered out below
+    rows = search_assignments(discord_id, terms, limit * 3 if is_specific(query) else limit)
+    rows = [
+        row for row in rows
+        if (start is None or row[2] >= start) and (end is None or row[2] <= end) and matches_subjects(row, query.subjects)
+    ]
+    return rows[:limit]
+
+# When the user's assignments were last synced, or None if they're missing or too old to trust
+def fresh_sync_time(discord_id):
+    synced_at = get_assignments_synced_at(discord_id)
+    if not synced_at:
+        return None
+    synced_at = datetime.datetime.fromisoformat(synced_at)
+    if get_clock().now() - synced_at > datetime.timedelta(hours=ASSIGNMENTS_MAX_AGE_HOURS):
+        return None
+    return synced_at
+
+# Describe a query for an embed title, e.g. "Art assignments due this week"
+def describe_query(query):
+    subjects = sorted(
+        subject.lstrip("/").upper() if subject.startswith("/") or len(subject) <= 2 else subject.title()
+        for subject in query.subjects
+    )
+    what = f"{' & '.join(subjects)} assignments" if subjects else "Assignments"
+    if query.label == "overdue":
+        return f"Overdue {what}"
+    return f"{what} due {query.label}" if query.label else what
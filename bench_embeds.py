@@ -0,0 +1,114 @@
+# Micro-benchmark for rendering assignment and reminder embeds
+#
+# Times the old line-by-line string concatenation, a cold render through the render layer and a
+# render served from its cache, for lists of growing size.
+#
+#   python bench_embeds.py --sizes 100 1000 10000
+import argparse
+import datetime
+import random
+import sys
+import time
+
+import embed_utils
+from embed_utils import (
+    create_basic_embed, create_stored_assignments_embed, create_reminders_list_embed, create_assignments_embed,
+    EMOJIS
+)
+
+SUBJECTS = ["7X/Ar", "7X/Ma", "7X/En", "7X/Sc", "7X/Hi", "8Y/Fr", ""]
+WORDS = ["mask", "evaluation", "essay", "worksheet", "poster", "revision", "quiz", "project", "reading", "lab", "report"]
+
+# (subject_code, title, due_date, status) rows, (assignment, due_date, reminder_date) rows and the
+# plain text Arbor would have given for the same assignments
+def sample_data(size, rng):
+    today = datetime.date(2026, 10, 21)
+    assignments, reminders = [], []
+    for i in range(size):
+        due = today + datetime.timedelta(days=rng.randint(-5, 60))
+        subject_code = rng.choice(SUBJECTS)
+        title = f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} {i}"
+        assignments.append((subject_code, title, due.isoformat(), "overdue" if due < today else "upcoming"))
+        name = f"{subject_code}: {title}" if subject_code else title
+        reminders.append((name, due.isoformat(), (due - datetime.timedelta(days=1)).isoformat()))
+    assignments.sort(key=lambda row: row[2])
+    reminders.sort(key=lambda row: row[1])
+    text = "Overdue assignments:\n" + "\n".join(
+        f"{code}: {title} - {due}" for code, title, due, status in assignments if status == "overdue"
+    ) + "\nAssignments that are due:\n" + "\n".join(
+        f"{code}: {title} - {due}" for code, title, due, status in assignments if status != "overdue"
+    )
+    return assignments, reminders, text
+
+# How create_stored_assignments_embed used to build its fields
+def legacy_assignments_embed(assignments):
+    embed = create_basic_embed("Your Assignments", color="info")
+    sections = {"overdue": "", "upcoming": ""}
+    for subject_code, title, due_date, status in assignments:
+        section = "overdue" if status == "overdue" else "upcoming"
+        due = datetime.datetime.strptime(due_date, '%Y-%m-%d').strftime('%d %b %Y')
+        if subject_code:
+            sections[section] += f"**{subject_code}:** {title} (Due {due})\n"
+        else:
+            sections[section] += f"{title} (Due {due})\n"
+    if sections["overdue"]:
+        embed.add_field(name=f"{EMOJIS['overdue']} Overdue Assignments", value=sections["overdue"], inline=False)
+    if sections["upcoming"]:
+        embed.add_field(name=f"{EMOJIS['due_soon']} Upcoming Assignments", value=sections["upcoming"], inline=False)
+    return embed
+
+# How create_reminders_list_embed used to build its fields
+def legacy_reminders_embed(reminders):
+    embed = create_basic_embed("Your Upcoming Reminders", "Here are all your scheduled assignment reminders:", "info")
+    reminders_by_date = {}
+    for assignment, due_date, reminder_date in reminders:
+        if due_date not in reminders_by_date:
+            reminders_by_date[due_date] = []
+        reminders_by_date[due_date].append((assignment, reminder_date))
+    for due_date, assignments in sorted(reminders_by_date.items()):
+        assignments_text = ""
+        for assignment, reminder_date in assignments:
+            assignments_text += f"• **{assignment}**\n  _Reminder on: {reminder_date}_\n"
+        embed.add_field(name=f"📅 Due on {due_date}", value=assignments_text, inline=False)
+    return embed
+
+def time_call(func, data, repeat, before=None):
+    best = float("inf")
+    for _ in range(repeat):
+        if before:
+            before()
+        started = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Render cost of assignment and reminder embeds")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per input; the fastest is kept")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cases = [
+        ("assignments", legacy_assignments_embed, create_stored_assignments_embed, 0),
+        ("reminders", legacy_reminders_embed, create_reminders_list_embed, 1),
+        ("arbor text", None, create_assignments_embed, 2)
+    ]
+
+    print(f"{'embed':<14}{'rows':>8}{'legacy ms':>12}{'cold ms':>10}{'cached ms':>11}")
+    for size in args.sizes:
+        data = sample_data(size, rng)
+        for name, legacy, render, index in cases:
+            legacy_ms = f"{time_call(legacy, data[index], args.repeat):>12.3f}" if legacy else f"{'-':>12}"
+            cold_ms = time_call(render, data[index], args.repeat, before=embed_utils.render_cache.clear)
+            render(data[index])
+            cached_ms = time_call(render, data[index], args.repeat)
+            print(f"{name:<14}{size:>8}{legacy_ms}{cold_ms:>10.3f}{cached_ms:>11.3f}")
+
+    print()
+    print(f"Render cache: {embed_utils.render_cache.stats()}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
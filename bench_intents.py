@@ -0,0 +1,90 @@
+# Adversarial benchmark for natural-language message routing
+#
+# Times the worst messages we can think of, at growing sizes, through the old per-pattern loop
+# over the whole message and through the intent router, and checks the router's worst case stays
+# within a fixed budget however long the message gets.
+#
+#   python bench_intents.py --sizes 1000 10000 100000 --budget-ms 5
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+from cryptography.fernet import Fernet
+
+# database.py builds its cipher at import time
+os.environ.setdefault("KEY", Fernet.generate_key().decode())
+
+from ai_handler import PATTERNS, INTENTS, INTENT_ACTIONS
+from intent_classifier import load_classifier
+from intent_router import IntentRouter, MAX_MESSAGE_CHARS, MAX_MESSAGE_TOKENS, re2
+
+# Messages of roughly `size` characters built to make matching work hard
+def adversarial_messages(size, rng):
+    keywords = re.findall(r"[a-z']{2,}", " ".join(PATTERNS).lower())
+    return {
+        # Every pattern has to be tried and none matches
+        "no match": "z" * size,
+        # A keyword at every position keeps every pattern a candidate
+        "keyword flood": ("set remind how what my the " * size)[:size],
+        # Optional groups that almost match, over and over
+        "near misses": ("show my the assignment " * size)[:size],
+        # Digits for (\d+) day with the closing word missing
+        "digit run": "set a reminder for " + "1" * size,
+        "whitespace": "hi" + " " * size + "!",
+        "random keywords": " ".join(rng.choice(keywords) for _ in range(size // 6)),
+        # What matters comes last, past the cap
+        "late intent": "x" * size + " show my assignments"
+    }
+
+# The routing process_message used to do: every pattern, in order, over the whole message
+def legacy_route(content):
+    content = content.lower()
+    for pattern in PATTERNS:
+        if re.search(pattern, content):
+            return pattern
+    return None
+
+def time_call(func, content, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(content)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Worst-case routing time for adversarial messages")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per message; the fastest is kept")
+    parser.add_argument("--budget-ms", type=float, default=5.0, help="fail if routing any message takes longer")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Routed as in the bot, classifier included, with caching disabled so every run does the full work
+    router = IntentRouter(PATTERNS, cache_size=1, classifier=load_classifier(), intents=INTENTS,
+                          intent_actions=INTENT_ACTIONS)
+
+    def route_uncached(content):
+        router.cache.clear()
+        return router.route(content)
+
+    print(f"Engine: {'re2' if re2 else 're (backtracking)'}, caps: {MAX_MESSAGE_CHARS} chars, {MAX_MESSAGE_TOKENS} tokens")
+    print(f"{'message':<18}{'size':>8}{'legacy ms':>12}{'router ms':>12}")
+    worst = 0.0
+    for size in args.sizes:
+        for name, content in adversarial_messages(size, rng).items():
+            legacy_ms = time_call(legacy_route, content, args.repeat)
+            router_ms = time_call(route_uncached, content, args.repeat)
+            worst = max(worst, router_ms)
+            print(f"{name:<18}{size:>8}{legacy_ms:>12.3f}{router_ms:>12.3f}")
+
+    print()
+    print(f"Worst router time: {worst:.3f} ms (budget {args.budget_ms} ms)")
+    return 1 if worst > args.budget_ms else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,95 @@
 import discord
 import asyncio
-import os
+import contextvars
+import functools
+import re
 import traceback
-from database import save_user_credentials, get_user_reminders, set_reminder_days, delete_user_account, user_exists
-from arbor_processor import process_arbor_data
+from database import (
+    save_user_credentials_async, set_reminder_days_async, delete_user_account_async, user_exists,
+    get_user_assignments, search_assignments
+)
+from arbor_processor import refresh_assignments
+from action_guard import get_action_guard
+from pagination import paged_message
+from assignment_query import parse_query, is_specific, answer_query, search_terms, search_query
 from debug_utils import DebugTests, get_system_info
 from embed_utils import (
-    create_basic_embed, create_assignments_embed, create_reminders_list_embed,
-    create_welcome_embed, create_error_embed, create_confirmation_embed
+    create_basic_embed, create_welcome_embed, create_error_embed, create_confirmation_embed,
+    create_search_results_embed, copy_embed
+)
+from metrics import get_metrics
+
+# Confirmation prompts are the same every time, so they're built once at startup
+DELETE_ACCOUNT_CONFIRMATION = create_confirmation_embed(
+    "⚠️ Account Deletion", 
+    "This will permanently delete your account and all your reminders from ArborAlert.\n"
+    "Your data cannot be recovered after deletion.\n\n"
+    "Are you sure you want to proceed? Reply with 'yes' to confirm or 'no' to cancel."
+)
+
+COMMANDS = get_metrics().counter(
+    "arboralert_commands_total", "Slash commands handled, by command and outcome", ("command", "outcome")
+)
+COMMAND_SECONDS = get_metrics().histogram(
+    "arboralert_command_seconds", "Time taken to handle a slash command", ("command",)
 )
 
+# Background refreshes still running; the event loop only holds weak references to tasks
+_background_tasks = set()
+
+# Outcome of the command being handled, as a one-item list the handler can change
+_command_outcome = contextvars.ContextVar("command_outcome", default=None)
+
+# Handlers reply to their own errors rather than raising, so they record the outcome themselves
+# ("error", "timeout", "refused"); a no-op outside a command
+def set_command_outcome(outcome):
+    current = _command_outcome.get()
+    if current is not None:
+        current[0] = outcome
+
+# Count and time a slash command handler; outcome is "ok" unless the handler set another or raised
+def instrumented(command):
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            outcome = ["ok"]
+            token = _command_outcome.set(outcome)
+            try:
+                with COMMAND_SECONDS.labels(command).time():
+                    return await handler(*args, **kwargs)
+            except BaseException:
+                outcome[0] = "error"
+                raise
+            finally:
+                _command_outcome.reset(token)
+                COMMANDS.labels(command, outcome[0]).inc()
+        return wrapper
+    return decorator
+
+# Tell the user an expensive action is already running, or they've run it too often
+async def send_refusal(interaction, reply):
+    set_command_outcome("refused")
+    embed = create_basic_embed("Hold On", reply, "warning")
+    if interaction.response.is_done():
+        await interaction.followup.send(embed=embed, ephemeral=True)
+    else:
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
 # Setup command
+@instrumented("setup")
 async def setup_command(bot, interaction):
+    discord_id = str(interaction.user.id)
+    refusal = get_action_guard().begin("setup", discord_id)
+    if refusal:
+        await send_refusal(interaction, refusal)
+        return
+    try:
+        await run_setup(bot, interaction)
+    finally:
+        get_action_guard().end("setup", discord_id)
+
+# Ask for the user's Arbor credentials by DM, save them and fetch their homework
+async def run_setup(bot, interaction):
     await interaction.response.send_message("Please enter your Arbor email:")
 
     def check_username(m):
@@ -30,7 +108,7 @@ async def setup_command(bot, interaction):
         password = password_msg.content
 
         # Save credentials
-        save_user_credentials(str(interaction.user.id), username, password)
+        await save_user_credentials_async(str(interaction.user.id), username, password)
 
         # Send welcome message with rich embed
         welcome_embed = create_welcome_embed(username)
@@ -38,66 +116,84 @@ async def setup_command(bot, interaction):
 
         # Automatically fetch homework after setup
         try:
-            process_arbor_data(str(interaction.user.id))
-            
-            # Read and send the processed text
-            with open("arbor_processed_text.txt", "r", encoding="utf-8") as file:
-                text = file.read()
-            
-            # Create a rich embed for assignments
-            assignments_embed = create_assignments_embed(text)
-            await interaction.user.send(embed=assignments_embed)
+            await refresh_assignments(str(interaction.user.id))
+            await send_assignment_pages(interaction.user, str(interaction.user.id))
         except Exception as e:
             error_embed = create_error_embed(f"Could not automatically fetch your assignments: {e}\nYou can try manually using the /fetch command.")
             await interaction.user.send(embed=error_embed)
-        finally:
-            # Cleanup temporary files
-            if os.path.exists("arbor_text.txt"):
-                os.remove("arbor_text.txt")
-            if os.path.exists("arbor_processed_text.txt"):
-                os.remove("arbor_processed_text.txt")
     except Exception as e:
+        set_command_outcome("error")
         error_embed = create_error_embed(f"I encountered an error during account setup: {e}")
         await interaction.user.send(embed=error_embed)
 
 # Fetch command
+@instrumented("fetch")
 async def fetch_command(interaction):
+    discord_id = str(interaction.user.id)
+    refusal = get_action_guard().begin("fetch", discord_id)
+    if refusal:
+        await send_refusal(interaction, refusal)
+        return
+    # Set once the background refresh has taken over ending the action
+    handed_off = False
     try:
         await interaction.response.defer()
-        process_arbor_data(str(interaction.user.id))
         
-        # Read the processed text and send it to the user
-        try:
-            with open("arbor_processed_text.txt", "r", encoding="utf-8") as file:
-                text = file.read()
-
-            # Create a rich embed for assignments
-            assignments_embed = create_assignments_embed(text)
-            await interaction.user.send(embed=assignments_embed)
-
-            # Follow up on the original interaction
-            success_embed = create_basic_embed("Success!", "Your assignments have been fetched successfully.", "success")
+        # Serve the stored assignments instantly and refresh from Arbor in the background
+        assignments = get_user_assignments(discord_id)
+        if assignments:
+            await send_assignment_pages(interaction.user, discord_id)
+            
+            success_embed = create_basic_embed(
+                "Success!",
+                "Here are your saved assignments. I'm checking Arbor for changes and will message you if anything is new.",
+                "success"
+            )
             await interaction.followup.send(embed=success_embed, ephemeral=True)
-        except FileNotFoundError:
-            error_embed = create_error_embed("The processed text file was not found.")
-            await interaction.followup.send(embed=error_embed, ephemeral=True)
+            task = asyncio.create_task(refresh_and_notify(interaction.user, discord_id, assignments))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+            handed_off = True
             return
+        
+        # Nothing stored yet, so this first fetch has to wait for Arbor
+        await refresh_assignments(discord_id)
+        await send_assignment_pages(interaction.user, discord_id)
+
+        # Follow up on the original interaction
+        success_embed = create_basic_embed("Success!", "Your assignments have been fetched successfully.", "success")
+        await interaction.followup.send(embed=success_embed, ephemeral=True)
     except Exception as e:
+        set_command_outcome("error")
         error_embed = create_error_embed(f"I encountered an error while fetching your assignments: {e}")
         await interaction.followup.send(embed=error_embed, ephemeral=True)
         return
     finally:
-        # Only delete files if they exist
-        if os.path.exists("arbor_text.txt"):
-            os.remove("arbor_text.txt")
-        if os.path.exists("arbor_processed_text.txt"):
-            os.remove("arbor_processed_text.txt")
+        if not handed_off:
+            get_action_guard().end("fetch", discord_id)
+
+# DM a user the first page of their stored assignments, with buttons for the rest
+async def send_assignment_pages(user, discord_id, title=None):
+    assignments_embed, view = paged_message("assignments", discord_id, title)
+    view.message = await user.send(embed=assignments_embed, view=view)
+
+# Refresh a user's assignments from Arbor and DM them only if something changed
+async def refresh_and_notify(user, discord_id, previous_assignments):
+    try:
+        assignments = await refresh_assignments(discord_id)
+        if assignments != previous_assignments:
+            await send_assignment_pages(user, discord_id, "Your Assignments (updated)")
+    except Exception as e:
+        print(f"Error refreshing assignments for user {discord_id}: {e}")
+    finally:
+        get_action_guard().end("fetch", discord_id)
 
 # Set reminder command
+@instrumented("set_reminder")
 async def set_reminder_command(interaction, days_before):
     """Set how many days before the due date you want to be reminded"""
     try:
-        set_reminder_days(str(interaction.user.id), days_before)
+        await set_reminder_days_async(str(interaction.user.id), days_before)
         success_embed = create_basic_embed(
             "Reminder Set", 
             f"You will now be reminded {days_before} day(s) before assignments are due.", 
@@ -105,23 +201,48 @@ async def set_reminder_command(interaction, days_before):
         )
         await interaction.response.send_message(embed=success_embed, ephemeral=True)
     except Exception as e:
+        set_command_outcome("error")
         error_embed = create_error_embed(f"I encountered an error while retrieving your reminders: {e}")
         await interaction.response.send_message(embed=error_embed, ephemeral=True)
 
+# Search command
+@instrumented("search")
+async def search_command(interaction, query):
+    """Search your saved assignments by title or subject code"""
+    try:
+        discord_id = str(interaction.user.id)
+        parsed = parse_query(query)
+        terms = search_terms(query)
+        if terms:
+            results = search_query(discord_id, parsed, terms)
+        elif is_specific(parsed):
+            # Just a subject or a date, like "maths" or "this week"
+            results = answer_query(discord_id, parsed)
+        else:
+            # Only filler words; search for them as typed
+            results = search_assignments(discord_id, re.findall(r"\w+", query.lower()))
+        await interaction.response.send_message(embed=create_search_results_embed(query, results), ephemeral=True)
+    except Exception as e:
+        set_command_outcome("error")
+        error_embed = create_error_embed(f"I encountered an error while searching your assignments: {e}")
+        await interaction.response.send_message(embed=error_embed, ephemeral=True)
+
 # View reminders command
+@instrumented("view_reminders")
 async def view_reminders_command(interaction):
     """View your upcoming assignment reminders"""
     try:
-        reminders = get_user_reminders(str(interaction.user.id))
-        
-        # Create a rich embed for the reminders list
-        reminders_embed = create_reminders_list_embed(reminders)
-        await interaction.response.send_message(embed=reminders_embed, ephemeral=True)
+        # One page at a time, with buttons for the rest
+        reminders_embed, view = paged_message("reminders", str(interaction.user.id))
+        await interaction.response.send_message(embed=reminders_embed, view=view, ephemeral=True)
+        view.message = await interaction.original_response()
     except Exception as e:
+        set_command_outcome("error")
         error_embed = create_error_embed(f"I encountered an error while retrieving your reminders: {e}")
         await interaction.response.send_message(embed=error_embed, ephemeral=True)
 
 # Delete account command
+@instrumented("delete_account")
 async def delete_account_command(bot, interaction):
     """Delete your account and all associated data from ArborAlert"""
     try:
@@ -132,13 +253,7 @@ async def delete_account_command(bot, interaction):
             return
         
         # Confirm deletion with user
-        confirmation_embed = create_confirmation_embed(
-            "⚠️ Account Deletion", 
-            "This will permanently delete your account and all your reminders from ArborAlert.\n"
-            "Your data cannot be recovered after deletion.\n\n"
-            "Are you sure you want to proceed? Reply with 'yes' to confirm or 'no' to cancel."
-        )
-        await interaction.response.send_message(embed=confirmation_embed, ephemeral=True)
+        await interaction.response.send_message(embed=copy_embed(DELETE_ACCOUNT_CONFIRMATION), ephemeral=True)
         
         def check_confirmation(m):
             return m.author == interaction.user and isinstance(m.channel, discord.DMChannel) and \
@@ -153,7 +268,7 @@ async def delete_account_command(bot, interaction):
                 return
             
             # Delete user data
-            delete_user_account(str(interaction.user.id))
+            await delete_user_account_async(str(interaction.user.id))
             
             success_embed = create_basic_embed(
                 "Account Deleted", 
@@ -163,6 +278,7 @@ async def delete_account_command(bot, interaction):
             await interaction.user.send(embed=success_embed)
             
         except asyncio.TimeoutError:
+            set_command_outcome("timeout")
             timeout_embed = create_basic_embed(
                 "Timeout", 
                 "Account deletion timed out. No changes were made to your account.", 
@@ -171,10 +287,12 @@ async def delete_account_command(bot, interaction):
             await interaction.user.send(embed=timeout_embed)
             
     except Exception as e:
+        set_command_outcome("error")
         error_embed = create_error_embed(f"I encountered an error while deleting your account: {e}")
         await interaction.user.send(embed=error_embed)
 
 # Change credentials command
+@instrumented("change_credentials")
 async def change_credentials_command(bot, interaction):
     """Update your Arbor login credentials"""
     try:
@@ -204,7 +322,7 @@ async def change_credentials_command(bot, interaction):
             password = password_msg.content
             
             # Update credentials
-            save_user_credentials(str(interaction.user.id), username, password)
+            await save_user_credentials_async(str(interaction.user.id), username, password)
             
             success_embed = create_basic_embed(
                 "Credentials Updated", 
@@ -215,6 +333,7 @@ async def change_credentials_command(bot, interaction):
             await interaction.user.send(embed=success_embed)
             
         except asyncio.TimeoutError:
+            set_command_outcome("timeout")
             timeout_embed = create_basic_embed(
                 "Timeout", 
                 "The credential update process timed out. Please try again later.", 
@@ -223,12 +342,19 @@ async def change_credentials_command(bot, interaction):
             await interaction.user.send(embed=timeout_embed)
             
     except Exception as e:
+        set_command_outcome("error")
         error_embed = create_error_embed(f"I encountered an error while updating credentials: {e}")
         await interaction.user.send(embed=error_embed)
 
 # Debug command
+@instrumented("debug")
 async def debug_command(bot, interaction, full_test=False, cipher_suite=None, test_error=None):
     """Run diagnostic tests on the bot to identify issues"""
+    discord_id = str(interaction.user.id)
+    refusal = get_action_guard().begin("debug", discord_id)
+    if refusal:
+        await send_refusal(interaction, refusal)
+        return
     try:
         # Check if a test error message was provided
         if test_error:
@@ -259,10 +385,13 @@ async def debug_command(bot, interaction, full_test=False, cipher_suite=None, te
         # Send the consolidated results as a followup message
         await interaction.followup.send(test_results, ephemeral=True)
     except Exception as e:
+        set_command_outcome("error")
         error_embed = create_error_embed(f"I encountered an error while running diagnostics: {e}")
         
         # Check if the initial response has been sent
         if interaction.response.is_done():
             await interaction.followup.send(embed=error_embed, ephemeral=True)
         else:
-            await interaction.response.send_message(embed=error_embed, ephemeral=True)
\ No newline at end of file
+            await interaction.response.send_message(embed=error_embed, ephemeral=True)
+    finally:
+        get_action_guard().end("debug", discord_id)
\ No newline at end of file
@@ -0,0 +1,115 @@
+# Injectable clock, so time-driven code can be run against simulated time
+import asyncio
+import datetime
+import heapq
+import itertools
+import time
+
+class SystemClock:
+    """Real wall-clock time and real sleeps"""
+
+    def now(self):
+        return datetime.datetime.now()
+
+    def today(self):
+        return self.now().strftime('%Y-%m-%d')
+
+    def monotonic(self):
+        return time.monotonic()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+    async def wait(self, event, timeout):
+        """Wait for an asyncio.Event for up to `timeout` seconds; return whether it was set"""
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+class SimulatedClock(SystemClock):
+    """Virtual time that only moves when advanced.
+
+    Sleepers are parked on a heap keyed by their virtual wake-up time. Advancing the clock wakes
+    them in order, moving the time to each one's deadline and letting the event loop settle before
+    the next, so weeks of schedule can be replayed in seconds.
+    """
+
+    # Loop iterations allowed for woken tasks to run before time moves on
+    SETTLE_STEPS = 200
+
+    def __init__(self, start):
+        self.current = start
+        self._origin = start
+        self._sleepers = []
+        self._sequence = itertools.count()
+        # Optional callable, true while work on other threads (database writes) is still in flight;
+        # that finishes in real time, so virtual time waits for it
+        self.busy = None
+
+    def now(self):
+        return self.current
+
+    def monotonic(self):
+        return (self.current - self._origin).total_seconds()
+
+    async def sleep(self, seconds):
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        # timedelta rounds to microseconds; never let a tiny sleep leave time standing still
+        deadline = self.current + max(datetime.timedelta(seconds=seconds), datetime.timedelta(microseconds=1))
+        heapq.heappush(self._sleepers, (deadline, next(self._sequence), future))
+        await future
+
+    async def wait(self, event, timeout):
+        if event.is_set():
+            return True
+        waiter = asyncio.ensure_future(event.wait())
+        sleeper = asyncio.ensure_future(self.sleep(timeout))
+        try:
+            await asyncio.wait([waiter, sleeper], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+            sleeper.cancel()
+        return event.is_set()
+
+    async def settle(self):
+        for _ in range(self.SETTLE_STEPS):
+            await asyncio.sleep(0)
+        while self.busy is not None and self.busy():
+            await asyncio.sleep(0.0005)
+            for _ in range(self.SETTLE_STEPS):
+                await asyncio.sleep(0)
+
+    async def advance(self, seconds):
+        await self.advance_to(self.current + datetime.timedelta(seconds=seconds))
+
+    async def advance_to(self, target):
+        """Move time forward to `target`, waking every sleeper due on the way"""
+        await self.settle()
+        while self._sleepers and self._sleepers[0][0] <= target:
+            deadline, _, future = heapq.heappop(self._sleepers)
+            if future.done():
+                continue
+            self.current = max(self.current, deadline)
+            future.set_result(None)
+            await self.settle()
+        self.current = max(self.current, target)
+        await self.settle()
+
+    def pending_sleepers(self):
+        return sum(1 for _, _, future in self._sleepers if not future.done())
+
+_clock = SystemClock()
+
+def get_clock():
+    """Return the process-wide clock"""
+    return _clock
+
+def set_clock(clock):
+    """Replace the process-wide clock (used by simulations)"""
+    global _clock
+    _clock = clock
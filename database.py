@@ -1,203 +1,255 @@
-import sqlite3
 import os
+from collections import namedtuple
 from cryptography.fernet import Fernet
+from cache_utils import LRUCache, MISSING
+from storage import get_storage, set_storage
+from metrics import get_metrics
 
 # Get the encryption key from environment variables
 cipher_suite = Fernet(os.getenv("KEY"))
 
+# Cached view of a users row; password is the encrypted blob, never the plaintext
+UserProfile = namedtuple("UserProfile", ["registered", "username", "password", "reminder_days"])
+
+# In-process profile cache so hot paths (every mention) don't hit the disk
+profile_cache = LRUCache(int(os.getenv("USER_CACHE_SIZE", "1024")))
+
+# Read when metrics are collected, so the hot paths don't pay for them
+get_metrics().counter("arboralert_profile_cache_hits_total", "Profile lookups served from the cache").set_function(
+    lambda: profile_cache.stats()["hits"]
+)
+get_metrics().counter("arboralert_profile_cache_misses_total", "Profile lookups that went to the database").set_function(
+    lambda: profile_cache.stats()["misses"]
+)
+get_metrics().gauge("arboralert_db_write_queue", "Writes waiting for the writer thread").set_function(
+    lambda: (get_storage().write_stats() or {}).get("queued", 0)
+)
+
+# Callbacks told about every reminder date that is added or changed
+reminder_listeners = []
+
+# Callbacks told the discord_id of every user whose assignments or reminders change
+user_data_listeners = []
+
+# Swap the storage backend used by every database function
+def use_storage(storage):
+    set_storage(storage)
+    profile_cache.clear()
+
 # Database initialization
 def init_db():
-    conn = None
     try:
-        conn = sqlite3.connect("arbor_users.db")
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                discord_id TEXT NOT NULL,
-                username TEXT NOT NULL,
-                password TEXT NOT NULL
-            )
-            """
-        )
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS reminders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                discord_id TEXT NOT NULL,
-                assignment_name TEXT NOT NULL,
-                due_date TEXT NOT NULL,
-                reminder_date TEXT NOT NULL,
-                sent INTEGER DEFAULT 0
-            )
-            """
-        )
-        conn.commit()
+        get_storage().init_schema()
     except Exception as e:
         print(f"Error initializing database: {e}")
-        if conn:
-            conn.rollback()
-    finally:
-        if conn:
-            conn.close()
 
 # Add reminder_days column if it doesn't exist
 def add_reminder_days_column():
-    conn = sqlite3.connect("arbor_users.db")
-    cursor = conn.cursor()
     try:
-        # Check if the column exists first
-        cursor.execute("PRAGMA table_info(users)")
-        columns = [column[1] for column in cursor.fetchall()]
-        if "reminder_days" not in columns:
-            cursor.execute("ALTER TABLE users ADD COLUMN reminder_days INTEGER DEFAULT 1")
-            conn.commit()
-            print("Added reminder_days column to users table")
+        get_storage().migrate()
     except Exception as e:
         print(f"Error adding reminder_days column: {e}")
-    finally:
-        conn.close()
+
+# Read-through lookup of a user's profile (registered flag, reminder days, credentials)
+def get_user_profile(discord_id):
+    discord_id = str(discord_id)
+    profile = profile_cache.get(discord_id)
+    if profile is not MISSING:
+        return profile
+
+    result = get_storage().get_user(discord_id)
+
+    if result:
+        profile = UserProfile(True, result[0], result[1], result[2])
+    else:
+        # Unregistered users are cached too, so chatty strangers stay off the disk
+        profile = UserProfile(False, None, None, None)
+    profile_cache.put(discord_id, profile)
+    return profile
+
+def invalidate_user_profile(discord_id):
+    profile_cache.invalidate(str(discord_id))
+
+def get_cache_stats():
+    return profile_cache.stats()
 
 # User credential functions
 def get_credentials(discord_id):
-    conn = sqlite3.connect("arbor_users.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT username, password FROM users WHERE discord_id = ?", (discord_id,))
-    result = cursor.fetchone()
-    conn.close()
-    if result:
-        username, encrypted_password = result
-        password = cipher_suite.decrypt(encrypted_password).decode()
-        return username, password
+    profile = get_user_profile(discord_id)
+    if profile.registered:
+        password = cipher_suite.decrypt(profile.password).decode()
+        return profile.username, password
     return None, None
 
 def save_user_credentials(discord_id, username, password):
     encrypted_password = cipher_suite.encrypt(password.encode())
-    conn = sqlite3.connect("arbor_users.db")
-    cursor = conn.cursor()
-    
-    # Check if user already exists
-    cursor.execute("SELECT id FROM users WHERE discord_id = ?", (discord_id,))
-    user = cursor.fetchone()
-    
-    if user:
-        # Update existing user
-        cursor.execute(
-            "UPDATE users SET username = ?, password = ? WHERE discord_id = ?",
-            (username, encrypted_password, discord_id)
-        )
-    else:
-        # Insert new user
-        cursor.execute(
-            "INSERT INTO users (discord_id, username, password) VALUES (?, ?, ?)",
-            (discord_id, username, encrypted_password)
-        )
-    
-    conn.commit()
-    conn.close()
+    get_storage().save_user(discord_id, username, encrypted_password)
+    invalidate_user_profile(discord_id)
+    return True
+
+# The *_async versions are for coroutines: they wait for the write without blocking the event loop
+async def save_user_credentials_async(discord_id, username, password):
+    encrypted_password = cipher_suite.encrypt(password.encode())
+    await get_storage().write_async("save_user", discord_id, username, encrypted_password)
+    invalidate_user_profile(discord_id)
     return True
 
 def delete_user_account(discord_id):
-    conn = sqlite3.connect("arbor_users.db")
-    cursor = conn.cursor()
-    
-    # Delete reminders first (foreign key constraint)
-    cursor.execute("DELETE FROM reminders WHERE discord_id = ?", (discord_id,))
-    
-    # Delete user
-    cursor.execute("DELETE FROM users WHERE discord_id = ?", (discord_id,))
-    
-    conn.commit()
-    conn.close()
+    # Reminders are deleted along with the user
+    get_storage().delete_user(discord_id)
+    invalidate_user_profile(discord_id)
+    notify_user_data_changed(discord_id)
+    return True
+
+async def delete_user_account_async(discord_id):
+    await get_storage().write_async("delete_user", discord_id)
+    invalidate_user_profile(discord_id)
+    notify_user_data_changed(discord_id)
     return True
 
 def user_exists(discord_id):
-    conn = sqlite3.connect("arbor_users.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM users WHERE discord_id = ?", (discord_id,))
-    user = cursor.fetchone()
-    conn.close()
-    return user is not None
+    return get_user_profile(discord_id).registered
 
 # Reminder functions
 def set_reminder_days(discord_id, days_before):
-    conn = sqlite3.connect("arbor_users.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE users SET reminder_days = ? WHERE discord_id = ?",
-        (days_before, discord_id)
-    )
-    conn.commit()
-    conn.close()
+    get_storage().set_reminder_days(discord_id, days_before)
+    invalidate_user_profile(discord_id)
+    return True
+
+async def set_reminder_days_async(discord_id, days_before):
+    await get_storage().write_async("set_reminder_days", discord_id, days_before)
+    invalidate_user_profile(discord_id)
     return True
 
 def get_reminder_days(discord_id):
-    conn = sqlite3.connect("arbor_users.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT reminder_days FROM users WHERE discord_id = ?", (discord_id,))
-    result = cursor.fetchone()
-    conn.close()
-    
+    profile = get_user_profile(discord_id)
+
     reminder_days = 1  # Default
-    if result and result[0]:
-        reminder_days = result[0]
-    
+    if profile.reminder_days:
+        reminder_days = profile.reminder_days
+
     return reminder_days
 
 def get_user_reminders(discord_id):
-    conn = sqlite3.connect("arbor_users.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT assignment_name, due_date, reminder_date FROM reminders WHERE discord_id = ? AND sent = 0 ORDER BY due_date",
-        (discord_id,)
-    )
-    reminders = cursor.fetchall()
-    conn.close()
-    return reminders
+    return get_storage().get_user_reminders(discord_id)
+
+def get_user_reminders_page(discord_id, after=None, limit=10):
+    return get_storage().get_user_reminders_page(discord_id, after, limit)
 
 def clear_user_reminders(discord_id):
-    conn = sqlite3.connect("arbor_users.db")
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM reminders WHERE discord_id = ? AND sent = 0", (discord_id,))
-    conn.commit()
-    conn.close()
+    get_storage().clear_user_reminders(discord_id)
+    notify_user_data_changed(discord_id)
 
 def add_reminder(discord_id, assignment_name, due_date, reminder_date):
-    conn = sqlite3.connect("arbor_users.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO reminders (discord_id, assignment_name, due_date, reminder_date, sent) VALUES (?, ?, ?, ?, ?)",
-        (discord_id, assignment_name, due_date, reminder_date, 0)
-    )
-    conn.commit()
-    conn.close()
+    get_storage().add_reminder(discord_id, assignment_name, due_date, reminder_date)
+    for listener in reminder_listeners:
+        listener(reminder_date)
+    notify_user_data_changed(discord_id)
+
+def add_reminder_listener(listener):
+    if listener not in reminder_listeners:
+        reminder_listeners.append(listener)
+
+def add_user_data_listener(listener):
+    if listener not in user_data_listeners:
+        user_data_listeners.append(listener)
+
+def notify_user_data_changed(discord_id):
+    for listener in user_data_listeners:
+        listener(discord_id)
 
 def get_due_reminders(date):
-    conn = sqlite3.connect("arbor_users.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT discord_id, assignment_name, due_date FROM reminders WHERE reminder_date = ? AND sent = 0",
-        (date,)
-    )
-    reminders = cursor.fetchall()
-    conn.close()
-    return reminders
+    return get_storage().get_due_reminders(date)
 
 def mark_reminder_sent(discord_id, assignment_name, due_date):
-    conn = sqlite3.connect("arbor_users.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE reminders SET sent = 1 WHERE discord_id = ? AND assignment_name = ? AND due_date = ?",
-        (discord_id, assignment_name, due_date)
-    )
-    conn.commit()
-    conn.close()
+    get_storage().mark_reminder_sent(discord_id, assignment_name, due_date)
+    notify_user_data_changed(discord_id)
+
+def mark_reminders_sent(reminder_ids):
+    get_storage().mark_reminders_sent(reminder_ids)
+
+def get_pending_reminders(start_date, end_date):
+    return get_storage().get_pending_reminders(start_date, end_date)
+
+def get_pending_reminder_dates(start_date):
+    return get_storage().get_pending_reminder_dates(start_date)
 
 def get_all_users():
-    conn = sqlite3.connect("arbor_users.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT discord_id FROM users")
-    users = cursor.fetchall()
-    conn.close()
-    return users
\ No newline at end of file
+    return [(discord_id,) for discord_id in get_storage().list_user_ids()]
+
+# Reminder outbox functions
+def enqueue_outbox(entries, created_at):
+    return get_storage().enqueue_outbox(entries, created_at)
+
+async def enqueue_outbox_async(entries, created_at):
+    return await get_storage().write_async("enqueue_outbox", entries, created_at)
+
+def get_ready_outbox(now, limit=100):
+    return get_storage().get_ready_outbox(now, limit)
+
+def get_next_outbox_attempt():
+    return get_storage().get_next_outbox_attempt()
+
+def claim_outbox(outbox_ids, now, claimed_until, fence=None):
+    return get_storage().claim_outbox(outbox_ids, now, claimed_until, fence)
+
+async def claim_outbox_async(outbox_ids, now, claimed_until, fence=None):
+    return await get_storage().write_async("claim_outbox", outbox_ids, now, claimed_until, fence)
+
+def mark_outbox_delivered(outbox_ids, delivered_at):
+    get_storage().mark_outbox_delivered(outbox_ids, delivered_at)
+
+async def mark_outbox_delivered_async(outbox_ids, delivered_at):
+    await get_storage().write_async("mark_outbox_delivered", outbox_ids, delivered_at)
+
+def mark_outbox_failed(outbox_ids, error, next_attempt_at):
+    get_storage().mark_outbox_failed(outbox_ids, error, next_attempt_at)
+
+async def mark_outbox_failed_async(outbox_ids, error, next_attempt_at):
+    await get_storage().write_async("mark_outbox_failed", outbox_ids, error, next_attempt_at)
+
+# Assignment functions
+def sync_assignments(discord_id, assignments, seen_at):
+    get_storage().sync_assignments(discord_id, assignments, seen_at)
+    notify_user_data_changed(discord_id)
+
+def get_user_assignments(discord_id, include_completed=False):
+    return get_storage().get_user_assignments(discord_id, include_completed)
+
+def get_user_assignments_page(discord_id, after=None, limit=10, include_completed=False):
+    return get_storage().get_user_assignments_page(discord_id, after, limit, include_completed)
+
+def query_assignments(discord_id, start_date=None, end_date=None, include_completed=False):
+    return get_storage().query_assignments(discord_id, start_date, end_date, include_completed)
+
+def search_assignments(discord_id, terms, limit=10, include_completed=False):
+    return get_storage().search_assignments(discord_id, terms, limit, include_completed)
+
+def get_assignments_synced_at(discord_id):
+    return get_storage().get_assignments_synced_at(discord_id)
+
+# Lease functions
+def acquire_lease(name, holder, now, expires_at):
+    return get_storage().acquire_lease(name, holder, now, expires_at)
+
+async def acquire_lease_async(name, holder, now, expires_at):
+    return await get_storage().write_async("acquire_lease", name, holder, now, expires_at)
+
+def release_lease(name, holder):
+    get_storage().release_lease(name, holder)
+
+async def release_lease_async(name, holder):
+    await get_storage().write_async("release_lease", name, holder)
+
+def get_lease(name):
+    return get_storage().get_lease(name)
+
+# Settings functions
+def get_setting(key, default=None):
+    return get_storage().get_setting(key, default)
+
+def set_setting(key, value):
+    get_storage().set_setting(key, value)
+
+async def set_setting_async(key, value):
+    await get_storage().write_async("set_setting", key, value)
@@ -0,0 +1,138 @@
+# Single-writer thread for the SQLite database
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+class DBWriter:
+    """Owns the only write connection and group-commits queued writes in batches.
+
+    Each write is a function taking a cursor. It runs inside its own savepoint, so one failing
+    write is rolled back without affecting the rest of its batch. Futures resolve only after the
+    batch has been committed. A lone write is committed straight away; only when others are
+    already queued behind it does the batch wait up to max_latency for more to join.
+    """
+
+    def __init__(self, path, max_batch=64, max_latency=0.005):
+        self.path = path
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.batches = 0
+        self.writes = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="arbor-db-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, fn, transaction=True):
+        """Queue a write and return a Future for its result.
+
+        Non-transactional jobs (VACUUM, PRAGMAs) run on their own between batches.
+        """
+        self.start()
+        future = Future()
+        self._queue.put((fn, future, transaction))
+        return future
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "writes": self.writes,
+            "avg_batch": (self.writes / self.batches) if self.batches else 0.0,
+            "queued": self._queue.qsize()
+        }
+
+    def _run(self):
+        conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+        conn.execute("PRAGMA busy_timeout = 30000")
+        try:
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    return
+                if not job[2]:
+                    self._run_alone(conn, job)
+                    continue
+
+                # Take whatever is already queued; under load, wait up to the latency bound for more
+                batch = [job]
+                deadline = time.monotonic() + self.max_latency
+                stop = False
+                while len(batch) < self.max_batch:
+                    try:
+                        job = self._queue.get_nowait()
+                    except queue.Empty:
+                        remaining = deadline - time.monotonic()
+                        # Nothing else waiting means nobody to share the commit with
+                        if len(batch) == 1 or remaining <= 0:
+                            break
+                        try:
+                            job = self._queue.get(timeout=remaining)
+                        except queue.Empty:
+                            break
+                    if job is None:
+                        stop = True
+                        break
+                    if not job[2]:
+                        self._commit_batch(conn, batch)
+                        batch = []
+                        self._run_alone(conn, job)
+                        break
+                    batch.append(job)
+
+                if batch:
+                    self._commit_batch(conn, batch)
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _run_alone(self, conn, job):
+        fn, future, _ = job
+        try:
+            future.set_result(fn(conn))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _commit_batch(self, conn, batch):
+        cursor = conn.cursor()
+        outcomes = []
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for fn, future, _ in batch:
+                cursor.execute("SAVEPOINT write")
+                try:
+                    outcomes.append((future, fn(cursor), None))
+                    cursor.execute("RELEASE write")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO write")
+                    cursor.execute("RELEASE write")
+                    outcomes.append((future, None, e))
+            cursor.execute("COMMIT")
+        except Exception as e:
+            # The whole batch failed to commit
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.writes += len(batch)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
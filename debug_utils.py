@@ -1,10 +1,12 @@
 # Debug utilities for ArborAlert
-import sqlite3
 import os
 import datetime
 import traceback
 import asyncio
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from cryptography.fernet import Fernet
 from selenium import webdriver
 from selenium.webdriver.firefox.options import Options
@@ -12,11 +14,29 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from time import sleep
+from database import get_cache_stats
+from storage import get_storage
+from leader import get_leader_elector
+from action_guard import get_action_guard
+from gateway_filter import get_gateway_filter
+from loop_monitor import get_loop_monitor
+
+# The progress message is edited at most this often, however quickly results come in
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+# How long gathering system information may take (it starts a browser)
+SYSTEM_INFO_TIMEOUT_SECONDS = 30
+
+# Tests are blocking (sqlite, Selenium), so they run here rather than on the event loop. A test
+# that times out keeps its thread until it finishes, so this is kept apart from the default
+# executor that Arbor scrapes use.
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="debug")
 
 class DebugTests:
-    def __init__(self, bot, cipher_suite):
+    def __init__(self, bot, cipher_suite, storage=None):
         self.bot = bot
         self.cipher_suite = cipher_suite
+        self.storage = storage or get_storage()
         self.results = []
         self.success_count = 0
         self.fail_count = 0
@@ -24,18 +44,70 @@ class DebugTests:
         self.current_test = 0
         self.interaction = None
         self.progress_message = None
+        # Seconds each test took, by name
+        self.timings = {}
+        # add_result is called from executor threads
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._progress_changed = False
+        # Position in the test plan -> (results added, whether the test was given up on)
+        self._tests = {}
     
     def add_result(self, test_name, success, message):
-        status = "✅ PASS" if success else "❌ FAIL"
-        self.results.append(f"{status} - {test_name}: {message}")
-        if success:
-            self.success_count += 1
-        else:
-            self.fail_count += 1
+        position = getattr(self._local, "position", None)
+        with self._lock:
+            if position is not None:
+                added, abandoned = self._tests.get(position, (0, False))
+                # A test that timed out has already been failed; ignore anything it reports later
+                if abandoned:
+                    return
+                self._tests[position] = (added + 1, False)
+            status = "✅ PASS" if success else "❌ FAIL"
+            self.results.append((position if position is not None else -1, f"{status} - {test_name}: {message}"))
+            if success:
+                self.success_count += 1
+            else:
+                self.fail_count += 1
+            
+            # Update progress
+            self.current_test += 1
+            self._progress_changed = True
+    
+    # Run one test on the executor, failing it if it takes longer than timeout seconds
+    async def run_test(self, position, name, test, args, results, timeout):
+        def run():
+            self._local.position = position
+            try:
+                test(*args)
+            finally:
+                self._local.position = None
         
-        # Update progress
-        self.current_test += 1
-        asyncio.create_task(self.update_progress())
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(_executor, run), timeout)
+        except asyncio.TimeoutError:
+            self.abandon_test(position, name, f"Timed out after {timeout}s", results)
+        except Exception as e:
+            self.abandon_test(position, name, f"Error: {str(e)}", results)
+        self.timings[name] = time.perf_counter() - started
+    
+    # Fail a test that didn't finish, counting the results it never gave as done
+    def abandon_test(self, position, name, message, results):
+        with self._lock:
+            added, _ = self._tests.get(position, (0, False))
+            self._tests[position] = (added, True)
+            self.results.append((position, f"❌ FAIL - {name}: {message}"))
+            self.fail_count += 1
+            self.current_test += max(results - added, 1)
+            self._progress_changed = True
+    
+    # Edit the progress message on a fixed interval while anything has changed
+    async def report_progress(self):
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL_SECONDS)
+            if self._progress_changed:
+                self._progress_changed = False
+                await self.update_progress()
     
     async def update_progress(self):
         if self.interaction and self.progress_message:
@@ -128,7 +200,7 @@ class DebugTests:
         
         return summary
     
-    async def test_ai_system(self, discord_id=None):
+    def test_ai_system(self, discord_id=None):
         try:
             # Check if ai_handler.py exists and is readable
             if not os.path.exists("ai_handler.py"):
@@ -193,13 +265,30 @@ class DebugTests:
         self.success_count = 0
         self.fail_count = 0
         self.current_test = 0
+        self.timings = {}
+        self._tests = {}
         
-        # Update total tests to include AI tests
-        self.total_tests = 4  # Base tests (database_connection, env_variables, file_permissions, ai_system)
+        # (name, test, args, results it adds, timeout in seconds); they don't depend on each other,
+        # so all of them run at once
+        plan = [
+            ("Database Connection", self.test_database_connection, (), 1, 10),
+            ("Environment Variables", self.test_env_variables, (), 1, 5),
+            ("File Permissions", self.test_file_permissions, (), 1, 5),
+            ("AI System", self.test_ai_system, (discord_id,), 1, 10)
+        ]
         if discord_id:
-            self.total_tests += 3  # User tests (user_exists, encryption_decryption, reminder_system)
+            plan += [
+                ("User Exists", self.test_user_exists, (discord_id,), 1, 10),
+                ("Encryption/Decryption", self.test_encryption_decryption, (discord_id,), 1, 10),
+                ("Reminder System", self.test_reminder_system, (discord_id,), 1, 10)
+            ]
             if full_test:
-                self.total_tests += 6  # Full tests (arbor_connection, selenium_setup(2), browser_functionality, database_integrity(3))
+                plan += [
+                    ("Arbor Connection", self.test_arbor_connection, (discord_id,), 1, 45),
+                    ("Selenium Setup", self.test_selenium_setup, (), 2, 45),
+                    ("Database Integrity", self.test_database_integrity, (), 4, 15)
+                ]
+        self.total_tests = sum(results for _, _, _, results, _ in plan)
         
         # Create initial progress message
         if self.interaction:
@@ -216,42 +305,30 @@ class DebugTests:
             except:
                 self.progress_message = None
         
-        # Run all tests with a small delay between each test to allow progress updates
-        self.test_database_connection()
-        await asyncio.sleep(1)  # Add delay for UI update
-        
-        self.test_env_variables()
-        await asyncio.sleep(1)  # Add delay for UI update
-        
-        self.test_file_permissions()
-        await asyncio.sleep(1)  # Add delay for UI update
-        
-        # Add AI system test
-        await self.test_ai_system(discord_id)
-        await asyncio.sleep(1)  # Add delay for UI update
-        
-        if discord_id:
-            self.test_user_exists(discord_id)
-            await asyncio.sleep(1)  # Add delay for UI update
-            
-            self.test_encryption_decryption(discord_id)
-            await asyncio.sleep(1)  # Add delay for UI update
-            
-            await self.test_reminder_system(discord_id)
-            await asyncio.sleep(1)  # Add delay for UI update
-            
-            if full_test:
-                self.test_arbor_connection(discord_id)
-                await asyncio.sleep(1)  # Add delay for UI update
-                
-                self.test_selenium_setup()
-                await asyncio.sleep(1)  # Add delay for UI update
-                
-                self.test_database_integrity()
-                await asyncio.sleep(1)  # Add delay for UI update
+        started = time.perf_counter()
+        progress = asyncio.create_task(self.report_progress())
+        loop = asyncio.get_running_loop()
+        # System information is gathered alongside the tests
+        system_info_task = asyncio.wait_for(
+            loop.run_in_executor(_executor, get_system_info, self.storage), SYSTEM_INFO_TIMEOUT_SECONDS
+        )
+        try:
+            system_info, *_ = await asyncio.gather(
+                system_info_task,
+                *(self.run_test(position, *test) for position, test in enumerate(plan)),
+                return_exceptions=True
+            )
+        finally:
+            progress.cancel()
+        runtime = time.perf_counter() - started
+        if isinstance(system_info, asyncio.TimeoutError):
+            system_info = f"Timed out after {SYSTEM_INFO_TIMEOUT_SECONDS}s"
+        elif isinstance(system_info, Exception):
+            system_info = f"Error: {system_info}"
         
-        # Get system information
-        system_info = get_system_info()
+        # Results in the order the tests are listed, whatever order they finished in
+        self.results = [text for _, text in sorted(self.results, key=lambda result: result[0])]
+        await self.update_progress()
         
         # Combine system info with test results
         full_report = f"🔍 **ARBORALERT DIAGNOSTIC REPORT** 🔍\n\n"
@@ -268,7 +345,12 @@ class DebugTests:
         full_report += f"│ 🟢 **Tests Passed:** {self.success_count} | 🔴 **Tests Failed:** {self.fail_count} │\n"
         full_report += f"│ 📊 **Success Rate:** {success_percentage:.1f}%              │\n"
         full_report += f"│ {progress_bar} │\n"
-        full_report += f"└─────────────────────────────────────┘\n\n"
+        full_report += f"└─────────────────────────────────────┘\n"
+        slowest = max(self.timings, key=self.timings.get, default=None)
+        full_report += f"⏱️ **Runtime:** {runtime:.1f}s"
+        if slowest:
+            full_report += f" (slowest: {slowest}, {self.timings[slowest]:.1f}s)"
+        full_report += "\n\n"
         
         # Add system information section
         full_report += f"📊 **SYSTEM INFORMATION**\n"
@@ -324,21 +406,12 @@ class DebugTests:
     
     def test_database_connection(self):
         try:
-            conn = sqlite3.connect("arbor_users.db")
-            cursor = conn.cursor()
-            
-            # Check users table
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
-            users_table_exists = cursor.fetchone() is not None
-            
-            # Check reminders table
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='reminders'")
-            reminders_table_exists = cursor.fetchone() is not None
-            
-            conn.close()
+            # Check users and reminders tables
+            users_table_exists = bool(self.storage.get_table_columns("users"))
+            reminders_table_exists = bool(self.storage.get_table_columns("reminders"))
             
             if users_table_exists and reminders_table_exists:
-                self.add_result("Database Connection", True, "Successfully connected to database and verified tables")
+                self.add_result("Database Connection", True, f"Successfully connected to {self.storage.name} storage and verified tables")
             else:
                 missing_tables = []
                 if not users_table_exists:
@@ -364,11 +437,7 @@ class DebugTests:
     
     def test_user_exists(self, discord_id):
         try:
-            conn = sqlite3.connect("arbor_users.db")
-            cursor = conn.cursor()
-            cursor.execute("SELECT id FROM users WHERE discord_id = ?", (str(discord_id),))
-            user = cursor.fetchone()
-            conn.close()
+            user = self.storage.get_user(str(discord_id))
             
             if user:
                 self.add_result("User Exists", True, f"User with Discord ID {discord_id} exists in database")
@@ -379,17 +448,13 @@ class DebugTests:
     
     def test_encryption_decryption(self, discord_id):
         try:
-            conn = sqlite3.connect("arbor_users.db")
-            cursor = conn.cursor()
-            cursor.execute("SELECT username, password FROM users WHERE discord_id = ?", (str(discord_id),))
-            result = cursor.fetchone()
-            conn.close()
+            result = self.storage.get_user(str(discord_id))
             
             if not result:
                 self.add_result("Encryption/Decryption", False, "User not found, cannot test encryption")
                 return
             
-            username, encrypted_password = result
+            username, encrypted_password = result[0], result[1]
             
             try:
                 # Try to decrypt the password
@@ -408,16 +473,10 @@ class DebugTests:
         except Exception as e:
             self.add_result("Encryption/Decryption", False, f"Database error: {str(e)}")
     
-    async def test_reminder_system(self, discord_id):
+    def test_reminder_system(self, discord_id):
         try:
             # Check if user has any reminders
-            conn = sqlite3.connect("arbor_users.db")
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT COUNT(*) FROM reminders WHERE discord_id = ?",
-                (str(discord_id),)
-            )
-            reminder_count = cursor.fetchone()[0]
+            reminder_count = self.storage.count_reminders(discord_id=str(discord_id))
             
             if reminder_count > 0:
                 self.add_result("Reminder System", True, f"User has {reminder_count} reminders in the database")
@@ -426,49 +485,34 @@ class DebugTests:
                 today = datetime.datetime.now().strftime('%Y-%m-%d')
                 test_assignment = "[TEST] Debug Assignment"
                 
-                cursor.execute(
-                    "INSERT INTO reminders (discord_id, assignment_name, due_date, reminder_date, sent) VALUES (?, ?, ?, ?, ?)",
-                    (str(discord_id), test_assignment, today, today, 0)
-                )
-                conn.commit()
+                self.storage.add_reminder(str(discord_id), test_assignment, today, today)
                 
                 # Verify the reminder was added
-                cursor.execute(
-                    "SELECT id FROM reminders WHERE discord_id = ? AND assignment_name = ?",
-                    (str(discord_id), test_assignment)
+                test_reminder = any(
+                    assignment == test_assignment
+                    for assignment, _, _ in self.storage.get_user_reminders(str(discord_id))
                 )
-                test_reminder = cursor.fetchone()
                 
                 if test_reminder:
                     self.add_result("Reminder System", True, "Successfully created a test reminder")
                     
                     # Clean up the test reminder
-                    cursor.execute(
-                        "DELETE FROM reminders WHERE discord_id = ? AND assignment_name = ?",
-                        (str(discord_id), test_assignment)
-                    )
-                    conn.commit()
+                    self.storage.delete_reminder(str(discord_id), test_assignment)
                 else:
                     self.add_result("Reminder System", False, "Failed to create test reminder")
-            
-            conn.close()
         except Exception as e:
             self.add_result("Reminder System", False, f"Error: {str(e)}")
     
     def test_arbor_connection(self, discord_id):
         try:
             # Get user credentials
-            conn = sqlite3.connect("arbor_users.db")
-            cursor = conn.cursor()
-            cursor.execute("SELECT username, password FROM users WHERE discord_id = ?", (discord_id,))
-            result = cursor.fetchone()
-            conn.close()
+            result = self.storage.get_user(str(discord_id))
             
             if not result:
                 self.add_result("Arbor Connection", False, "User not found, cannot test Arbor connection")
                 return
             
-            username, encrypted_password = result
+            username, encrypted_password = result[0], result[1]
             password = self.cipher_suite.decrypt(encrypted_password).decode()
             
             # Use headless browser for testing
@@ -545,12 +589,8 @@ class DebugTests:
     
     def test_database_integrity(self):
         try:
-            conn = sqlite3.connect("arbor_users.db")
-            cursor = conn.cursor()
-            
             # Check users table structure
-            cursor.execute("PRAGMA table_info(users)")
-            columns = {column[1] for column in cursor.fetchall()}
+            columns = self.storage.get_table_columns("users")
             required_columns = {"id", "discord_id", "username", "password", "reminder_days"}
             
             if required_columns.issubset(columns):
@@ -560,8 +600,7 @@ class DebugTests:
                 self.add_result("Users Table Structure", False, f"Missing columns: {', '.join(missing)}")
             
             # Check reminders table structure
-            cursor.execute("PRAGMA table_info(reminders)")
-            columns = {column[1] for column in cursor.fetchall()}
+            columns = self.storage.get_table_columns("reminders")
             required_columns = {"id", "discord_id", "assignment_name", "due_date", "reminder_date", "sent"}
             
             if required_columns.issubset(columns):
@@ -571,28 +610,37 @@ class DebugTests:
                 self.add_result("Reminders Table Structure", False, f"Missing columns: {', '.join(missing)}")
             
             # Check for orphaned reminders (reminders without a corresponding user)
-            cursor.execute("""
-                SELECT COUNT(*) FROM reminders r 
-                WHERE NOT EXISTS (SELECT 1 FROM users u WHERE u.discord_id = r.discord_id)
-            """)
-            orphaned_count = cursor.fetchone()[0]
+            # Check the shared assignment catalog and per-user links
+            catalog_columns = self.storage.get_table_columns("assignment_catalog")
+            link_columns = self.storage.get_table_columns("user_assignments")
+            required_catalog = {"id", "subject_code", "title", "due_date"}
+            required_links = {"id", "discord_id", "assignment_id", "status", "reminder_date", "sent"}
+            
+            if required_catalog.issubset(catalog_columns) and required_links.issubset(link_columns):
+                self.add_result("Assignment Catalog Structure", True, "Catalog and user assignment tables have all required columns")
+            else:
+                missing = (required_catalog - catalog_columns) | (required_links - link_columns)
+                self.add_result("Assignment Catalog Structure", False, f"Missing columns: {', '.join(missing)}")
+            
+            orphaned_count = self.storage.count_orphaned_reminders()
             
             if orphaned_count == 0:
                 self.add_result("Database Integrity", True, "No orphaned reminders found")
             else:
                 self.add_result("Database Integrity", False, f"Found {orphaned_count} orphaned reminders")
-                
-            conn.close()
         except Exception as e:
             self.add_result("Database Integrity", False, f"Error checking database integrity: {str(e)}")
 
 # Function to get detailed system information
-def get_system_info():
+def get_system_info(storage=None):
+    storage = storage or get_storage()
     # Use a dictionary to organize info by category
     info_dict = {
         "Environment": [],
         "Dependencies": [],
-        "Database": []
+        "Database": [],
+        "Runtime": [],
+        "Event Loop": []
     }
     
     # Environment info
@@ -619,28 +667,77 @@ def get_system_info():
     
     # Database info
     try:
-        conn = sqlite3.connect("arbor_users.db")
-        cursor = conn.cursor()
+        info_dict["Database"].append(f"🗄️ Backend: {storage.name}")
         
         # Get user count
-        cursor.execute("SELECT COUNT(*) FROM users")
-        user_count = cursor.fetchone()[0]
+        user_count = storage.count_users()
         info_dict["Database"].append(f"👥 Users: {user_count}")
         
         # Get reminder count
-        cursor.execute("SELECT COUNT(*) FROM reminders")
-        reminder_count = cursor.fetchone()[0]
+        reminder_count = storage.count_reminders()
         info_dict["Database"].append(f"📝 Total reminders: {reminder_count}")
         
         # Get active reminders count
-        cursor.execute("SELECT COUNT(*) FROM reminders WHERE sent = 0")
-        active_reminders = cursor.fetchone()[0]
+        active_reminders = storage.count_reminders(sent=False)
         info_dict["Database"].append(f"⏰ Active reminders: {active_reminders}")
         
-        conn.close()
+        # Reminder DMs still waiting to go out, and ones given up on
+        pending_outbox = storage.count_outbox("pending")
+        failed_outbox = storage.count_outbox("failed")
+        info_dict["Database"].append(f"📬 Outbox: {pending_outbox} pending, {failed_outbox} failed")
     except Exception as e:
         info_dict["Database"].append(f"💾 Database: ❌ Error connecting")
     
+    # Write batching on the single writer thread
+    write_stats = storage.write_stats()
+    if write_stats:
+        info_dict["Database"].append(
+            f"✍️ Writes: {write_stats['writes']} in {write_stats['batches']} commits "
+            f"(avg batch {write_stats['avg_batch']:.1f}, {write_stats['queued']} queued)"
+        )
+    
+    # Which replica runs the background jobs
+    elector = get_leader_elector()
+    if elector is not None:
+        leader_status = elector.status()
+        role = "✅ Leader" if leader_status["leader"] else "💤 Standby"
+        info_dict["Runtime"].append(f"👑 Background jobs: {role} ({leader_status['holder']}, token {leader_status['token']})")
+    
+    # Profile cache effectiveness
+    cache_stats = get_cache_stats()
+    info_dict["Runtime"].append(
+        f"🗃️ Profile cache: {cache_stats['size']}/{cache_stats['maxsize']} entries, "
+        f"{cache_stats['hits']} hits / {cache_stats['misses']} misses ({cache_stats['hit_rate'] * 100:.1f}%)"
+    )
+    
+    # Expensive actions running now, and repeat requests turned away
+    guard_stats = get_action_guard().stats()
+    info_dict["Runtime"].append(
+        f"🚦 Actions: {guard_stats['in_flight']} running, {guard_stats['busy']} duplicates and "
+        f"{guard_stats['limited']} over-limit requests refused"
+    )
+    
+    # Gateway events handled versus dropped at the door
+    gateway_stats = get_gateway_filter().stats()
+    total_events = gateway_stats["accepted"] + gateway_stats["dropped"]
+    info_dict["Runtime"].append(
+        f"🚪 Messages: {gateway_stats['accepted']} handled, {gateway_stats['dropped']} dropped early"
+        + (f" ({gateway_stats['dropped'] / total_events * 100:.1f}%)" if total_events else "")
+    )
+    
+    # How late the event loop has been running, and what has been blocking it
+    loop_stats = get_loop_monitor().stats()
+    if loop_stats["samples"]:
+        info_dict["Event Loop"].append(
+            f"⏳ Lag ({loop_stats['window_seconds'] / 60:.1f} min): p50 {loop_stats['p50_ms']:.1f}ms, "
+            f"p95 {loop_stats['p95_ms']:.1f}ms, p99 {loop_stats['p99_ms']:.1f}ms, max {loop_stats['max_ms']:.0f}ms"
+        )
+        info_dict["Event Loop"].append(f"🐢 Stalls over {loop_stats['threshold_ms']:.0f}ms: {loop_stats['stalls']}")
+        for location, count, seconds in loop_stats["worst"][:3]:
+            info_dict["Event Loop"].append(f"   • {location}: {count}x, {seconds:.2f}s")
+    else:
+        info_dict["Event Loop"].append("⏳ Lag: not measured yet")
+    
     # Format the output with sections
     formatted_info = []
     
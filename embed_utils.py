@@ -1,5 +1,11 @@
 import discord
 import datetime
+import functools
+import hashlib
+import marshal
+import os
+from clock import get_clock
+from cache_utils import LRUCache, MISSING
 
 # Define color constants for different message types
 COLORS = {
@@ -27,55 +33,160 @@ def create_basic_embed(title, description=None, color="default"):
         title=title,
         description=description,
         color=COLORS[color],
-        timestamp=datetime.datetime.now()
+        timestamp=get_clock().now()
     )
     embed.set_footer(text="ArborAlert")
     return embed
 
-# Create an embed for assignments
-def create_assignments_embed(assignments_text):
-    """Convert plain text assignments into a rich embed format"""
-    embed = create_basic_embed("Your Assignments", color="info")
-    
-    # Split the text by lines to process each assignment
-    lines = assignments_text.split('\n')
-    current_section = None
-    current_content = ""
-    
+# Discord embed limits; the total applies to all the embeds in one message together
+EMBED_MAX_FIELDS = 25
+EMBED_FIELD_VALUE_LIMIT = 1024
+EMBED_TOTAL_LIMIT = 6000
+MAX_EMBEDS_PER_MESSAGE = 10
+
+# Rendered embed payloads, keyed by builder and a fingerprint of its input
+render_cache = LRUCache(int(os.getenv("EMBED_CACHE_SIZE", "512")))
+
+# Stable digest of the structured data an embed is built from. Rows are tuples of strings and
+# numbers, which marshal serialises far faster than repr; anything else falls back to repr
+def fingerprint(data):
+    try:
+        serialised = marshal.dumps(data)
+    except ValueError:
+        serialised = repr(data).encode()
+    return hashlib.blake2b(serialised, digest_size=16).hexdigest()
+
+# A fresh copy of a prebuilt embed, timestamped now, that the caller is free to change
+def copy_embed(embed):
+    embed = embed.copy()
+    embed.timestamp = get_clock().now()
+    return embed
+
+def _to_payload(result):
+    if isinstance(result, list):
+        return [_to_payload(item) for item in result]
+    return result.to_dict()
+
+def _from_payload(payload):
+    if isinstance(payload, list):
+        return [_from_payload(item) for item in payload]
+    embed = discord.Embed.from_dict(payload)
+    embed.timestamp = get_clock().now()
+    return embed
+
+def cached_render(builder):
+    """Serve an embed builder's output from render_cache when it has rendered the same input before.
+
+    The builder's result (an embed, or lists of embeds) is stored as payload dicts, so every caller
+    gets new embeds it can change without affecting the cache.
+    """
+    @functools.wraps(builder)
+    def render(*args):
+        key = (builder.__name__, fingerprint(args))
+        payload = render_cache.get(key)
+        if payload is MISSING:
+            payload = _to_payload(builder(*args))
+            render_cache.put(key, payload)
+        return _from_payload(payload)
+    return render
+
+# Add lines as a field, continued in more fields if they overflow one; False if the embed filled up
+def add_lines_field(embed, name, lines):
+    values, value, size = [], [], 0
     for line in lines:
+        line = line[:EMBED_FIELD_VALUE_LIMIT]
+        if value and size + len(line) + 1 > EMBED_FIELD_VALUE_LIMIT:
+            values.append("\n".join(value))
+            value, size = [], 0
+        value.append(line)
+        size += len(line) + 1
+    if value:
+        values.append("\n".join(value))
+    
+    for i, value in enumerate(values):
+        field_name = name if i == 0 else f"{name} (continued)"
+        if len(embed.fields) >= EMBED_MAX_FIELDS or len(embed) + len(field_name) + len(value) > EMBED_TOTAL_LIMIT:
+            embed.set_footer(text="ArborAlert • Some entries didn't fit")
+            return False
+        embed.add_field(name=field_name, value=value, inline=False)
+    return True
+
+# Split Arbor's plain-text assignment list into (section heading, lines) pairs
+def parse_assignments_text(assignments_text):
+    sections = []
+    for line in assignments_text.split('\n'):
         line = line.strip()
         if not line:
             continue
-            
-        # Check if this is a section header
         if "Overdue" in line:
-            # If we have content from a previous section, add it
-            if current_section and current_content:
-                embed.add_field(name=current_section, value=current_content, inline=False)
-            current_section = f"{EMOJIS['overdue']} Overdue Assignments"
-            current_content = ""
+            sections.append((f"{EMOJIS['overdue']} Overdue Assignments", []))
         elif "Assignments that are due" in line:
-            # If we have content from a previous section, add it
-            if current_section and current_content:
-                embed.add_field(name=current_section, value=current_content, inline=False)
-            current_section = f"{EMOJIS['due_soon']} Upcoming Assignments"
-            current_content = ""
-        else:
-            # This is assignment content
+            sections.append((f"{EMOJIS['due_soon']} Upcoming Assignments", []))
+        elif sections:
             # Format assignment entries with subject code in bold
-            subject_match = line.split(':', 1)
-            if len(subject_match) > 1 and '/' in subject_match[0]:
-                subject_code = subject_match[0].strip()
-                assignment_details = subject_match[1].strip()
-                formatted_line = f"**{subject_code}:** {assignment_details}\n"
-                current_content += formatted_line
-            else:
-                current_content += f"{line}\n"
+            subject_code, separator, details = line.partition(':')
+            if separator and '/' in subject_code:
+                line = f"**{subject_code.strip()}:** {details.strip()}"
+            sections[-1][1].append(line)
+    return sections
+
+# Create an embed for assignments
+def create_assignments_embed(assignments_text):
+    """Convert plain text assignments, or stored assignment rows, into a rich embed format"""
+    if not isinstance(assignments_text, str):
+        return create_stored_assignments_embed(assignments_text)
+    return create_text_assignments_embed(assignments_text)
+
+@cached_render
+def create_text_assignments_embed(assignments_text):
+    """Render the plain-text assignment list scraped from Arbor"""
+    embed = create_basic_embed("Your Assignments", color="info")
+    for heading, lines in parse_assignments_text(assignments_text):
+        if lines and not add_lines_field(embed, heading, lines):
+            break
+    return embed
+
+# Create an embed from stored (subject_code, title, due_date, status) rows
+@cached_render
+def create_stored_assignments_embed(assignments):
+    """Render assignments from the database, split into overdue and upcoming sections"""
+    embed = create_basic_embed("Your Assignments", color="info")
+    
+    if not assignments:
+        embed.description = "You don't have any outstanding assignments."
+        return embed
+    
+    sections = {"overdue": [], "upcoming": []}
+    for subject_code, title, due_date, status in assignments:
+        due = datetime.date.fromisoformat(due_date).strftime('%d %b %Y')
+        name = f"**{subject_code}:** {title}" if subject_code else title
+        sections["overdue" if status == "overdue" else "upcoming"].append(f"{name} (Due {due})")
+    
+    if sections["overdue"] and not add_lines_field(embed, f"{EMOJIS['overdue']} Overdue Assignments", sections["overdue"]):
+        return embed
+    if sections["upcoming"]:
+        add_lines_field(embed, f"{EMOJIS['due_soon']} Upcoming Assignments", sections["upcoming"])
+    
+    return embed
+
+# Create an embed listing search results, best match first
+@cached_render
+def create_search_results_embed(search_text, assignments):
+    """Render ranked (subject_code, title, due_date, status) rows found by a search"""
+    embed = create_basic_embed(f"Search: {search_text}"[:256], color="info")
+    
+    if not assignments:
+        embed.description = "None of your assignments match that."
+        return embed
+    
+    lines = []
+    for subject_code, title, due_date, status in assignments:
+        due = datetime.date.fromisoformat(due_date).strftime('%d %b %Y')
+        prefix = f"{EMOJIS['overdue']} " if status == "overdue" else ""
+        name = f"**{subject_code}:** {title}" if subject_code else title
+        lines.append(f"{prefix}{name} (Due {due})")
+    embed.description = "\n".join(lines)[:4096]
     
-    # Add the last section if there's content
-    if current_section and current_content:
-        embed.add_field(name=current_section, value=current_content, inline=False)
-        
     return embed
 
 # Create an embed for reminders
@@ -97,7 +208,91 @@ def create_reminder_embed(assignment, due_date):
     
     return embed
 
+# Lay out a digest of (assignment, due_date) reminders as messages, each a list of embeds, each a list
+# of (name, value, indexes) fields, where indexes are the positions in reminders of the lines in the field
+def _reminder_digest_layout(reminders):
+    # Group assignments by due date, one field per date (more if a date overflows a field)
+    reminders_by_date = {}
+    for index, (assignment, due_date) in enumerate(reminders):
+        reminders_by_date.setdefault(due_date, []).append((index, assignment))
+    
+    fields = []
+    for due_date, assignments in sorted(reminders_by_date.items()):
+        name = f"📅 Due on {due_date}"
+        value, indexes = "", []
+        for index, assignment in assignments:
+            subject_code = assignment.split(':', 1)[0] if ':' in assignment else None
+            assignment_name = assignment.split(':', 1)[1].strip() if ':' in assignment else assignment
+            line = f"• **{subject_code}:** {assignment_name}\n" if subject_code else f"• {assignment_name}\n"
+            line = line[:EMBED_FIELD_VALUE_LIMIT]
+            if len(value) + len(line) > EMBED_FIELD_VALUE_LIMIT:
+                fields.append((name, value, indexes))
+                value, indexes = "", []
+            value += line
+            indexes.append(index)
+        if value:
+            fields.append((name, value, indexes))
+    
+    messages = [[[]]]
+    # Title, description and footer of every embed count towards the message's total too
+    header = len(_reminder_digest_title()) + len(_reminder_digest_description(len(reminders))) + len("ArborAlert")
+    used = header
+    for name, value, indexes in fields:
+        size = len(name) + len(value)
+        message = messages[-1]
+        if used + size > EMBED_TOTAL_LIMIT:
+            messages.append([[]])
+            used = header
+        elif len(message[-1]) >= EMBED_MAX_FIELDS:
+            # A full embed can be continued in another one only if the message has room for it
+            if len(message) < MAX_EMBEDS_PER_MESSAGE and used + header + size <= EMBED_TOTAL_LIMIT:
+                message.append([])
+                used += header
+            else:
+                messages.append([[]])
+                used = header
+        messages[-1][-1].append((name, value, indexes))
+        used += size
+    return messages
+
+def _reminder_digest_title():
+    return f"{EMOJIS['reminder']} Assignment Reminders"
+
+def _reminder_digest_description(count):
+    return f"You have {count} upcoming assignments due!"
+
+# Create the messages (each a list of embeds) listing all of a user's due reminders
+@cached_render
+def create_reminder_digest_messages(reminders):
+    """Render (assignment, due_date) reminders as a digest, split across embeds and messages so that no
+    message goes over Discord's limits"""
+    if len(reminders) == 1:
+        return [[create_reminder_embed(*reminders[0])]]
+    
+    messages = []
+    for message_fields in _reminder_digest_layout(reminders):
+        message = []
+        for embed_fields in message_fields:
+            embed = create_basic_embed(
+                _reminder_digest_title(), _reminder_digest_description(len(reminders)), "reminder"
+            )
+            for name, value, _ in embed_fields:
+                embed.add_field(name=name, value=value, inline=False)
+            message.append(embed)
+        messages.append(message)
+    return messages
+
+# Which reminders each message from create_reminder_digest_messages lists, as positions in reminders
+def reminder_digest_indexes(reminders):
+    if len(reminders) == 1:
+        return [[0]]
+    return [
+        [index for embed_fields in message_fields for _, _, indexes in embed_fields for index in indexes]
+        for message_fields in _reminder_digest_layout(reminders)
+    ]
+
 # Create an embed for user reminders list
+@cached_render
 def create_reminders_list_embed(reminders):
     """Create a rich embed showing all upcoming reminders"""
     embed = create_basic_embed(
@@ -113,39 +308,25 @@ def create_reminders_list_embed(reminders):
     # Group reminders by due date
     reminders_by_date = {}
     for assignment, due_date, reminder_date in reminders:
-        if due_date not in reminders_by_date:
-            reminders_by_date[due_date] = []
-        reminders_by_date[due_date].append((assignment, reminder_date))
+        reminders_by_date.setdefault(due_date, []).append(f"• **{assignment}**\n  _Reminder on: {reminder_date}_")
     
     # Add fields for each due date
-    for due_date, assignments in sorted(reminders_by_date.items()):
-        assignments_text = ""
-        for assignment, reminder_date in assignments:
-            assignments_text += f"• **{assignment}**\n  _Reminder on: {reminder_date}_\n"
-        
-        embed.add_field(
-            name=f"📅 Due on {due_date}",
-            value=assignments_text,
-            inline=False
-        )
+    for due_date, lines in sorted(reminders_by_date.items()):
+        if not add_lines_field(embed, f"📅 Due on {due_date}", lines):
+            break
     
     return embed
 
-# Create an embed for welcome message
-def create_welcome_embed(username):
-    """Create a welcome embed for new users"""
+# The welcome embed without the user's details, built once as it's the same for everyone
+def _create_welcome_template():
     embed = create_basic_embed(
         "Welcome to ArborAlert! 🎉", 
         "Your homework assistant is ready to help you stay on top of your assignments.", 
         "success"
     )
     
-    embed.add_field(
-        name="Account Setup",
-        value=f"Your account has been successfully set up with username: **{username}**\n"
-              f"Please delete the messages where you sent your credentials for security.",
-        inline=False
-    )
+    # Filled in per user by create_welcome_embed
+    embed.add_field(name="Account Setup", value="-", inline=False)
     
     embed.add_field(
         name="Getting Started",
@@ -164,6 +345,21 @@ def create_welcome_embed(username):
     
     return embed
 
+WELCOME_TEMPLATE = _create_welcome_template()
+
+# Create an embed for welcome message
+def create_welcome_embed(username):
+    """Create a welcome embed for new users"""
+    embed = copy_embed(WELCOME_TEMPLATE)
+    embed.set_field_at(
+        0,
+        name="Account Setup",
+        value=f"Your account has been successfully set up with username: **{username}**\n"
+              f"Please delete the messages where you sent your credentials for security.",
+        inline=False
+    )
+    return embed
+
 # Create an error embed
 def create_error_embed(error_message):
     """Create an embed for error messages"""
@@ -0,0 +1,103 @@
+# Evaluate the intent classifier against the pattern router on the held-out corpus split
+#
+# A message counts as routed correctly when it reaches the handler its label calls for: the same
+# action, or for chat intents the same canned responses.
+#
+#   python eval_intents.py                     # train on the training split, test on the rest
+#   python eval_intents.py --model intent_model.npz --all
+import argparse
+import collections
+import os
+import sys
+import time
+
+from cryptography.fernet import Fernet
+
+# database.py builds its cipher at import time
+os.environ.setdefault("KEY", Fernet.generate_key().decode())
+
+from ai_handler import PATTERNS, INTENTS, INTENT_ACTIONS
+from intent_classifier import IntentClassifier
+from intent_router import IntentRouter, INTENT_CONFIDENCE, UNKNOWN_INTENT
+from train_intents import read_corpus, split_corpus, train, CORPUS_PATH
+
+# Actions that end up in the same handler
+SAME_HANDLER = {"due": "fetch", "search": "fetch", "subject_fetch": "fetch"}
+
+# The handler a route ends up in
+def outcome(router, route):
+    if route.intent is None:
+        return "default reply"
+    action = SAME_HANDLER.get(route.action, route.action)
+    return f"reply:{INTENTS[route.intent]}" if action == "respond" else action
+
+# The handler a labelled message should end up in
+def expected_outcome(label):
+    if label == UNKNOWN_INTENT:
+        return "default reply"
+    action = INTENT_ACTIONS.get(label, "respond")
+    action = SAME_HANDLER.get(action, action)
+    return f"reply:{label}" if action == "respond" else action
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+# Route every message uncached; return (correct count, mistakes, per-message seconds)
+def evaluate(router, examples):
+    correct, mistakes, timings = 0, collections.Counter(), []
+    for label, text in examples:
+        router.cache.clear()
+        started = time.perf_counter()
+        route = router.route(text)
+        timings.append(time.perf_counter() - started)
+        got, want = outcome(router, route), expected_outcome(label)
+        if got == want:
+            correct += 1
+        else:
+            mistakes[(want, got)] += 1
+    return correct, mistakes, timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the intent classifier with the pattern router")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--model", help="evaluate this trained model instead of training one on the training split")
+    parser.add_argument("--all", action="store_true", help="evaluate on the whole corpus, not just the held-out split")
+    parser.add_argument("--threshold", type=float, default=INTENT_CONFIDENCE)
+    parser.add_argument("--mistakes", type=int, default=10, help="most common misroutes to list")
+    args = parser.parse_args()
+
+    examples = read_corpus(args.corpus)
+    train_examples, test_examples = split_corpus(examples)
+    if args.all:
+        test_examples = examples
+    classifier = IntentClassifier.load(args.model) if args.model else train(train_examples)
+
+    routers = {
+        "patterns": IntentRouter(PATTERNS, cache_size=1),
+        "classifier": IntentRouter(PATTERNS, cache_size=1, classifier=classifier, intents=INTENTS,
+                                   intent_actions=INTENT_ACTIONS, threshold=0.0),
+        f"classifier >= {args.threshold:g}": IntentRouter(PATTERNS, cache_size=1, classifier=classifier, intents=INTENTS,
+                                                          intent_actions=INTENT_ACTIONS, threshold=args.threshold)
+    }
+
+    print(f"{len(test_examples)} test utterances, {len(set(label for label, _ in test_examples))} intents")
+    print(f"{'router':<20}{'accuracy':>10}{'mean us':>10}{'p95 us':>10}{'fallbacks':>11}")
+    results = {}
+    for name, router in routers.items():
+        correct, mistakes, timings = evaluate(router, test_examples)
+        results[name] = mistakes
+        print(
+            f"{name:<20}{correct / len(test_examples):>10.1%}{sum(timings) / len(timings) * 1e6:>10.1f}"
+            f"{percentile(timings, 0.95) * 1e6:>10.1f}{router.fallbacks:>11}"
+        )
+
+    for name in ("patterns", f"classifier >= {args.threshold:g}"):
+        print()
+        print(f"Most common misroutes ({name}):")
+        for (want, got), count in results[name].most_common(args.mistakes):
+            print(f"  {count:>3}  {want} -> {got}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
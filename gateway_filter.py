@@ -0,0 +1,55 @@
+# Cheap first check on incoming messages, before any parsing or database work
+import collections
+
+class GatewayFilter:
+    """Decides from raw message data whether an event is for the bot at all.
+
+    Only DMs, messages mentioning the bot and prefix commands get through; everything else seen in
+    busy servers is dropped with a couple of attribute reads and substring checks. Counts of
+    accepted and dropped events are kept per reason.
+    """
+
+    def __init__(self, prefix="/"):
+        self.prefix = prefix
+        self.accepted = collections.Counter()
+        self.dropped = collections.Counter()
+        self._user_id = None
+        self._mentions = ()
+
+    # Raw mention forms for the bot's user, worked out once
+    def _mention_tokens(self, user_id):
+        if user_id != self._user_id:
+            self._user_id = user_id
+            self._mentions = (f"<@{user_id}>", f"<@!{user_id}>")
+        return self._mentions
+
+    def accept(self, message, bot_user_id):
+        if message.author.bot:
+            self.dropped["bot"] += 1
+            return False
+        if message.guild is None:
+            self.accepted["dm"] += 1
+            return True
+        content = message.content
+        if any(token in content for token in self._mention_tokens(bot_user_id)):
+            self.accepted["mention"] += 1
+            return True
+        if content.startswith(self.prefix):
+            self.accepted["command"] += 1
+            return True
+        self.dropped["other"] += 1
+        return False
+
+    def stats(self):
+        return {
+            "accepted": sum(self.accepted.values()),
+            "dropped": sum(self.dropped.values()),
+            "by_reason": {**{f"accepted_{k}": v for k, v in self.accepted.items()},
+                          **{f"dropped_{k}": v for k, v in self.dropped.items()}}
+        }
+
+_filter = GatewayFilter()
+
+# The process-wide filter
+def get_gateway_filter():
+    return _filter
@@ -0,0 +1,90 @@
+# Hashed n-gram intent classifier for natural-language messages
+import os
+import re
+import zlib
+import numpy as np
+
+# Where the trained model lives; train_intents.py writes it
+MODEL_PATH = os.getenv("INTENT_MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_model.npz"))
+
+# Feature buckets; words, word pairs and character n-grams all hash into this many columns
+DEFAULT_DIMENSIONS = 4096
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+# Tokens of a message, with numbers folded together so "3 days" and "7 days" look alike
+def tokenize(text):
+    return ["<num>" if token.isdigit() else token for token in TOKEN_PATTERN.findall(text.lower())]
+
+# The feature strings of a message: words, adjacent word pairs and character 3-grams of each word
+def feature_strings(text):
+    tokens = tokenize(text)
+    features = [f"w:{token}" for token in tokens]
+    features += [f"b:{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    for token in tokens:
+        padded = f"<{token}>"
+        features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    return features
+
+def hash_features(text, dimensions):
+    """Hashed, signed and L2-normalised features of a message as (columns, values) arrays"""
+    columns, values = {}, {}
+    for feature in feature_strings(text):
+        digest = zlib.crc32(feature.encode("utf-8"))
+        column = digest % dimensions
+        # A sign bit from the hash keeps colliding features from only ever adding up
+        columns[column] = columns.get(column, 0.0) + (1.0 if digest & 0x80000000 else -1.0)
+    if not columns:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    indexes = np.fromiter(columns.keys(), dtype=np.int64, count=len(columns))
+    values = np.fromiter(columns.values(), dtype=np.float32, count=len(columns))
+    norm = np.linalg.norm(values)
+    return indexes, values / norm if norm else values
+
+class IntentClassifier:
+    """Linear model over hashed n-gram features.
+
+    Every intent is scored at once: the message's feature columns are gathered from the weight
+    matrix and combined with one matrix-vector product, then turned into probabilities.
+    """
+
+    def __init__(self, labels, weights, bias, dimensions=DEFAULT_DIMENSIONS):
+        self.labels = list(labels)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.dimensions = dimensions
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        with np.load(path, allow_pickle=False) as model:
+            return cls(model["labels"].tolist(), model["weights"], model["bias"], int(model["dimensions"]))
+
+    def save(self, path=MODEL_PATH):
+        # Half precision is plenty for the weights and halves the file
+        np.savez_compressed(
+            path, labels=np.array(self.labels), weights=self.weights.astype(np.float16),
+            bias=self.bias, dimensions=np.array(self.dimensions)
+        )
+
+    def probabilities(self, text):
+        indexes, values = hash_features(text, self.dimensions)
+        scores = self.weights[:, indexes] @ values + self.bias
+        scores = np.exp(scores - scores.max())
+        return scores / scores.sum()
+
+    def predict(self, text):
+        """Return (label, confidence) for a message"""
+        probabilities = self.probabilities(text)
+        best = int(probabilities.argmax())
+        return self.labels[best], float(probabilities[best])
+
+# Load the trained model, or None (falling back to the regex router) if it isn't there
+def load_classifier(path=MODEL_PATH):
+    if not os.path.exists(path):
+        print(f"No intent model at {path}; using pattern routing only")
+        return None
+    try:
+        return IntentClassifier.load(path)
+    except Exception as e:
+        print(f"Error loading intent model: {e}")
+        return None
@@ -0,0 +1,295 @@
+# Compiled intent routing for natural-language messages
+import os
+import re
+from collections import namedtuple
+from cache_utils import LRUCache, MISSING
+
+# RE2 matches in time linear in the input whatever the pattern; without it, matching relies on
+# the message caps below to bound the work
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+# Only the start of a message is routed; intents are stated up front, and this bounds the work
+# any single message can cause
+MAX_MESSAGE_CHARS = int(os.getenv("MAX_MESSAGE_CHARS", "500"))
+MAX_MESSAGE_TOKENS = int(os.getenv("MAX_MESSAGE_TOKENS", "60"))
+
+# Result of routing one message. intent is the index of the matching pattern (None when nothing
+# matched), number the first numeric group of the match, subject the subject mentioned, if any.
+Route = namedtuple("Route", ["intent", "action", "number", "subject"])
+
+NO_MATCH = Route(None, None, None, None)
+
+# Subjects recognised in subject-specific homework questions, in priority order
+SUBJECTS = ["math", "english", "science", "history", "geography", "art", "music", "pe",
+            "physics", "chemistry", "biology", "computer science", "french", "spanish", "german"]
+
+# Words that make a message with a subject in it a homework question
+SUBJECT_HOMEWORK_WORDS = ("homework", "assignment", "work", "task")
+
+# Classifier label for messages that aren't about anything the bot does
+UNKNOWN_INTENT = "unknown"
+
+# The classifier's route is used when it is at least this confident; otherwise the patterns decide
+INTENT_CONFIDENCE = float(os.getenv("INTENT_CONFIDENCE", "0.4"))
+
+NUMBER_PATTERN = re.compile(r"\b\d+\b")
+NUMBER_WORDS = {"one": "1", "two": "2", "three": "3", "four": "4", "five": "5", "six": "6", "seven": "7",
+                "eight": "8", "nine": "9", "ten": "10"}
+
+# Characters that end a literal run in a pattern
+REGEX_META = set("()[]{}?*+.\\|^$")
+QUANTIFIERS = set("?*+{")
+
+# Whether a pattern repeats a group without bound, e.g. (a|ab)* or (\w+\s?)+. Backtracking on
+# such patterns can take exponential time, which no input cap prevents.
+def repeats_group(pattern):
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == ")" and re.match(r"[+*]|\{\d*,\}", pattern[i + 1:]):
+            return True
+        i += 1
+    return False
+
+# Compile a pattern with RE2 when it's installed and supports the pattern. With the backtracking
+# engine, patterns may only repeat single characters, which keeps matching polynomial in the
+# (capped) message length.
+def compile_pattern(pattern):
+    if re2 is not None:
+        try:
+            return re2.compile(pattern)
+        except Exception as e:
+            print(f"Pattern not supported by RE2, using re: {pattern} ({e})")
+    if repeats_group(pattern):
+        raise ValueError(f"Pattern repeats a group, which needs RE2 to match safely: {pattern}")
+    return re.compile(pattern)
+
+# Pick the handler for a pattern from its source text. These are the rules process_message has
+# always applied to the pattern that matched, evaluated once per pattern instead of per message.
+def legacy_action(pattern):
+    if "search" in pattern and "find" in pattern:
+        return "search"
+    if ("assignment" in pattern or "homework" in pattern) and ("what" in pattern or "show" in pattern or "get" in pattern or "fetch" in pattern):
+        return "fetch"
+    if "due" in pattern or "deadline" in pattern:
+        return "due"
+    if ("set" in pattern or "create" in pattern) and ("reminder" in pattern or "alert" in pattern):
+        return "set_reminder"
+    if ("view" in pattern or "show" in pattern or "check" in pattern or "list" in pattern) and ("reminder" in pattern or "alert" in pattern):
+        return "view_reminders"
+    if ("setup" in pattern or "create" in pattern or "register" in pattern) and ("account" in pattern or "profile" in pattern):
+        return "setup"
+    if ("change" in pattern or "update" in pattern or "modify" in pattern) and ("credentials" in pattern or "password" in pattern or "login" in pattern):
+        return "change_credentials"
+    if ("delete" in pattern or "remove" in pattern) and ("account" in pattern or "profile" in pattern):
+        return "delete_account"
+    if "debug" in pattern or "diagnose" in pattern or "test" in pattern or "troubleshoot" in pattern:
+        return "debug"
+    if "help" in pattern or "guide" in pattern or "how" in pattern or "what can you do" in pattern:
+        return "help"
+    return "respond"
+
+# Split a regex source on its top-level "|"
+def _split_alternatives(source):
+    alternatives, depth, start, i = [], 0, 0, 0
+    while i < len(source):
+        char = source[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            alternatives.append(source[start:i])
+            start = i + 1
+        i += 1
+    alternatives.append(source[start:])
+    return alternatives
+
+# The literal text every match of an alternative must start with ("" if there is none)
+def _literal_prefix(alternative):
+    for i, char in enumerate(alternative):
+        if char in REGEX_META:
+            # A quantifier makes the character before it optional
+            return alternative[:i - 1] if char in QUANTIFIERS else alternative[:i]
+    return alternative
+
+# Top-level groups of a pattern that every match must pass through, as their source text
+def _required_groups(pattern):
+    groups, depth, start, i = [], 0, None, 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == "(":
+            if depth == 0:
+                start = i + 1
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                optional = i + 1 < len(pattern) and pattern[i + 1] in "?*{"
+                body = pattern[start:i]
+                if not optional and not body.startswith("?"):
+                    groups.append(body)
+        elif char == "|" and depth == 0:
+            # Alternation at the top level; no group is required
+            return []
+        i += 1
+    return groups
+
+def required_keywords(pattern):
+    """Keywords one of which appears (lowercased) in anything the pattern matches, or None if the
+    pattern has no usable required group. The most selective group is used."""
+    best = None
+    for group in _required_groups(pattern):
+        prefixes = [_literal_prefix(alternative).lower() for alternative in _split_alternatives(group)]
+        if not prefixes or any(not prefix for prefix in prefixes):
+            continue
+        if best is None or min(map(len, prefixes)) > min(map(len, best)):
+            best = prefixes
+    return best
+
+class IntentRouter:
+    """Routes messages to intents with one keyword scan instead of one regex search per pattern.
+
+    Patterns keep their order: the first pattern that matches wins, exactly as before. A single
+    combined regex finds which patterns' required keywords appear in the message, and only those
+    patterns are searched. Each pattern's action is precomputed, and routes for repeated messages
+    are memoised.
+
+    Messages are normalised and capped before matching. The keyword scan is a plain alternation of
+    literals, so it is linear on any engine; the patterns use RE2 when it is available.
+
+    With a classifier, its prediction is taken when it is confident enough and the patterns are
+    the fallback. Its labels are the names in `intents` (one per pattern, in the same order, so
+    canned responses are shared) plus UNKNOWN_INTENT; `intent_actions` gives each label's action.
+    """
+
+    def __init__(self, patterns, cache_size=None, classifier=None, intents=None, intent_actions=None,
+                 threshold=INTENT_CONFIDENCE):
+        """patterns maps each regex to its canned responses, in priority order"""
+        if cache_size is None:
+            cache_size = int(os.getenv("ROUTER_CACHE_SIZE", "2048"))
+        self.classifier = classifier
+        self.threshold = threshold
+        self.intent_index = {name: index for index, name in enumerate(intents or [])}
+        self.intent_actions = intent_actions or {}
+        self.classified = 0
+        self.fallbacks = 0
+        self.patterns = list(patterns)
+        self.responses = [patterns[pattern] for pattern in self.patterns]
+        self.compiled = [compile_pattern(pattern) for pattern in self.patterns]
+        self.truncated = 0
+        self.actions = [legacy_action(pattern) for pattern in self.patterns]
+        self.cache = LRUCache(cache_size)
+
+        # Keyword -> intents needing it; patterns without usable keywords are always searched
+        keyword_intents = {}
+        self.always = set()
+        for index, pattern in enumerate(self.patterns):
+            keywords = required_keywords(pattern)
+            if keywords is None:
+                self.always.add(index)
+                continue
+            for keyword in keywords:
+                keyword_intents.setdefault(keyword, set()).add(index)
+
+        # The scan reports the longest keyword starting at each position, so each keyword also
+        # stands for every shorter keyword it starts with
+        self.keyword_intents = {
+            keyword: frozenset().union(*(
+                intents for other, intents in keyword_intents.items() if keyword.startswith(other)
+            ))
+            for keyword in keyword_intents
+        }
+        alternation = "|".join(re.escape(keyword) for keyword in sorted(keyword_intents, key=len, reverse=True))
+        self.prefilter = re.compile(f"(?=({alternation}))") if alternation else None
+
+        self.subject_pattern = re.compile(r"\b(" + "|".join(re.escape(subject) for subject in SUBJECTS) + r")\b")
+        self.subject_rank = {subject: rank for rank, subject in enumerate(SUBJECTS)}
+
+    def candidates(self, content):
+        """Indexes of the patterns that could match, in pattern order"""
+        intents = set(self.always)
+        if self.prefilter is not None:
+            for match in self.prefilter.finditer(content):
+                intents.update(self.keyword_intents[match.group(1)])
+        return sorted(intents)
+
+    def mentioned_subject(self, content):
+        subjects = {match.group(1) for match in self.subject_pattern.finditer(content)}
+        return min(subjects, key=self.subject_rank.get) if subjects else None
+
+    def route(self, content):
+        # Cut before splitting so even normalising does bounded work
+        tokens = content[:MAX_MESSAGE_CHARS].lower().split()
+        if len(content) > MAX_MESSAGE_CHARS or len(tokens) > MAX_MESSAGE_TOKENS:
+            self.truncated += 1
+        content = " ".join(tokens[:MAX_MESSAGE_TOKENS])
+        route = self.cache.get(content)
+        if route is MISSING:
+            route = self._route(content)
+            self.cache.put(content, route)
+        return route
+
+    def _route(self, content):
+        if self.classifier is not None:
+            label, confidence = self.classifier.predict(content)
+            route = self._classified_route(label, content) if confidence >= self.threshold else None
+            if route is not None:
+                self.classified += 1
+                return route
+            self.fallbacks += 1
+        return self._pattern_route(content)
+
+    # Route for a classifier label, or None if the label isn't one this router knows
+    def _classified_route(self, label, content):
+        if label == UNKNOWN_INTENT:
+            return NO_MATCH
+        index = self.intent_index.get(label)
+        if index is None:
+            return None
+        subject = self.mentioned_subject(content)
+        action = self.intent_actions.get(label, "respond")
+        if action == "subject_fetch" and not subject:
+            action = "fetch"
+        number = NUMBER_PATTERN.search(content)
+        if number:
+            number = number.group()
+        else:
+            number = next((NUMBER_WORDS[token] for token in content.split() if token in NUMBER_WORDS), None)
+        return Route(index, action, number, subject)
+
+    def _pattern_route(self, content):
+        for index in self.candidates(content):
+            match = self.compiled[index].search(content)
+            if not match:
+                continue
+
+            number = next((group for group in match.groups() if group and group.isdigit()), None)
+            subject = self.mentioned_subject(content)
+            action = self.actions[index]
+            # A subject plus a homework word turns anything but a fetch into a subject fetch
+            if action != "fetch" and subject and any(word in content for word in SUBJECT_HOMEWORK_WORDS):
+                action = "subject_fetch"
+            return Route(index, action, number, subject)
+        return NO_MATCH
+
+    def stats(self):
+        return {
+            "engine": "re2" if any(not isinstance(pattern, re.Pattern) for pattern in self.compiled) else "re",
+            "truncated": self.truncated,
+            "classified": self.classified,
+            "fallbacks": self.fallbacks,
+            "cache": self.cache.stats()
+        }
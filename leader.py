@@ -0,0 +1,137 @@
+# Lease-based leader election between bot replicas sharing one database
+import asyncio
+import datetime
+import os
+import socket
+import uuid
+from clock import get_clock
+from database import acquire_lease_async, release_lease_async
+
+# Lease guarding the scheduled jobs, reminder dispatcher and outbox
+LEADER_LEASE_NAME = "background-jobs"
+
+# How long a lease lasts without a heartbeat; a dead leader is replaced within this time
+LEADER_LEASE_SECONDS = int(os.getenv("LEADER_LEASE_SECONDS", "30"))
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def default_holder():
+    return os.getenv("INSTANCE_ID") or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class LeaderElector:
+    """Keeps trying to hold a lease in the database and runs callbacks when leadership changes.
+
+    The leader renews its lease every third of the lease time. Any replica may take over a lease
+    that has expired, which bumps its fencing token; writes that must only come from the leader
+    pass (name, token) as a fence and are rejected once the token is stale. Locally, leadership
+    is given up as soon as the lease could have expired, even if the database can't be reached.
+    """
+
+    def __init__(self, on_elected=None, on_demoted=None, name=LEADER_LEASE_NAME, holder=None,
+                 lease_seconds=LEADER_LEASE_SECONDS):
+        self.name = name
+        self.holder = holder or default_holder()
+        self.lease_seconds = lease_seconds
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.token = None
+        self.elections = 0
+        # Whether the leader-only work is currently running here
+        self._leading = False
+        self._expires = 0.0
+        self._task = None
+
+    @property
+    def is_leader(self):
+        return self.token is not None and get_clock().monotonic() < self._expires
+
+    # Fencing token for leader-only writes, or None when not the leader
+    def fence(self):
+        return (self.name, self.token) if self.is_leader else None
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self):
+        while True:
+            try:
+                await self.heartbeat()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in leader election: {e}")
+            await get_clock().sleep(self.lease_seconds / 3)
+
+    async def heartbeat(self):
+        clock = get_clock()
+        # Measured before the round trip, so the local view never outlives the stored lease
+        started = clock.monotonic()
+        now = clock.now()
+        expires_at = now + datetime.timedelta(seconds=self.lease_seconds)
+        try:
+            token = await acquire_lease_async(
+                self.name, self.holder, now.strftime(TIMESTAMP_FORMAT), expires_at.strftime(TIMESTAMP_FORMAT)
+            )
+        except Exception as e:
+            print(f"Error renewing leader lease: {e}")
+            if self._leading and not self.is_leader:
+                self._demote()
+            return
+
+        if token is None:
+            if self._leading:
+                self._demote()
+            self.token = None
+            return
+
+        self.token = token
+        self._expires = started + self.lease_seconds
+        if not self._leading:
+            self._leading = True
+            self.elections += 1
+            print(f"Became leader ({self.holder}, token {token})")
+            self._callback(self.on_elected)
+
+    def _demote(self):
+        print(f"Lost leadership ({self.holder}, token {self.token})")
+        self._leading = False
+        self.token = None
+        self._callback(self.on_demoted)
+
+    def _callback(self, callback):
+        if callback is None:
+            return
+        try:
+            callback()
+        except Exception as e:
+            print(f"Error handling leadership change: {e}")
+
+    # Step down and let another replica take over straight away
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._leading:
+            try:
+                await release_lease_async(self.name, self.holder)
+            except Exception as e:
+                print(f"Error releasing leader lease: {e}")
+            self._demote()
+
+    def status(self):
+        return {"holder": self.holder, "leader": self.is_leader, "token": self.token, "elections": self.elections}
+
+_elector = None
+
+# Start electing a leader once; on_elected/on_demoted start and stop the leader-only work
+def start_leader_election(on_elected, on_demoted):
+    global _elector
+    if _elector is None:
+        _elector = LeaderElector(on_elected, on_demoted)
+    _elector.start()
+    return _elector
+
+def get_leader_elector():
+    return _elector
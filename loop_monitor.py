@@ -0,0 +1,177 @@
+# Watches the bot's event loop for stalls caused by blocking code running inside coroutines
+import asyncio
+import collections
+import os
+import sys
+import threading
+import time
+import traceback
+from metrics import get_metrics
+
+# How often the loop is sampled
+SAMPLE_INTERVAL_SECONDS = 0.25
+
+# A callback holding the loop for longer than this is logged with its stack
+SLOW_CALLBACK_SECONDS = float(os.getenv("SLOW_CALLBACK_MS", "100")) / 1000
+
+# How often the lag percentiles are written to the log (0 turns the summary off)
+LAG_SUMMARY_SECONDS = int(os.getenv("LOOP_LAG_SUMMARY_SECONDS", "600"))
+
+# Lag samples kept for the rolling percentiles (ten minutes at the sample interval)
+LAG_WINDOW = 2400
+
+# Innermost frames kept from a stalled loop's stack
+STACK_DEPTH = 12
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+# (where the loop is stuck, formatted stack) for a frame on the loop thread; the location is the
+# innermost frame in the bot's own code, which is usually the call that should not be blocking
+def describe_stack(frame):
+    frames = traceback.extract_stack(frame)
+    location = frames[-1]
+    for entry in reversed(frames):
+        if entry.filename.startswith(REPO_DIR) and entry.filename != __file__:
+            location = entry
+            break
+    where = f"{os.path.basename(location.filename)}:{location.lineno} in {location.name}"
+    return where, "".join(traceback.format_list(frames[-STACK_DEPTH:]))
+
+class LoopMonitor:
+    """Measures how late the event loop wakes up, and catches whatever is blocking it.
+
+    A task on the loop sleeps SAMPLE_INTERVAL_SECONDS at a time and records how much later than
+    asked it woke; the last LAG_WINDOW samples give rolling percentiles. A watchdog thread checks
+    the task keeps waking, and once it is more than SLOW_CALLBACK_SECONDS overdue it captures the
+    loop thread's stack, so the blocking call is caught in the act rather than guessed at.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL_SECONDS, threshold=SLOW_CALLBACK_SECONDS, window=LAG_WINDOW):
+        self.interval = interval
+        self.threshold = threshold
+        self.samples = collections.deque(maxlen=window)
+        self.stalls = 0
+        # Where the loop was stuck -> [stalls, total seconds]
+        self.by_location = {}
+        self._lock = threading.Lock()
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._loop_thread_id = None
+        # When the sampling task should next wake (time.monotonic)
+        self._due = None
+        # Location the watchdog caught the loop stuck at, until the stall ends
+        self._caught = None
+
+    def start(self):
+        """Start monitoring the running loop (safe to call again on reconnect)"""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._task = asyncio.get_running_loop().create_task(self.run())
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._stop.set()
+        self._due = None
+
+    async def run(self):
+        last_summary = time.monotonic()
+        while True:
+            self._due = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            due, self._due = self._due, None
+            self.record(max(now - due, 0.0))
+            if LAG_SUMMARY_SECONDS and now - last_summary >= LAG_SUMMARY_SECONDS:
+                last_summary = now
+                print(self.summary())
+
+    def record(self, lag):
+        with self._lock:
+            self.samples.append(lag)
+            caught, self._caught = self._caught, None
+            if lag < self.threshold:
+                return
+            # Short stalls can end between two watchdog checks; they still count
+            location = caught or "unknown (ended before it was caught)"
+            self.stalls += 1
+            entry = self.by_location.setdefault(location, [0, 0.0])
+            entry[0] += 1
+            entry[1] += lag
+        print(f"Event loop was blocked for {lag * 1000:.0f}ms at {location}")
+
+    # Runs on its own thread, so it still gets to look while the loop is stuck
+    def _watch(self):
+        seen_due = None
+        while not self._stop.wait(self.threshold / 2):
+            due = self._due
+            if due is None or due == seen_due or time.monotonic() - due < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            location, stack = describe_stack(frame)
+            del frame
+            # The loop may have moved on while the stack was being read
+            if self._due != due:
+                continue
+            seen_due = due
+            with self._lock:
+                self._caught = location
+            print(f"Event loop blocked for over {self.threshold * 1000:.0f}ms at {location}:\n{stack}", end="")
+
+    def stats(self):
+        with self._lock:
+            samples = list(self.samples)
+            stalls = self.stalls
+            by_location = sorted(self.by_location.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            "samples": len(samples),
+            "window_seconds": len(samples) * self.interval,
+            "p50_ms": percentile(samples, 0.5) * 1000,
+            "p95_ms": percentile(samples, 0.95) * 1000,
+            "p99_ms": percentile(samples, 0.99) * 1000,
+            "max_ms": max(samples, default=0.0) * 1000,
+            "stalls": stalls,
+            "threshold_ms": self.threshold * 1000,
+            # (location, stalls, total seconds), worst first
+            "worst": [(location, count, seconds) for location, (count, seconds) in by_location[:5]]
+        }
+
+    # One-line lag summary for the log, plus the worst blocking calls seen
+    def summary(self):
+        stats = self.stats()
+        lines = [
+            f"Event loop lag over {stats['window_seconds'] / 60:.1f} min: p50 {stats['p50_ms']:.1f}ms, "
+            f"p95 {stats['p95_ms']:.1f}ms, p99 {stats['p99_ms']:.1f}ms, max {stats['max_ms']:.0f}ms; "
+            f"{stats['stalls']} stalls over {stats['threshold_ms']:.0f}ms"
+        ]
+        for location, count, seconds in stats["worst"]:
+            lines.append(f"  {location}: {count}x, {seconds:.2f}s in total")
+        return "\n".join(lines)
+
+_monitor = LoopMonitor()
+
+get_metrics().gauge("arboralert_loop_lag_p99_seconds", "99th percentile event loop lag over the rolling window").set_function(
+    lambda: _monitor.stats()["p99_ms"] / 1000
+)
+get_metrics().counter("arboralert_loop_stalls_total", "Times the event loop was blocked past the slow callback threshold").set_function(
+    lambda: _monitor.stats()["stalls"]
+)
+
+# The process-wide monitor
+def get_loop_monitor():
+    return _monitor
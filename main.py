@@ -5,20 +5,24 @@ from cryptography.fernet import Fernet
 from dotenv import load_dotenv
 import traceback
 
+# Load environment variables before our modules, which read their settings at import time
+load_dotenv()
+
 # Import our modules
 from database import init_db, add_reminder_days_column
-from reminder_system import init_scheduler, check_reminders
+from reminder_system import start_background_jobs, stop_background_jobs
+from leader import start_leader_election
 from bot_commands import (
     setup_command, fetch_command, set_reminder_command, view_reminders_command,
-    delete_account_command, change_credentials_command, debug_command
+    delete_account_command, change_credentials_command, debug_command, search_command
 )
 from embed_utils import create_basic_embed, create_error_embed
 from ai_handler import process_message
+from gateway_filter import get_gateway_filter
+from loop_monitor import get_loop_monitor
+from metrics import start_metrics_server
 from help_command import help_command
 
-# Load environment variables
-load_dotenv()
-
 # Initialize encryption
 cipher_suite = Fernet(os.getenv("KEY"))
 
@@ -26,30 +30,43 @@ cipher_suite = Fernet(os.getenv("KEY"))
 init_db()
 add_reminder_days_column()
 
+# Prometheus-format metrics on localhost, if METRICS_PORT is set
+start_metrics_server()
+
 # Discord Bot Setup
 intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix="/", intents=intents)
 
+# on_ready fires again on every reconnect; background work must only start once
+background_started = False
+
 @bot.event
 async def on_ready():
+    global background_started
     print("Bot is online and waiting for commands.")
+    # Every replica watches its own loop for blocking calls
+    get_loop_monitor().start()
+    if background_started:
+        return
     try:
         synced = await bot.tree.sync()
         print(f"Synced {len(synced)} command(s)")
         
-        # Initialize the scheduler
-        init_scheduler()
-        
-        # Start the background task for checking reminders
-        bot.loop.create_task(check_reminders(bot))
+        # Scheduled jobs, reminders and the outbox run only on the elected leader replica;
+        # every replica keeps serving commands
+        elector = start_leader_election(
+            on_elected=lambda: start_background_jobs(bot, fence=elector.fence),
+            on_demoted=stop_background_jobs
+        )
+        background_started = True
     except Exception as e:
         print(f"Failed to sync commands: {e}")
 
 @bot.event
 async def on_message(message):
-    # Skip processing if message is from a bot
-    if message.author.bot:
+    # Drop bot messages and anything not aimed at us before doing any work
+    if not get_gateway_filter().accept(message, bot.user.id):
         return
         
     # Process commands first
@@ -73,6 +90,11 @@ async def fetch(interaction: discord.Interaction):
     """Fetch your homework assignments from Arbor"""
     await fetch_command(interaction)
 
+@bot.tree.command(name="search")
+async def search(interaction: discord.Interaction, query: str):
+    """Search your saved assignments by title or subject"""
+    await search_command(interaction, query)
+
 @bot.tree.command(name="set_reminder")
 async def set_reminder(interaction: discord.Interaction, days_before: int = 1):
     """Set how many days before the due date you want to be reminded"""
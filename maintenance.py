@@ -0,0 +1,31 @@
+# Database maintenance: retention of sent reminders and compaction
+import os
+import datetime
+from storage import get_storage
+from clock import get_clock
+
+# Run the retention and compaction job, returning a report of what was reclaimed
+def run_maintenance(storage=None, retention_days=None, archive=None):
+    storage = storage or get_storage()
+    if retention_days is None:
+        retention_days = int(os.getenv("REMINDER_RETENTION_DAYS", "30"))
+    if archive is None:
+        archive = os.getenv("REMINDER_ARCHIVE", "false").lower() in ("1", "true", "yes")
+
+    report = {"purged_reminders": 0, "orphaned_reminders": 0, "purged_outbox": 0, "bytes_reclaimed": 0}
+    try:
+        cutoff = (get_clock().now() - datetime.timedelta(days=retention_days)).strftime('%Y-%m-%d')
+        report["purged_reminders"] = storage.purge_sent_reminders(cutoff, archive=archive)
+        report["orphaned_reminders"] = storage.delete_orphaned_reminders()
+        report["purged_outbox"] = storage.purge_outbox(cutoff)
+        report["bytes_reclaimed"] = storage.compact()
+
+        action = "Archived" if archive else "Deleted"
+        print(
+            f"Maintenance: {action} {report['purged_reminders']} completed assignment(s) due before {cutoff}, "
+            f"removed {report['orphaned_reminders']} orphaned reminder(s) and {report['purged_outbox']} finished outbox entries, "
+            f"reclaimed {report['bytes_reclaimed']} bytes"
+        )
+    except Exception as e:
+        print(f"Error running database maintenance: {e}")
+    return report
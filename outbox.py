@@ -0,0 +1,336 @@
+# Persistent outbox for reminder DMs, delivered concurrently within Discord's rate limits
+import asyncio
+import datetime
+import os
+import random
+import discord
+from clock import get_clock
+from cache_utils import LRUCache, MISSING
+from database import (
+    get_ready_outbox, get_next_outbox_attempt, claim_outbox_async, mark_outbox_delivered_async,
+    mark_outbox_failed_async
+)
+from embed_utils import create_reminder_embed, create_reminder_digest_messages, reminder_digest_indexes
+from user_resolver import get_user_resolver
+from metrics import get_metrics
+
+# Send each user one digest of their due reminders instead of a DM per reminder
+REMINDER_DIGEST = os.getenv("REMINDER_DIGEST", "true").lower() in ("1", "true", "yes")
+
+# How many DMs may be in flight at once
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "5"))
+
+# Attempts before an entry is given up on
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+
+# Retry backoff: RETRY_BASE_SECONDS * 2^attempts, capped, with jitter
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+
+# Entries claimed per pass
+OUTBOX_BATCH_SIZE = 100
+
+# How long claimed entries are held; if this replica dies mid-send they are retried after it
+CLAIM_SECONDS = 300
+
+# Longest single sleep, so wall-clock jumps can't strand the worker
+MAX_SLEEP_SECONDS = 3600
+
+# Wait before looking again when ready entries couldn't be claimed (another replica took them,
+# or our fencing token is stale)
+CLAIM_RETRY_SECONDS = 5
+
+# Discord allows 50 requests/second globally and 5 messages per 5 seconds per channel; stay under both
+GLOBAL_RATE = 40
+GLOBAL_BURST = 10
+ROUTE_RATE = 1
+ROUTE_BURST = 5
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+DMS_SENT = get_metrics().counter("arboralert_dms_sent_total", "Reminder DMs accepted by Discord")
+DM_SEND_SECONDS = get_metrics().histogram("arboralert_dm_send_seconds", "Time taken by Discord to accept a reminder DM")
+REMINDERS_DELIVERED = get_metrics().counter("arboralert_reminders_delivered_total", "Reminders delivered by DM")
+DM_FAILURES = get_metrics().counter(
+    "arboralert_dm_failures_total", "Failed reminder deliveries, by what happened next (retry, gave_up)", ("result",)
+)
+RATE_LIMITED = get_metrics().counter(
+    "arboralert_discord_rate_limited_total", "429 responses from Discord, by scope (route, global)", ("scope",)
+)
+
+def timestamp(when=None):
+    return (when or get_clock().now()).strftime(TIMESTAMP_FORMAT)
+
+class TokenBucket:
+    """Async token bucket refilled at `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = get_clock().monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            now = get_clock().monotonic()
+            if now < self.blocked_until:
+                await get_clock().sleep(self.blocked_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await get_clock().sleep((1 - self.tokens) / self.rate)
+
+    def try_acquire(self):
+        """Take a token if one is free; return 0, or how many seconds until one will be"""
+        now = get_clock().monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    # Stop handing out tokens until Discord's retry_after has passed
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, get_clock().monotonic() + seconds)
+        self.tokens = 0
+
+class RateLimiter:
+    """A global bucket plus one bucket per route (a user's DM channel)"""
+
+    def __init__(self, global_rate=GLOBAL_RATE, global_burst=GLOBAL_BURST, route_rate=ROUTE_RATE,
+                 route_burst=ROUTE_BURST, max_routes=4096):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.route_rate = route_rate
+        self.route_burst = route_burst
+        self.routes = LRUCache(max_routes)
+        self.limited = 0
+
+    def _route(self, route):
+        bucket = self.routes.get(route)
+        if bucket is MISSING:
+            bucket = TokenBucket(self.route_rate, self.route_burst)
+            self.routes.put(route, bucket)
+        return bucket
+
+    async def acquire(self, route):
+        # Wait on the route first so a slow channel doesn't hold global tokens
+        await self._route(route).acquire()
+        await self.global_bucket.acquire()
+
+    def rate_limited(self, route, retry_after, is_global=False):
+        self.limited += 1
+        RATE_LIMITED.labels("global" if is_global else "route").inc()
+        if is_global:
+            self.global_bucket.block(retry_after)
+        else:
+            self._route(route).block(retry_after)
+
+# Discord's retry_after if the error was a rate limit, otherwise None
+def rate_limit_delay(error):
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is None and getattr(error, "status", None) == 429:
+        retry_after = 1.0
+    return retry_after
+
+def retry_delay(attempts):
+    delay = min(RETRY_BASE_SECONDS * (2 ** attempts), RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+class OutboxWorker:
+    """Delivers queued reminder DMs with retries.
+
+    Entries stay in the outbox until Discord accepts the message; delivery and the reminder's
+    sent flag are recorded in one transaction, message by message when a digest takes several. Sends run with bounded concurrency, paced by
+    token buckets, and back off on failures and 429s.
+    """
+
+    def __init__(self, bot, concurrency=OUTBOX_CONCURRENCY, limiter=None, fence=None):
+        self.bot = bot
+        self.limiter = limiter or RateLimiter()
+        # Returns the leader's fencing token (or None when not leader); None means no election
+        self.fence = fence
+        self.concurrency = concurrency
+        self.delivered = 0
+        self.failed = 0
+        self._semaphore = None
+        self._wakeup = None
+        self._loop = None
+        self._task = None
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # Called from any thread when new entries have been queued
+    def notify(self):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def run(self):
+        while True:
+            try:
+                self._wakeup.clear()
+                entries = get_ready_outbox(timestamp(), OUTBOX_BATCH_SIZE)
+                if len(entries) == OUTBOX_BATCH_SIZE and REMINDER_DIGEST:
+                    # The last user may have more entries past the limit; leave them all for the next pass
+                    # so their digest isn't split in two
+                    last_user = entries[-1][2]
+                    entries = [entry for entry in entries if entry[2] != last_user] or entries
+                if entries:
+                    claimed = await self.deliver(entries)
+                    if claimed is None:
+                        # Leadership is gone; the next leader's worker takes over the outbox
+                        print("Lost the leader lease, stopping the reminder outbox")
+                        return
+                    if not claimed:
+                        await get_clock().wait(self._wakeup, CLAIM_RETRY_SECONDS)
+                    continue
+
+                timeout = MAX_SLEEP_SECONDS
+                next_attempt = get_next_outbox_attempt()
+                if next_attempt is not None:
+                    wait = (datetime.datetime.strptime(next_attempt, TIMESTAMP_FORMAT) - get_clock().now()).total_seconds()
+                    timeout = min(max(wait, 0), MAX_SLEEP_SECONDS)
+                await get_clock().wait(self._wakeup, timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in reminder outbox: {e}")
+                await get_clock().sleep(60)
+
+    # Deliver a batch of (id, reminder_id, discord_id, assignment_name, due_date, attempts) entries;
+    # return how many were claimed, or None if this replica is no longer the leader
+    async def deliver(self, entries):
+        # Claim the entries first; a replica that is no longer leader gets nothing
+        fence = None
+        if self.fence is not None:
+            fence = self.fence()
+            if fence is None:
+                return None
+        now = get_clock().now()
+        claimed = set(await claim_outbox_async(
+            [entry[0] for entry in entries], timestamp(now),
+            timestamp(now + datetime.timedelta(seconds=CLAIM_SECONDS)), fence
+        ))
+        entries = [entry for entry in entries if entry[0] in claimed]
+        if not entries:
+            return 0
+
+        if REMINDER_DIGEST:
+            entries_by_user = {}
+            for entry in entries:
+                entries_by_user.setdefault(entry[2], []).append(entry)
+            groups = list(entries_by_user.values())
+        else:
+            groups = [[entry] for entry in entries]
+
+        await asyncio.gather(*(self._deliver_group(group) for group in groups))
+        return len(entries)
+
+    async def _deliver_group(self, group):
+        discord_id = group[0][2]
+        route = f"dm:{discord_id}"
+
+        async with self._semaphore:
+            try:
+                reminders = [(entry[3], entry[4]) for entry in group]
+                if len(group) == 1:
+                    messages = [[create_reminder_embed(*reminders[0])]]
+                else:
+                    messages = create_reminder_digest_messages(reminders)
+                # The entries each message lists, so every message is recorded as soon as it goes out
+                parts = [
+                    ([group[index] for index in indexes], embeds)
+                    for indexes, embeds in zip(reminder_digest_indexes(reminders), messages)
+                ]
+            except Exception as e:
+                await self._delivery_failed(discord_id, group, e, route)
+                return
+
+            resolver = get_user_resolver(self.bot)
+            for position, (entries, embeds) in enumerate(parts):
+                try:
+                    await self.limiter.acquire(route)
+                    with DM_SEND_SECONDS.time():
+                        await resolver.send(discord_id, embeds=embeds)
+                    DMS_SENT.inc()
+                except Exception as e:
+                    # Only what hasn't gone out is retried, so the user never gets a message twice
+                    remaining = [entry for entries, _ in parts[position:] for entry in entries]
+                    await self._delivery_failed(discord_id, remaining, e, route)
+                    return
+
+                await mark_outbox_delivered_async([entry[0] for entry in entries], timestamp())
+                self.delivered += len(entries)
+                REMINDERS_DELIVERED.inc(len(entries))
+
+    # Give up on the entries or schedule their retry, depending on the error and how often they've failed
+    async def _delivery_failed(self, discord_id, entries, error, route):
+        outbox_ids = [entry[0] for entry in entries]
+        attempts = max(entry[5] for entry in entries)
+
+        if isinstance(error, (discord.Forbidden, discord.NotFound)):
+            # The user blocked the bot or no longer exists; retrying won't help
+            await mark_outbox_failed_async(outbox_ids, str(error), None)
+            self.failed += len(entries)
+            DM_FAILURES.labels("gave_up").inc(len(entries))
+            print(f"Giving up on reminders for user {discord_id}: {error}")
+            return
+
+        retry_after = rate_limit_delay(error)
+        if retry_after is not None:
+            self.limiter.rate_limited(route, retry_after, getattr(error, "is_global", False))
+            delay = retry_after
+        else:
+            delay = retry_delay(attempts)
+
+        if attempts + 1 >= OUTBOX_MAX_ATTEMPTS:
+            await mark_outbox_failed_async(outbox_ids, str(error), None)
+            self.failed += len(entries)
+            DM_FAILURES.labels("gave_up").inc(len(entries))
+            print(f"Giving up on reminders for user {discord_id} after {attempts + 1} attempts: {error}")
+        else:
+            next_attempt = timestamp(get_clock().now() + datetime.timedelta(seconds=delay))
+            await mark_outbox_failed_async(outbox_ids, str(error), next_attempt)
+            DM_FAILURES.labels("retry").inc(len(entries))
+            print(f"Error sending reminders to user {discord_id}, retrying at {next_attempt}: {error}")
+
+    def stats(self):
+        return {"delivered": self.delivered, "failed": self.failed, "rate_limited": self.limiter.limited}
+
+_worker = None
+
+# Start the outbox worker once, however many times the bot reconnects
+def start_outbox_worker(bot, fence=None):
+    global _worker
+    if _worker is None:
+        _worker = OutboxWorker(bot, fence=fence)
+    _worker.start()
+    return _worker
+
+def stop_outbox_worker():
+    if _worker is not None:
+        _worker.stop()
+
+# Wake the worker after queueing entries; a no-op until it has been started
+def notify_outbox():
+    if _worker is not None:
+        _worker.notify()
@@ -0,0 +1,114 @@
+# Paged embeds for long lists (reminders, assignments), loaded from the database one page at a time
+import os
+import discord
+from cache_utils import LRUCache, MISSING
+from database import get_user_reminders_page, get_user_assignments_page, add_user_data_listener
+from embed_utils import create_reminders_list_embed, create_stored_assignments_embed, copy_embed
+
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "10"))
+
+# Rendered pages are kept this long, so flicking back and forth doesn't touch the database
+PAGE_CACHE_SECONDS = int(os.getenv("PAGE_CACHE_SECONDS", "120"))
+
+# Buttons stop working (and are greyed out) after this long without a click
+VIEW_TIMEOUT_SECONDS = 300
+
+# For each kind of list: load(discord_id, after, limit) returning rows whose first column is the id,
+# the index of the due date column, and render(rows without the id) returning an embed
+PAGE_SOURCES = {
+    "reminders": (get_user_reminders_page, 2, create_reminders_list_embed),
+    "assignments": (get_user_assignments_page, 3, create_stored_assignments_embed)
+}
+
+# (kind, discord_id, generation, after) -> (embed, key the next page starts after, or None)
+page_cache = LRUCache(int(os.getenv("PAGE_CACHE_SIZE", "2048")), ttl=PAGE_CACHE_SECONDS)
+
+# Bumped whenever a user's data changes, so their cached pages are never served again
+_generations = {}
+
+def invalidate_pages(discord_id):
+    discord_id = str(discord_id)
+    _generations[discord_id] = _generations.get(discord_id, 0) + 1
+
+add_user_data_listener(invalidate_pages)
+
+def get_page(kind, discord_id, after=None):
+    """Return (embed, next_after) for the page of a user's list starting after the (due_date, id) key
+    `after`; next_after is None on the last page"""
+    key = (kind, discord_id, _generations.get(discord_id, 0), after)
+    page = page_cache.get(key)
+    if page is MISSING:
+        load, due_column, render = PAGE_SOURCES[kind]
+        # One extra row says whether there is a next page
+        rows = load(discord_id, after, PAGE_SIZE + 1)
+        next_after = (rows[PAGE_SIZE - 1][due_column], rows[PAGE_SIZE - 1][0]) if len(rows) > PAGE_SIZE else None
+        page = (render([row[1:] for row in rows[:PAGE_SIZE]]), next_after)
+        page_cache.put(key, page)
+    embed, next_after = page
+    return copy_embed(embed), next_after
+
+class PagedView(discord.ui.View):
+    """Previous/next buttons over a user's list, fetching each page as it's asked for.
+
+    Pages are addressed by the (due_date, id) key they start after, so moving on is one indexed
+    query however far in you are; the keys of pages already seen are kept for going back.
+    """
+
+    def __init__(self, kind, discord_id, title=None):
+        super().__init__(timeout=VIEW_TIMEOUT_SECONDS)
+        self.kind = kind
+        self.discord_id = str(discord_id)
+        self.title = title
+        self.starts = [None]
+        self.index = 0
+        self.next_after = None
+        # The message the view is attached to, for greying out the buttons when it times out
+        self.message = None
+
+    def render(self):
+        """Return the embed for the current page and update the buttons to match"""
+        embed, self.next_after = get_page(self.kind, self.discord_id, self.starts[self.index])
+        if self.title:
+            embed.title = self.title
+        if self.index or self.next_after:
+            embed.set_footer(text=f"ArborAlert • Page {self.index + 1}")
+        self.previous_page.disabled = self.index == 0
+        self.next_page.disabled = self.next_after is None
+        return embed
+
+    def first_page(self):
+        """Render the first page; a list that fits on one page gets no buttons"""
+        embed = self.render()
+        if self.next_after is None:
+            self.clear_items()
+        return embed
+
+    async def interaction_check(self, interaction):
+        return str(interaction.user.id) == self.discord_id
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction, button):
+        self.index -= 1
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.primary)
+    async def next_page(self, interaction, button):
+        if self.index + 1 == len(self.starts):
+            self.starts.append(self.next_after)
+        self.index += 1
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    async def on_timeout(self):
+        if self.message is None or not self.children:
+            return
+        for item in self.children:
+            item.disabled = True
+        try:
+            await self.message.edit(view=self)
+        except discord.HTTPException:
+            pass
+
+# The first page of a user's list, with the view that pages through the rest
+def paged_message(kind, discord_id, title=None):
+    view = PagedView(kind, discord_id, title)
+    return view.first_page(), view
@@ -1,17 +1,28 @@
 import datetime
 import asyncio
-import schedule
-import time
-from threading import Thread
-from database import get_due_reminders, mark_reminder_sent, get_all_users
+import heapq
+import os
+from clock import get_clock
+from database import (
+    get_all_users, get_pending_reminders, get_pending_reminder_dates, add_reminder_listener,
+    get_setting, set_setting_async, enqueue_outbox_async
+)
 from arbor_processor import process_arbor_data
-from embed_utils import create_reminder_embed
+from maintenance import run_maintenance
+from outbox import notify_outbox, timestamp, start_outbox_worker, stop_outbox_worker
+from scheduler import get_scheduler
+from metrics import get_metrics
 
-# Function to run the scheduler
-def run_scheduler():
-    while True:
-        schedule.run_pending()
-        time.sleep(60)  # Check every minute
+REMINDERS_QUEUED = get_metrics().counter(
+    "arboralert_reminders_queued_total", "Due reminders handed to the outbox for delivery"
+)
+REMINDER_ERRORS = get_metrics().counter(
+    "arboralert_reminder_errors_total", "Errors in the daily fetch and reminder dispatcher, by job", ("job",)
+)
+
+# When the daily jobs run (cron expressions)
+DAILY_FETCH_CRON = os.getenv("DAILY_FETCH_CRON", "0 7 * * *")
+MAINTENANCE_CRON = os.getenv("MAINTENANCE_CRON", "0 3 * * *")
 
 # Schedule daily fetch for all users
 def schedule_daily_fetch():
@@ -22,42 +33,159 @@ def schedule_daily_fetch():
         try:
             process_arbor_data(discord_id)
         except Exception as e:
+            REMINDER_ERRORS.labels("daily_fetch").inc()
             print(f"Error fetching data for user {discord_id}: {e}")
 
-# Initialize scheduler
+# Initialize scheduler (safe to call on every reconnect; jobs are registered once by name)
 def init_scheduler():
-    # Schedule the daily fetch at 7 AM
-    schedule.every().day.at("07:00").do(schedule_daily_fetch)
+    scheduler = get_scheduler()
+    
+    # Schedule the daily fetch at 7 AM; scraping blocks, so it runs in an executor
+    scheduler.add_cron("daily_fetch", DAILY_FETCH_CRON, schedule_daily_fetch, blocking=True)
     
-    # Start the scheduler in a separate thread
-    scheduler_thread = Thread(target=run_scheduler)
-    scheduler_thread.daemon = True
-    scheduler_thread.start()
-
-# Background task to check for reminders
-async def check_reminders(bot):
-    while True:
+    # Prune old sent reminders and compact the database overnight
+    scheduler.add_cron("maintenance", MAINTENANCE_CRON, run_maintenance, blocking=True)
+    
+    scheduler.start()
+    return scheduler
+
+# Time of day reminders go out on their reminder date (HH:MM)
+REMINDER_TIME = os.getenv("REMINDER_TIME", "00:00")
+
+# Setting holding the first reminder date that may still have undelivered reminders
+HIGH_WATER_MARK_KEY = "reminder_high_water_mark"
+
+# Longest single sleep, so wall-clock jumps (DST, NTP) can't strand the dispatcher
+MAX_SLEEP_SECONDS = 3600
+
+# When reminders for a given reminder date are due
+def reminder_due_time(reminder_date):
+    hour, minute = (int(part) for part in REMINDER_TIME.split(":"))
+    return datetime.datetime.strptime(reminder_date, '%Y-%m-%d').replace(hour=hour, minute=minute)
+
+class ReminderDispatcher:
+    """Sleeps until the next reminder is due instead of polling the table.
+
+    Keeps a min-heap of upcoming reminder due times, woken early whenever a reminder is added
+    or changed. Each wake-up queues everything pending between the stored high-water mark and
+    today in the outbox, which also catches up on reminders missed while the bot was down.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._heap = []
+        self._scheduled = set()
+        self._wakeup = None
+        self._loop = None
+        self._task = None
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        add_reminder_listener(self.notify)
+        self._task = self._loop.create_task(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._heap = []
+        self._scheduled = set()
+
+    # Called from any thread whenever a reminder date is added or changed
+    def notify(self, reminder_date):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._schedule, reminder_date)
+
+    def _schedule(self, reminder_date):
+        if reminder_date in self._scheduled:
+            return
+        self._scheduled.add(reminder_date)
+        heapq.heappush(self._heap, (reminder_due_time(reminder_date), reminder_date))
+        self._wakeup.set()
+
+    async def run(self):
+        # Catch up on anything missed since the last run, then schedule what's left
+        await self.dispatch_due()
+        for reminder_date in get_pending_reminder_dates(get_clock().today()):
+            self._schedule(reminder_date)
+
+        while True:
+            try:
+                now = get_clock().now()
+                if self._heap and self._heap[0][0] <= now:
+                    while self._heap and self._heap[0][0] <= now:
+                        _, reminder_date = heapq.heappop(self._heap)
+                        self._scheduled.discard(reminder_date)
+                    await self.dispatch_due()
+                    continue
+
+                self._wakeup.clear()
+                timeout = MAX_SLEEP_SECONDS
+                if self._heap:
+                    timeout = min((self._heap[0][0] - now).total_seconds(), MAX_SLEEP_SECONDS)
+                await get_clock().wait(self._wakeup, timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                REMINDER_ERRORS.labels("dispatcher").inc()
+                print(f"Error in reminder dispatcher: {e}")
+                await get_clock().sleep(60)
+
+    # Queue every unsent reminder that is due, from the high-water mark up to now
+    async def dispatch_due(self):
+        now = get_clock().now()
+        today = now.strftime('%Y-%m-%d')
+        # Today's reminders only count once their time of day has arrived
+        last_due_date = today if reminder_due_time(today) <= now else (now - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+        start_date = get_setting(HIGH_WATER_MARK_KEY) or last_due_date
+        if start_date > last_due_date:
+            return
+
         try:
-            today = datetime.datetime.now().strftime('%Y-%m-%d')
-            
-            # Get reminders due today
-            reminders = get_due_reminders(today)
-            
-            for discord_id, assignment, due_date in reminders:
-                try:
-                    user = await bot.fetch_user(int(discord_id))
-                    
-                    # Create a rich embed for the reminder
-                    embed = create_reminder_embed(assignment, due_date)
-                    await user.send(embed=embed)
-                    
-                    # Mark reminder as sent
-                    mark_reminder_sent(discord_id, assignment, due_date)
-                except Exception as e:
-                    print(f"Error sending reminder to user {discord_id}: {e}")
-            
+            reminders = get_pending_reminders(start_date, last_due_date)
         except Exception as e:
+            REMINDER_ERRORS.labels("dispatcher").inc()
             print(f"Error checking reminders: {e}")
-        
-        # Check every hour
-        await asyncio.sleep(3600)
\ No newline at end of file
+            return
+
+        # Hand the reminders to the outbox; the key stops a reminder being queued twice for the same date
+        entries = [
+            (f"reminder:{reminder_id}:{reminder_date}", reminder_id, discord_id, assignment, due_date)
+            for reminder_id, discord_id, assignment, due_date, reminder_date in reminders
+            # Reminders for work that is already due are no use any more
+            if due_date >= today
+        ]
+        if entries:
+            await enqueue_outbox_async(entries, timestamp(now))
+            REMINDERS_QUEUED.inc(len(entries))
+            notify_outbox()
+
+        await set_setting_async(HIGH_WATER_MARK_KEY, last_due_date)
+
+_dispatcher = None
+
+# Start the reminder dispatcher once, however many times the bot reconnects
+def start_reminder_dispatcher(bot):
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = ReminderDispatcher(bot)
+    _dispatcher.start()
+    return _dispatcher
+
+def stop_reminder_dispatcher():
+    if _dispatcher is not None:
+        _dispatcher.stop()
+
+# Start everything that must only run on one replica: scheduled jobs, the dispatcher and the outbox
+def start_background_jobs(bot, fence=None):
+    init_scheduler()
+    start_outbox_worker(bot, fence)
+    start_reminder_dispatcher(bot)
+
+def stop_background_jobs():
+    get_scheduler().stop()
+    stop_reminder_dispatcher()
+    stop_outbox_worker()
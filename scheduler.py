@@ -0,0 +1,245 @@
+# Job scheduler running on the bot's event loop
+import asyncio
+import datetime
+import heapq
+import inspect
+import itertools
+from clock import get_clock
+from database import get_setting, set_setting_async
+
+# Longest single sleep, so wall-clock jumps (DST, NTP) can't strand the scheduler
+MAX_SLEEP_SECONDS = 3600
+
+# Setting holding when a job last ran
+LAST_RUN_KEY = "job_last_run:{}"
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+class CronSchedule:
+    """Five-field cron expression: minute hour day-of-month month day-of-week.
+
+    Fields accept *, numbers, ranges (1-5), lists (1,3,5) and steps (*/15, 0-30/10). Day of week
+    runs 0-6 from Sunday (7 is also Sunday). As in cron, when both day fields are restricted a
+    day matches if either does.
+    """
+
+    FIELDS = [("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7)]
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron expression needs 5 fields, got {len(parts)}: '{expression}'")
+        self.expression = expression
+        values = [self._parse_field(part, low, high) for part, (_, low, high) in zip(parts, self.FIELDS)]
+        self.minutes, self.hours, self.days, self.months, self.weekdays = values
+        # Sunday can be written as 0 or 7
+        if 7 in self.weekdays:
+            self.weekdays = (self.weekdays - {7}) | {0}
+        self.any_day = parts[2] == "*"
+        self.any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _parse_field(field, low, high):
+        values = set()
+        for item in field.split(","):
+            range_part, _, step = item.partition("/")
+            step = int(step) if step else 1
+            if range_part == "*":
+                start, end = low, high
+            elif "-" in range_part:
+                start, end = (int(value) for value in range_part.split("-", 1))
+            else:
+                start = int(range_part)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"Invalid cron field '{field}' (allowed {low}-{high})")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, date):
+        day = date.day in self.days
+        # Python counts Monday as 0, cron counts Sunday as 0
+        weekday = (date.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return weekday
+        if self.any_weekday:
+            return day
+        return day or weekday
+
+    def next_after(self, after):
+        """First matching minute strictly after the given datetime"""
+        candidate = after.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        # Searching day by day is bounded; five years covers every valid expression (Feb 29 included)
+        for _ in range(366 * 5):
+            if candidate.month in self.months and self._day_matches(candidate):
+                for hour in sorted(h for h in self.hours if h >= candidate.hour):
+                    first_minute = candidate.minute if hour == candidate.hour else 0
+                    for minute in sorted(m for m in self.minutes if m >= first_minute):
+                        return candidate.replace(hour=hour, minute=minute)
+            candidate = (candidate + datetime.timedelta(days=1)).replace(hour=0, minute=0)
+        raise ValueError(f"Cron expression never matches: '{self.expression}'")
+
+    def __repr__(self):
+        return f"cron({self.expression})"
+
+class IntervalSchedule:
+    """Runs every `seconds` seconds"""
+
+    def __init__(self, seconds):
+        if seconds <= 0:
+            raise ValueError("Interval must be positive")
+        self.interval = datetime.timedelta(seconds=seconds)
+
+    def next_after(self, after):
+        return after + self.interval
+
+    def __repr__(self):
+        return f"every {self.interval.total_seconds():g}s"
+
+class Job:
+    def __init__(self, name, func, trigger, blocking=False, catch_up=True):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.blocking = blocking
+        self.catch_up = catch_up
+        self.next_run = None
+        self.last_run = None
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+
+class JobScheduler:
+    """Runs cron-style and interval jobs on the event loop.
+
+    Jobs are registered once by name; registering the same name again is a no-op, so reconnects
+    can't pile up duplicates. Each job's last run is kept in the settings table, and a run that was
+    missed while the bot was down is made up once at startup. Blocking jobs run in the default
+    executor so they never stall the loop.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._wakeup = None
+        self._loop = None
+        self._task = None
+        # Job runs in progress; the event loop only holds weak references to tasks
+        self._runs = set()
+
+    def add_cron(self, name, expression, func, blocking=False, catch_up=True):
+        return self.add_job(Job(name, func, CronSchedule(expression), blocking, catch_up))
+
+    def add_interval(self, name, seconds, func, blocking=False, catch_up=True):
+        return self.add_job(Job(name, func, IntervalSchedule(seconds), blocking, catch_up))
+
+    def add_job(self, job):
+        if job.name in self.jobs:
+            return self.jobs[job.name]
+        self.jobs[job.name] = job
+        if self._task is not None:
+            self._plan(job, get_clock().now())
+        return job
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        now = get_clock().now()
+        self._heap = []
+        for job in self.jobs.values():
+            # A run left going by stop() puts its job on this heap itself when it finishes
+            if not job.running:
+                self._plan(job, now)
+        self._task = self._loop.create_task(self.run())
+
+    # Stop scheduling runs; a job already running is left to finish
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # Work out a job's first run from its stored last run
+    def _plan(self, job, now):
+        last_run = get_setting(LAST_RUN_KEY.format(job.name))
+        if last_run:
+            job.last_run = datetime.datetime.strptime(last_run, TIMESTAMP_FORMAT)
+            next_run = job.trigger.next_after(job.last_run)
+            if next_run <= now and job.catch_up:
+                # Missed while offline: run once now rather than once per missed slot
+                next_run = now
+            elif next_run <= now:
+                next_run = job.trigger.next_after(now)
+        else:
+            next_run = job.trigger.next_after(now)
+        self._push(job, next_run)
+
+    def _push(self, job, next_run):
+        job.next_run = next_run
+        heapq.heappush(self._heap, (next_run, next(self._sequence), job.name))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self):
+        while True:
+            try:
+                now = get_clock().now()
+                if self._heap and self._heap[0][0] <= now:
+                    _, _, name = heapq.heappop(self._heap)
+                    job = self.jobs[name]
+                    task = self._loop.create_task(self._run_job(job))
+                    self._runs.add(task)
+                    task.add_done_callback(self._runs.discard)
+                    continue
+
+                self._wakeup.clear()
+                timeout = MAX_SLEEP_SECONDS
+                if self._heap:
+                    timeout = min((self._heap[0][0] - now).total_seconds(), MAX_SLEEP_SECONDS)
+                await get_clock().wait(self._wakeup, timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in job scheduler: {e}")
+                await get_clock().sleep(60)
+
+    async def _run_job(self, job):
+        # A job is only back on the heap once its previous run has finished, and start() doesn't
+        # plan a job that is still running, so runs never overlap
+        started = get_clock().now()
+        job.running = True
+        try:
+            if job.blocking:
+                result = await self._loop.run_in_executor(None, job.func)
+            else:
+                result = job.func()
+            if inspect.isawaitable(result):
+                await result
+            job.runs += 1
+        except Exception as e:
+            job.failures += 1
+            print(f"Error running scheduled job '{job.name}': {e}")
+        finally:
+            job.last_run = started
+            try:
+                await set_setting_async(LAST_RUN_KEY.format(job.name), started.strftime(TIMESTAMP_FORMAT))
+            except Exception as e:
+                print(f"Error saving last run of job '{job.name}': {e}")
+            self._push(job, job.trigger.next_after(max(started, get_clock().now())))
+            # Only now, so a restart while the last run is being saved doesn't plan the job as well
+            job.running = False
+
+    def stats(self):
+        return {
+            name: {"schedule": repr(job.trigger), "next_run": job.next_run, "last_run": job.last_run,
+                   "runs": job.runs, "failures": job.failures}
+            for name, job in self.jobs.items()
+        }
+
+_scheduler = JobScheduler()
+
+# The process-wide scheduler
+def get_scheduler():
+    return _scheduler
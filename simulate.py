@@ -0,0 +1,311 @@
+# Time-warp simulation of the reminder dispatcher, outbox and daily fetch over a school term
+#
+# Replays synthetic users and assignments against the real scheduling code with a simulated clock,
+# then reports reminder delivery latency, missed and duplicate reminders, and storage cost per day.
+#
+#   python simulate.py --users 200 --days 84
+import argparse
+import asyncio
+import collections
+import contextlib
+import datetime
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+from cryptography.fernet import Fernet
+
+# database.py builds its cipher at import time
+os.environ.setdefault("KEY", Fernet.generate_key().decode())
+
+import database
+from clock import SimulatedClock, set_clock
+from storage import create_storage
+from scheduler import get_scheduler, CronSchedule
+from arbor_processor import process_text
+from maintenance import run_maintenance
+from outbox import start_outbox_worker
+from reminder_system import (
+    init_scheduler, start_reminder_dispatcher, reminder_due_time, DAILY_FETCH_CRON, MAINTENANCE_CRON
+)
+
+SUBJECTS = {
+    "Ar": "Art", "Ma": "Maths", "En": "English", "Sc": "Science", "Hi": "History",
+    "Gg": "Geography", "Fr": "French", "Pc": "Computing", "Mu": "Music", "Dt": "Design"
+}
+FORMS = [f"{year}{form}" for year in range(7, 12) for form in "XY"]
+
+# How long an overdue assignment stays on a student's Arbor list
+OVERDUE_DAYS = 7
+
+# Simulated time allowed after the last day for in-flight deliveries to finish
+DRAIN_SECONDS = 3600
+
+class CountingStorage:
+    """Storage proxy that counts calls and time spent per method, and watches outbox deliveries"""
+
+    def __init__(self, backend, clock):
+        self.backend = backend
+        self.clock = clock
+        self.calls = collections.Counter()
+        self.seconds = collections.Counter()
+        # outbox id -> (discord_id, assignment_name, due_date), and (outbox id, delivered at) pairs
+        self.outbox_entries = {}
+        self.deliveries = []
+        # Writes from coroutines still waiting on the writer thread
+        self.pending_writes = 0
+        self._wrappers = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self.backend, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+        if name not in self._wrappers:
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    result = attr(*args, **kwargs)
+                finally:
+                    self.calls[name] += 1
+                    self.seconds[name] += time.perf_counter() - started
+                self._observe(name, args, result)
+                return result
+            self._wrappers[name] = wrapper
+        return self._wrappers[name]
+
+    # Writes made from coroutines are counted and watched like any other call
+    async def write_async(self, method, *args):
+        started = time.perf_counter()
+        self.pending_writes += 1
+        try:
+            result = await self.backend.write_async(method, *args)
+        finally:
+            self.pending_writes -= 1
+            self.calls[method] += 1
+            self.seconds[method] += time.perf_counter() - started
+        self._observe(method, args, result)
+        return result
+
+    def _observe(self, name, args, result):
+        if name == "get_ready_outbox":
+            for outbox_id, _, discord_id, assignment_name, due_date, _ in result:
+                self.outbox_entries[outbox_id] = (discord_id, assignment_name, due_date)
+        elif name == "mark_outbox_delivered":
+            self.deliveries.extend((outbox_id, self.clock.now()) for outbox_id in args[0])
+
+    def totals(self):
+        return sum(self.calls.values()), sum(self.seconds.values())
+
+class FakeChannel:
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def send(self, *args, **kwargs):
+        self.bot.messages += 1
+
+class FakeUser:
+    def __init__(self, bot, discord_id):
+        self.id = discord_id
+        self.dm_channel = FakeChannel(bot)
+
+class FakeBot:
+    """Just enough of discord.Client for the outbox to DM users"""
+
+    def __init__(self):
+        self.messages = 0
+        self._users = {}
+
+    def get_user(self, discord_id):
+        if discord_id not in self._users:
+            self._users[discord_id] = FakeUser(self, discord_id)
+        return self._users[discord_id]
+
+    async def fetch_user(self, discord_id):
+        return self.get_user(discord_id)
+
+# Assignments set for every class over the term: {class_code: [(title, set_on, due_on)]}
+def generate_assignments(rng, start, days):
+    assignments = {}
+    for form in FORMS:
+        for code, subject in SUBJECTS.items():
+            class_code = f"{form}/{code}"
+            tasks = []
+            for week in range(0, days, 7):
+                for _ in range(rng.randint(0, 2)):
+                    set_on = start + datetime.timedelta(days=week + rng.randint(0, 4))
+                    due_on = set_on + datetime.timedelta(days=rng.randint(2, 14))
+                    tasks.append((f"{subject} task {len(tasks) + 1}", set_on, due_on))
+            assignments[class_code] = tasks
+    return assignments
+
+# The homework section of a student's Arbor page as it looks on the given day
+def arbor_page(user_classes, assignments, today):
+    overdue, upcoming = [], []
+    for class_code in user_classes:
+        for title, set_on, due_on in assignments[class_code]:
+            if set_on > today or today > due_on + datetime.timedelta(days=OVERDUE_DAYS):
+                continue
+            line = f"{class_code}: {title}  (Due {due_on.strftime('%d %b %Y')})"
+            (overdue if due_on < today else upcoming).append(line)
+    return "\n".join(["Overdue Assignments", *overdue, "Assignments that are due", *upcoming, "Submitted Assignments"])
+
+# When a student's reminder for an assignment due on `due_on` goes out
+def reminder_time(reminder_days, due_on):
+    reminder_date = due_on - datetime.timedelta(days=reminder_days)
+    return reminder_due_time(reminder_date.strftime('%Y-%m-%d'))
+
+# Reminders the bot should send before `end`: {(discord_id, assignment_name, due_date): due time}
+def expected_reminders(users, assignments, fetch_times, end):
+    expected = {}
+    for discord_id, (user_classes, reminder_days) in users.items():
+        for class_code in user_classes:
+            for title, set_on, due_on in assignments[class_code]:
+                reminder_midnight = datetime.datetime.combine(due_on - datetime.timedelta(days=reminder_days), datetime.time())
+                # A reminder is only scheduled by a fetch that sees the assignment before its reminder date
+                if not any(set_on <= fetch.date() and fetch < reminder_midnight for fetch in fetch_times):
+                    continue
+                due_time = reminder_time(reminder_days, due_on)
+                if due_time < end:
+                    expected[(discord_id, f"{class_code}: {title}", due_on.strftime('%Y-%m-%d'))] = due_time
+    return expected
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+async def simulate(args):
+    rng = random.Random(args.seed)
+    start = datetime.datetime.strptime(args.start, '%Y-%m-%d')
+    end = start + datetime.timedelta(days=args.days)
+
+    clock = SimulatedClock(start)
+    set_clock(clock)
+    if args.backend == "sqlite":
+        os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="arbor-sim-"), "sim.db")
+    storage = CountingStorage(create_storage(args.backend), clock)
+    clock.busy = lambda: storage.pending_writes > 0
+    database.use_storage(storage)
+    database.init_db()
+    database.add_reminder_days_column()
+
+    # Synthetic students: a form's classes each, with their own reminder preference
+    assignments = generate_assignments(rng, start.date(), args.days)
+    users = {}
+    for n in range(args.users):
+        discord_id = str(100000 + n)
+        form = rng.choice(FORMS)
+        users[discord_id] = ([f"{form}/{code}" for code in SUBJECTS], rng.choice([1, 1, 2, 3]))
+        database.save_user_credentials(discord_id, f"student{n}@school.test", "password")
+        database.set_reminder_days(discord_id, users[discord_id][1])
+
+    # Stand-in for the Selenium scrape: feed each student's page for the simulated day to the real parser
+    def simulated_fetch():
+        today = clock.now().date()
+        for discord_id, (user_classes, _) in users.items():
+            process_text(arbor_page(user_classes, assignments, today), discord_id)
+
+    # Registered first so init_scheduler's real jobs of the same names are ignored; both run inline
+    scheduler = get_scheduler()
+    scheduler.add_cron("daily_fetch", DAILY_FETCH_CRON, simulated_fetch)
+    scheduler.add_cron("maintenance", MAINTENANCE_CRON, run_maintenance)
+
+    bot = FakeBot()
+    output = io.StringIO()
+    daily = []
+    wall_started = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else output):
+        init_scheduler()
+        start_outbox_worker(bot)
+        start_reminder_dispatcher(bot)
+        for day in range(args.days):
+            calls_before, seconds_before = storage.totals()
+            deliveries_before, messages_before = len(storage.deliveries), bot.messages
+            day_started = time.perf_counter()
+            await clock.advance_to(start + datetime.timedelta(days=day + 1))
+            calls_after, seconds_after = storage.totals()
+            daily.append({
+                "date": (start + datetime.timedelta(days=day)).strftime('%Y-%m-%d'),
+                "reminders": len(storage.deliveries) - deliveries_before,
+                "messages": bot.messages - messages_before,
+                "db_calls": calls_after - calls_before,
+                "db_ms": (seconds_after - seconds_before) * 1000,
+                "wall_ms": (time.perf_counter() - day_started) * 1000
+            })
+        await clock.advance(DRAIN_SECONDS)
+    wall_seconds = time.perf_counter() - wall_started
+
+    # Compare what was delivered against what should have been
+    fetch_times = []
+    cron = CronSchedule(DAILY_FETCH_CRON)
+    fetch = cron.next_after(start - datetime.timedelta(minutes=1))
+    while fetch < end:
+        fetch_times.append(fetch)
+        fetch = cron.next_after(fetch)
+    expected = expected_reminders(users, assignments, fetch_times, end)
+
+    # Only judge reminders that fell due inside the simulated window
+    delivered = collections.defaultdict(list)
+    for outbox_id, delivered_at in storage.deliveries:
+        key = storage.outbox_entries[outbox_id]
+        if reminder_time(users[key[0]][1], datetime.datetime.strptime(key[2], '%Y-%m-%d').date()) < end:
+            delivered[key].append(delivered_at)
+
+    missed = [key for key in expected if key not in delivered]
+    duplicates = [key for key, times in delivered.items() if len(times) > 1]
+    unexpected = [key for key in delivered if key not in expected]
+    latencies = [
+        (times[0] - expected[key]).total_seconds() for key, times in delivered.items() if key in expected
+    ]
+
+    print(f"{'date':<12}{'reminders':>10}{'DMs':>7}{'db calls':>10}{'db ms':>9}{'wall ms':>9}")
+    for row in daily:
+        print(
+            f"{row['date']:<12}{row['reminders']:>10}{row['messages']:>7}{row['db_calls']:>10}"
+            f"{row['db_ms']:>9.1f}{row['wall_ms']:>9.1f}"
+        )
+
+    total_calls, total_seconds = storage.totals()
+    print()
+    print(f"Simulated {args.days} days for {args.users} users ({args.backend}) in {wall_seconds:.1f}s")
+    print(f"Reminders expected: {len(expected)}, delivered: {len(delivered)}, DMs sent: {bot.messages}")
+    print(f"Missed: {len(missed)}, duplicates: {len(duplicates)}, unexpected: {len(unexpected)}")
+    print(
+        f"Delivery latency: p50 {percentile(latencies, 0.5):.1f}s, p95 {percentile(latencies, 0.95):.1f}s, "
+        f"max {max(latencies, default=0):.1f}s"
+    )
+    print(
+        f"DB cost per day: {total_calls / args.days:.0f} calls, {total_seconds * 1000 / args.days:.1f} ms"
+    )
+    print("Busiest storage methods: " + ", ".join(
+        f"{name} ({count})" for name, count in storage.calls.most_common(5)
+    ))
+    errors = [line for line in output.getvalue().splitlines() if "Error" in line]
+    if errors:
+        print(f"{len(errors)} error line(s) logged, first: {errors[0]}")
+    for key in missed[:5]:
+        print(f"  missed: {key}")
+    for key in unexpected[:5]:
+        print(f"  unexpected: {key}")
+    for key in duplicates[:5]:
+        print(f"  duplicate: {key}")
+
+    return 1 if missed or duplicates else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a term of reminders against simulated time")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--days", type=int, default=84)
+    parser.add_argument("--start", default="2026-09-07", help="first simulated day (YYYY-MM-DD)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's own log output")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(simulate(args)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1547 @@
+# Storage backends for ArborAlert
+import asyncio
+import contextvars
+import os
+import re
+import sqlite3
+import threading
+import datetime
+import time
+from db_writer import DBWriter
+from clock import get_clock
+from metrics import get_metrics
+
+# Columns each table is expected to have, used by the in-memory backend and diagnostics
+TABLE_COLUMNS = {
+    "users": {"id", "discord_id", "username", "password", "reminder_days"},
+    "reminders": {"id", "discord_id", "assignment_name", "due_date", "reminder_date", "sent"},
+    "settings": {"key", "value"},
+    "reminders_archive": {"id", "discord_id", "assignment_name", "due_date", "reminder_date", "archived_at"},
+    "assignment_catalog": {"id", "subject_code", "title", "due_date"},
+    "user_assignments": {
+        "id", "discord_id", "assignment_id", "status", "first_seen", "last_seen", "reminder_date", "sent"
+    },
+    "reminder_outbox": {
+        "id", "idempotency_key", "reminder_id", "discord_id", "assignment_name", "due_date", "status",
+        "attempts", "next_attempt_at", "last_error", "created_at", "delivered_at"
+    },
+    "leases": {"name", "holder", "token", "expires_at"}
+}
+
+# Assignments that drop off a user's Arbor list are kept with this status
+COMPLETED_STATUS = "completed"
+
+# Outbox entry states
+OUTBOX_PENDING = "pending"
+OUTBOX_DELIVERED = "delivered"
+OUTBOX_FAILED = "failed"
+
+# SQLite query time by kind; children are held directly so the hot path skips the label lookup
+DB_QUERY_SECONDS = get_metrics().histogram(
+    "arboralert_db_query_seconds", "Time taken by SQLite queries, by kind (read, write)", ("kind",)
+)
+READ_TIMER = DB_QUERY_SECONDS.labels("read")
+WRITE_TIMER = DB_QUERY_SECONDS.labels("write")
+
+# Set by SQLiteStorage.write_async: queued writes' futures are collected here instead of waited on
+_deferred_writes = contextvars.ContextVar("deferred_writes", default=None)
+
+# Subject codes look like "7X/Ar"
+SUBJECT_CODE_PATTERN = re.compile(r'^[\w\d]+/[\w\d]+$')
+
+# Split "7X/Ar: Mask evaluation" into ("7X/Ar", "Mask evaluation"); names without a code get ""
+def split_assignment_name(assignment_name):
+    subject_code, separator, title = assignment_name.partition(':')
+    if separator and SUBJECT_CODE_PATTERN.match(subject_code.strip()):
+        return subject_code.strip(), title.strip()
+    return "", assignment_name
+
+# Inverse of split_assignment_name
+def join_assignment_name(subject_code, title):
+    return f"{subject_code}: {title}" if subject_code else title
+
+# Rank (subject_code, title, due_date, status) rows by how many search terms prefix a word in them.
+# Used where there is no full-text index; words in the title count double.
+def rank_search_matches(rows, terms, limit):
+    scored = []
+    for row in rows:
+        title_words = re.findall(r"\w+", row[1].lower())
+        code_words = re.findall(r"\w+", row[0].lower())
+        score = sum(
+            2 if any(word.startswith(term) for word in title_words) else
+            1 if any(word.startswith(term) for word in code_words) else 0
+            for term in terms
+        )
+        if score:
+            scored.append((-score, row[2], row))
+    scored.sort(key=lambda item: item[:2])
+    return [row for _, _, row in scored[:limit]]
+
+class StorageBackend:
+    """Interface for everything ArborAlert persists: users, credentials, reminders and settings"""
+
+    name = "base"
+
+    def init_schema(self):
+        """Create any missing tables"""
+        raise NotImplementedError
+
+    def migrate(self):
+        """Bring an existing schema up to date"""
+        raise NotImplementedError
+
+    # Users and credentials
+    def get_user(self, discord_id):
+        """Return (username, encrypted_password, reminder_days) or None"""
+        raise NotImplementedError
+
+    def save_user(self, discord_id, username, encrypted_password):
+        """Insert a user or update the credentials of an existing one"""
+        raise NotImplementedError
+
+    def delete_user(self, discord_id):
+        """Delete a user together with all their reminders and assignment links"""
+        raise NotImplementedError
+
+    def set_reminder_days(self, discord_id, days_before):
+        raise NotImplementedError
+
+    def list_user_ids(self):
+        raise NotImplementedError
+
+    def count_users(self):
+        raise NotImplementedError
+
+    # Reminders
+    def add_reminder(self, discord_id, assignment_name, due_date, reminder_date):
+        raise NotImplementedError
+
+    def get_user_reminders(self, discord_id):
+        """Return unsent (assignment_name, due_date, reminder_date) rows ordered by due date"""
+        raise NotImplementedError
+
+    def get_user_reminders_page(self, discord_id, after=None, limit=10):
+        """Return up to limit unsent (id, assignment_name, due_date, reminder_date) rows ordered by
+        (due_date, id), starting after the (due_date, id) key `after`"""
+        raise NotImplementedError
+
+    def clear_user_reminders(self, discord_id):
+        """Cancel a user's unsent reminders"""
+        raise NotImplementedError
+
+    def delete_reminder(self, discord_id, assignment_name):
+        raise NotImplementedError
+
+    def get_due_reminders(self, date):
+        """Return unsent (discord_id, assignment_name, due_date) rows with the given reminder date"""
+        raise NotImplementedError
+
+    def mark_reminder_sent(self, discord_id, assignment_name, due_date):
+        raise NotImplementedError
+
+    def mark_reminders_sent(self, reminder_ids):
+        """Mark a group of reminders (by id) as sent in one statement"""
+        raise NotImplementedError
+
+    def get_pending_reminders(self, start_date, end_date):
+        """Return unsent (id, discord_id, assignment_name, due_date, reminder_date) rows with
+        start_date <= reminder_date <= end_date"""
+        raise NotImplementedError
+
+    def get_pending_reminder_dates(self, start_date):
+        """Return the distinct reminder dates of unsent reminders on or after start_date, in order"""
+        raise NotImplementedError
+
+    def count_reminders(self, discord_id=None, sent=None):
+        raise NotImplementedError
+
+    # Assignments
+    def sync_assignments(self, discord_id, assignments, seen_at):
+        """Record a scrape: upsert (subject_code, title, due_date, status) rows and mark missing ones completed"""
+        raise NotImplementedError
+
+    def get_user_assignments(self, discord_id, include_completed=False):
+        """Return (subject_code, title, due_date, status) rows ordered by due date"""
+        raise NotImplementedError
+
+    def query_assignments(self, discord_id, start_date=None, end_date=None, include_completed=False):
+        """Return (subject_code, title, due_date, status) rows due between the dates (inclusive, either may be None)"""
+        raise NotImplementedError
+
+    def get_user_assignments_page(self, discord_id, after=None, limit=10, include_completed=False):
+        """Return up to limit (id, subject_code, title, due_date, status) rows ordered by (due_date, id),
+        starting after the (due_date, id) key `after`"""
+        raise NotImplementedError
+
+    def search_assignments(self, discord_id, terms, limit=10, include_completed=False):
+        """Return the user's (subject_code, title, due_date, status) rows best matching any of the
+        lowercase search terms, each matched as a word prefix"""
+        raise NotImplementedError
+
+    def get_assignments_synced_at(self, discord_id):
+        """Return when the user's assignments were last synced, or None"""
+        return self.get_setting(f"assignments_synced_at:{discord_id}")
+
+    # Reminder outbox
+    def enqueue_outbox(self, entries, created_at):
+        """Queue (idempotency_key, reminder_id, discord_id, assignment_name, due_date) entries for delivery,
+        ignoring keys that were queued before; return how many were added"""
+        raise NotImplementedError
+
+    def get_ready_outbox(self, now, limit=100):
+        """Return pending (id, reminder_id, discord_id, assignment_name, due_date, attempts) entries
+        whose next attempt is due, oldest first with each user's entries together"""
+        raise NotImplementedError
+
+    def get_next_outbox_attempt(self):
+        """Return the earliest next_attempt_at of any pending entry, or None"""
+        raise NotImplementedError
+
+    def claim_outbox(self, outbox_ids, now, claimed_until, fence=None):
+        """Claim ready entries for sending by pushing their next attempt to claimed_until; return the ids
+        claimed. With a (lease name, token) fence nothing is claimed unless that token still holds the lease."""
+        raise NotImplementedError
+
+    def mark_outbox_delivered(self, outbox_ids, delivered_at):
+        """Mark entries delivered and their reminders sent, in one transaction"""
+        raise NotImplementedError
+
+    def mark_outbox_failed(self, outbox_ids, error, next_attempt_at):
+        """Record a failed attempt; a next_attempt_at of None gives up on the entries for good"""
+        raise NotImplementedError
+
+    def count_outbox(self, status=None):
+        raise NotImplementedError
+
+    def purge_outbox(self, before):
+        """Delete delivered and failed entries created before the given timestamp; return the row count"""
+        raise NotImplementedError
+
+    # Leases
+    def acquire_lease(self, name, holder, now, expires_at):
+        """Take or renew a lease; return its fencing token, or None if someone else holds it.
+        The token goes up every time the lease changes hands."""
+        raise NotImplementedError
+
+    def release_lease(self, name, holder):
+        """Give up a lease early so another holder can take it straight away"""
+        raise NotImplementedError
+
+    def get_lease(self, name):
+        """Return (holder, token, expires_at) or None"""
+        raise NotImplementedError
+
+    # Settings
+    def get_setting(self, key, default=None):
+        raise NotImplementedError
+
+    def set_setting(self, key, value):
+        raise NotImplementedError
+
+    # Diagnostics
+    def get_table_columns(self, table):
+        """Return the set of column names of a table (empty if it doesn't exist)"""
+        raise NotImplementedError
+
+    def count_orphaned_reminders(self):
+        """Count reminders whose user no longer exists"""
+        raise NotImplementedError
+
+    # Maintenance
+    def purge_sent_reminders(self, before_date, archive=False):
+        """Delete (or archive) assignments due before the given date that have left the user's Arbor list;
+        return the row count"""
+        raise NotImplementedError
+
+    def delete_orphaned_reminders(self):
+        """Delete reminders whose user no longer exists; return the row count"""
+        raise NotImplementedError
+
+    def compact(self):
+        """Optimise and shrink the store; return the number of bytes reclaimed"""
+        raise NotImplementedError
+
+    def write_stats(self):
+        """Return write batching counters, or None if the backend doesn't batch"""
+        return None
+
+    async def write_async(self, method, *args):
+        """Call the write method `method` from a coroutine without blocking the event loop on it.
+        Only for methods that return what their single write returns."""
+        return getattr(self, method)(*args)
+
+
+class SQLiteStorage(StorageBackend):
+    """Storage backed by a local SQLite database file"""
+
+    name = "sqlite"
+
+    # Legacy reminder rows, reconstructed from the normalised tables
+    REMINDERS_VIEW = """
+        CREATE VIEW IF NOT EXISTS reminders AS
+        SELECT ua.id AS id,
+               ua.discord_id AS discord_id,
+               CASE WHEN c.subject_code = '' THEN c.title ELSE c.subject_code || ': ' || c.title END AS assignment_name,
+               c.due_date AS due_date,
+               ua.reminder_date AS reminder_date,
+               ua.sent AS sent
+        FROM user_assignments ua
+        JOIN assignment_catalog c ON c.id = ua.assignment_id
+        WHERE ua.reminder_date IS NOT NULL
+    """
+
+    def __init__(self, path="arbor_users.db"):
+        self.path = path
+        self._search_index = False
+        # Every write goes through this thread, so concurrent writers never fight over the lock
+        self.writer = DBWriter(
+            path,
+            max_batch=int(os.getenv("DB_WRITE_BATCH", "64")),
+            max_latency=float(os.getenv("DB_WRITE_LATENCY_MS", "5")) / 1000
+        )
+
+    def _connect(self):
+        # Read-only use from here on; WAL lets reads run alongside the writer thread
+        return sqlite3.connect(self.path, timeout=30)
+
+    def submit_write(self, fn, transaction=True):
+        """Queue fn(cursor) on the writer thread and return a Future for its result"""
+        return self.writer.submit(fn, transaction)
+
+    def _write(self, fn):
+        deferred = _deferred_writes.get()
+        if deferred is not None:
+            future = self.submit_write(fn)
+            deferred.append(future)
+            return future
+        # Includes the wait for the writer thread to get round to it
+        with WRITE_TIMER.time():
+            return self.submit_write(fn).result()
+
+    async def write_async(self, method, *args):
+        futures = []
+        token = _deferred_writes.set(futures)
+        try:
+            result = getattr(self, method)(*args)
+        finally:
+            _deferred_writes.reset(token)
+        # Methods can return early without writing anything
+        if not futures:
+            return result
+        started = time.perf_counter()
+        results = [await asyncio.wrap_future(future) for future in futures]
+        WRITE_TIMER.observe(time.perf_counter() - started)
+        return results[-1]
+
+    def write_stats(self):
+        return self.writer.stats()
+
+    def _fetchone(self, query, params=()):
+        with READ_TIMER.time():
+            conn = self._connect()
+            try:
+                return conn.execute(query, params).fetchone()
+            finally:
+                conn.close()
+
+    def _fetchall(self, query, params=()):
+        with READ_TIMER.time():
+            conn = self._connect()
+            try:
+                return conn.execute(query, params).fetchall()
+            finally:
+                conn.close()
+
+    def _execute(self, query, params=()):
+        return self._write(lambda cursor: cursor.execute(query, params).rowcount)
+
+    # Get (or create) the catalog id of an assignment
+    def _catalog_id(self, cursor, subject_code, title, due_date):
+        cursor.execute(
+            "INSERT OR IGNORE INTO assignment_catalog (subject_code, title, due_date) VALUES (?, ?, ?)",
+            (subject_code, title, due_date)
+        )
+        cursor.execute(
+            "SELECT id FROM assignment_catalog WHERE subject_code = ? AND title = ? AND due_date = ?",
+            (subject_code, title, due_date)
+        )
+        return cursor.fetchone()[0]
+
+    # Get (or create) the id of a user's link to a catalog assignment
+    def _link_id(self, cursor, discord_id, assignment_id, status, seen_at):
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO user_assignments (discord_id, assignment_id, status, first_seen, last_seen)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (discord_id, assignment_id, status, seen_at, seen_at)
+        )
+        cursor.execute(
+            "SELECT id FROM user_assignments WHERE discord_id = ? AND assignment_id = ?",
+            (discord_id, assignment_id)
+        )
+        return cursor.fetchone()[0]
+
+    # Drop catalog entries no user links to any more
+    def _prune_catalog(self, cursor):
+        cursor.execute(
+            """
+            DELETE FROM assignment_catalog
+            WHERE NOT EXISTS (SELECT 1 FROM user_assignments ua WHERE ua.assignment_id = assignment_catalog.id)
+            """
+        )
+
+    def _object_type(self, cursor, name):
+        cursor.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def init_schema(self):
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    discord_id TEXT NOT NULL,
+                    username TEXT NOT NULL,
+                    password TEXT NOT NULL
+                )
+                """
+            )
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+                """
+            )
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS reminders_archive (
+                    id INTEGER PRIMARY KEY,
+                    discord_id TEXT NOT NULL,
+                    assignment_name TEXT NOT NULL,
+                    due_date TEXT NOT NULL,
+                    reminder_date TEXT NOT NULL,
+                    archived_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+            # One row per distinct assignment, shared by every student in the class
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS assignment_catalog (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    subject_code TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    due_date TEXT NOT NULL,
+                    UNIQUE (subject_code, title, due_date)
+                )
+                """
+            )
+            # Per-user status and reminder state for catalog assignments
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS user_assignments (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    discord_id TEXT NOT NULL,
+                    assignment_id INTEGER NOT NULL REFERENCES assignment_catalog (id),
+                    status TEXT NOT NULL,
+                    first_seen TEXT NOT NULL,
+                    last_seen TEXT NOT NULL,
+                    reminder_date TEXT,
+                    sent INTEGER DEFAULT 0,
+                    UNIQUE (discord_id, assignment_id)
+                )
+                """
+            )
+            cursor.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_user_assignments_pending
+                ON user_assignments (reminder_date) WHERE sent = 0
+                """
+            )
+            # Due-date range lookups for assignment questions
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_assignment_catalog_due ON assignment_catalog (due_date)")
+            # Reminder DMs waiting to be delivered (or retried) by the outbox worker
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS reminder_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    idempotency_key TEXT NOT NULL UNIQUE,
+                    reminder_id INTEGER NOT NULL,
+                    discord_id TEXT NOT NULL,
+                    assignment_name TEXT NOT NULL,
+                    due_date TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at TEXT NOT NULL,
+                    last_error TEXT,
+                    created_at TEXT NOT NULL,
+                    delivered_at TEXT
+                )
+                """
+            )
+            cursor.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_reminder_outbox_ready
+                ON reminder_outbox (next_attempt_at) WHERE status = 'pending'
+                """
+            )
+            # Leader election between bot replicas sharing this database
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    holder TEXT NOT NULL,
+                    token INTEGER NOT NULL,
+                    expires_at TEXT NOT NULL
+                )
+                """
+            )
+            # No-op while a legacy reminders table is still waiting to be migrated
+            cursor.execute(self.REMINDERS_VIEW)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def migrate(self):
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            # Add reminder_days column if it doesn't exist
+            cursor.execute("PRAGMA table_info(users)")
+            columns = [column[1] for column in cursor.fetchall()]
+            if "reminder_days" not in columns:
+                cursor.execute("ALTER TABLE users ADD COLUMN reminder_days INTEGER DEFAULT 1")
+                conn.commit()
+                print("Added reminder_days column to users table")
+
+            self._migrate_to_catalog(conn, cursor)
+            self._create_search_index(conn, cursor)
+
+            # Switch to incremental auto-vacuum so maintenance can hand freed pages back to the OS.
+            # Changing the mode on an existing database only takes effect after a full VACUUM.
+            auto_vacuum = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+            if auto_vacuum != 2:
+                cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                cursor.execute("VACUUM")
+                print("Enabled incremental auto-vacuum")
+
+            # Write-ahead logging lets readers keep going while the writer thread commits
+            journal_mode = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+            if journal_mode.lower() != "wal":
+                cursor.execute("PRAGMA journal_mode = WAL")
+                print("Enabled WAL journal mode")
+        finally:
+            conn.close()
+
+    # Move per-user reminders and assignments tables into the shared catalog
+    def _migrate_to_catalog(self, conn, cursor):
+        legacy_reminders = self._object_type(cursor, "reminders") == "table"
+        legacy_assignments = self._object_type(cursor, "assignments") == "table"
+        if not legacy_reminders and not legacy_assignments:
+            return
+
+        try:
+            now = datetime.datetime.now().isoformat(sep=' ')
+            today = datetime.datetime.now().strftime('%Y-%m-%d')
+            migrated = 0
+
+            if legacy_assignments:
+                cursor.execute(
+                    "SELECT discord_id, subject_code, title, due_date, status, first_seen, last_seen FROM assignments"
+                )
+                for discord_id, subject_code, title, due_date, status, first_seen, last_seen in cursor.fetchall():
+                    assignment_id = self._catalog_id(cursor, subject_code, title, due_date)
+                    link_id = self._link_id(cursor, discord_id, assignment_id, status, first_seen)
+                    cursor.execute(
+                        "UPDATE user_assignments SET status = ?, first_seen = ?, last_seen = ? WHERE id = ?",
+                        (status, first_seen, last_seen, link_id)
+                    )
+                    migrated += 1
+                cursor.execute("DROP TABLE assignments")
+
+            if legacy_reminders:
+                cursor.execute(
+                    "SELECT discord_id, assignment_name, due_date, reminder_date, sent FROM reminders ORDER BY id"
+                )
+                for discord_id, assignment_name, due_date, reminder_date, sent in cursor.fetchall():
+                    subject_code, title = split_assignment_name(assignment_name)
+                    assignment_id = self._catalog_id(cursor, subject_code, title, due_date)
+                    status = "overdue" if due_date < today else "upcoming"
+                    link_id = self._link_id(cursor, discord_id, assignment_id, status, now)
+                    cursor.execute(
+                        "UPDATE user_assignments SET reminder_date = ?, sent = MAX(sent, ?) WHERE id = ?",
+                        (reminder_date, sent or 0, link_id)
+                    )
+                    migrated += 1
+                cursor.execute("DROP TABLE reminders")
+
+            cursor.execute(self.REMINDERS_VIEW)
+            conn.commit()
+            print(f"Migrated {migrated} reminder and assignment rows to the assignment catalog")
+        except Exception:
+            conn.rollback()
+            raise
+
+    # Full-text index over catalog titles and subject codes, kept in step by triggers
+    def _create_search_index(self, conn, cursor):
+        if self._object_type(cursor, "assignment_search") is not None:
+            return
+        try:
+            cursor.execute(
+                """
+                CREATE VIRTUAL TABLE assignment_search USING fts5 (
+                    subject_code, title, content='assignment_catalog', content_rowid='id', prefix='2 3'
+                )
+                """
+            )
+        except sqlite3.OperationalError as e:
+            print(f"Full-text search unavailable, searching without an index: {e}")
+            return
+        cursor.executescript(
+            """
+            CREATE TRIGGER IF NOT EXISTS assignment_catalog_search_insert AFTER INSERT ON assignment_catalog BEGIN
+                INSERT INTO assignment_search (rowid, subject_code, title) VALUES (new.id, new.subject_code, new.title);
+            END;
+            CREATE TRIGGER IF NOT EXISTS assignment_catalog_search_delete AFTER DELETE ON assignment_catalog BEGIN
+                INSERT INTO assignment_search (assignment_search, rowid, subject_code, title)
+                VALUES ('delete', old.id, old.subject_code, old.title);
+            END;
+            CREATE TRIGGER IF NOT EXISTS assignment_catalog_search_update AFTER UPDATE ON assignment_catalog BEGIN
+                INSERT INTO assignment_search (assignment_search, rowid, subject_code, title)
+                VALUES ('delete', old.id, old.subject_code, old.title);
+                INSERT INTO assignment_search (rowid, subject_code, title) VALUES (new.id, new.subject_code, new.title);
+            END;
+            INSERT INTO assignment_search (assignment_search) VALUES ('rebuild');
+            """
+        )
+        conn.commit()
+        print("Built the assignment search index")
+
+    def get_user(self, discord_id):
+        return self._fetchone(
+            "SELECT username, password, reminder_days FROM users WHERE discord_id = ?",
+            (discord_id,)
+        )
+
+    def save_user(self, discord_id, username, encrypted_password):
+        def write(cursor):
+            cursor.execute("SELECT id FROM users WHERE discord_id = ?", (discord_id,))
+            if cursor.fetchone():
+                cursor.execute(
+                    "UPDATE users SET username = ?, password = ? WHERE discord_id = ?",
+                    (username, encrypted_password, discord_id)
+                )
+            else:
+                cursor.execute(
+                    "INSERT INTO users (discord_id, username, password) VALUES (?, ?, ?)",
+                    (discord_id, username, encrypted_password)
+                )
+        return self._write(write)
+
+    def delete_user(self, discord_id):
+        def write(cursor):
+            # Delete assignment links first (foreign key constraint)
+            cursor.execute("DELETE FROM user_assignments WHERE discord_id = ?", (discord_id,))
+            cursor.execute("DELETE FROM reminder_outbox WHERE discord_id = ?", (discord_id,))
+            cursor.execute("DELETE FROM settings WHERE key = ?", (f"assignments_synced_at:{discord_id}",))
+            cursor.execute("DELETE FROM users WHERE discord_id = ?", (discord_id,))
+            self._prune_catalog(cursor)
+        return self._write(write)
+
+    def set_reminder_days(self, discord_id, days_before):
+        return self._execute("UPDATE users SET reminder_days = ? WHERE discord_id = ?", (days_before, discord_id))
+
+    def list_user_ids(self):
+        return [row[0] for row in self._fetchall("SELECT discord_id FROM users")]
+
+    def count_users(self):
+        return self._fetchone("SELECT COUNT(*) FROM users")[0]
+
+    def add_reminder(self, discord_id, assignment_name, due_date, reminder_date):
+        subject_code, title = split_assignment_name(assignment_name)
+        def write(cursor):
+            assignment_id = self._catalog_id(cursor, subject_code, title, due_date)
+            link_id = self._link_id(cursor, discord_id, assignment_id, "upcoming", get_clock().now().isoformat(sep=' '))
+            # Keep the sent flag if this exact reminder already went out
+            cursor.execute(
+                """
+                UPDATE user_assignments
+                SET sent = CASE WHEN reminder_date = ? THEN sent ELSE 0 END, reminder_date = ?
+                WHERE id = ?
+                """,
+                (reminder_date, reminder_date, link_id)
+            )
+        return self._write(write)
+
+    def get_user_reminders(self, discord_id):
+        return self._fetchall(
+            "SELECT assignment_name, due_date, reminder_date FROM reminders WHERE discord_id = ? AND sent = 0 ORDER BY due_date",
+            (discord_id,)
+        )
+
+    def get_user_reminders_page(self, discord_id, after=None, limit=10):
+        query = "SELECT id, assignment_name, due_date, reminder_date FROM reminders WHERE discord_id = ? AND sent = 0"
+        params = [discord_id]
+        if after is not None:
+            query += " AND (due_date, id) > (?, ?)"
+            params.extend(after)
+        return self._fetchall(query + " ORDER BY due_date, id LIMIT ?", params + [limit])
+
+    def clear_user_reminders(self, discord_id):
+        self._execute(
+            "UPDATE user_assignments SET reminder_date = NULL WHERE discord_id = ? AND sent = 0",
+            (discord_id,)
+        )
+
+    def delete_reminder(self, discord_id, assignment_name):
+        subject_code, title = split_assignment_name(assignment_name)
+        def write(cursor):
+            cursor.execute(
+                """
+                DELETE FROM user_assignments
+                WHERE discord_id = ? AND assignment_id IN (
+                    SELECT id FROM assignment_catalog WHERE subject_code = ? AND title = ?
+                )
+                """,
+                (discord_id, subject_code, title)
+            )
+            self._prune_catalog(cursor)
+        return self._write(write)
+
+    def get_due_reminders(self, date):
+        return self._fetchall(
+            "SELECT discord_id, assignment_name, due_date FROM reminders WHERE reminder_date = ? AND sent = 0",
+            (date,)
+        )
+
+    def mark_reminder_sent(self, discord_id, assignment_name, due_date):
+        subject_code, title = split_assignment_name(assignment_name)
+        self._execute(
+            """
+            UPDATE user_assignments SET sent = 1
+            WHERE discord_id = ? AND reminder_date IS NOT NULL AND assignment_id = (
+                SELECT id FROM assignment_catalog WHERE subject_code = ? AND title = ? AND due_date = ?
+            )
+            """,
+            (discord_id, subject_code, title, due_date)
+        )
+
+    def mark_reminders_sent(self, reminder_ids):
+        reminder_ids = list(reminder_ids)
+        if not reminder_ids:
+            return 0
+        placeholders = ", ".join("?" for _ in reminder_ids)
+        return self._execute(f"UPDATE user_assignments SET sent = 1 WHERE id IN ({placeholders})", reminder_ids)
+
+    def get_pending_reminders(self, start_date, end_date):
+        return self._fetchall(
+            """
+            SELECT id, discord_id, assignment_name, due_date, reminder_date FROM reminders
+            WHERE sent = 0 AND reminder_date BETWEEN ? AND ?
+            ORDER BY reminder_date, discord_id, due_date
+            """,
+            (start_date, end_date)
+        )
+
+    def get_pending_reminder_dates(self, start_date):
+        rows = self._fetchall(
+            "SELECT DISTINCT reminder_date FROM user_assignments WHERE sent = 0 AND reminder_date >= ? ORDER BY reminder_date",
+            (start_date,)
+        )
+        return [row[0] for row in rows]
+
+    def count_reminders(self, discord_id=None, sent=None):
+        query = "SELECT COUNT(*) FROM reminders WHERE 1 = 1"
+        params = []
+        if discord_id is not None:
+            query += " AND discord_id = ?"
+            params.append(discord_id)
+        if sent is not None:
+            query += " AND sent = ?"
+            params.append(1 if sent else 0)
+        return self._fetchone(query, params)[0]
+
+    def sync_assignments(self, discord_id, assignments, seen_at):
+        def write(cursor):
+            for subject_code, title, due_date, status in assignments:
+                assignment_id = self._catalog_id(cursor, subject_code, title, due_date)
+                cursor.execute(
+                    """
+                    INSERT INTO user_assignments (discord_id, assignment_id, status, first_seen, last_seen)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (discord_id, assignment_id)
+                    DO UPDATE SET status = excluded.status, last_seen = excluded.last_seen
+                    """,
+                    (discord_id, assignment_id, status, seen_at, seen_at)
+                )
+            cursor.execute(
+                "UPDATE user_assignments SET status = ? WHERE discord_id = ? AND last_seen < ? AND status != ?",
+                (COMPLETED_STATUS, discord_id, seen_at, COMPLETED_STATUS)
+            )
+            cursor.execute(
+                "INSERT INTO settings (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (f"assignments_synced_at:{discord_id}", seen_at)
+            )
+        return self._write(write)
+
+    def get_user_assignments(self, discord_id, include_completed=False):
+        query = """
+            SELECT c.subject_code, c.title, c.due_date, ua.status
+            FROM user_assignments ua
+            JOIN assignment_catalog c ON c.id = ua.assignment_id
+            WHERE ua.discord_id = ?
+        """
+        params = [discord_id]
+        if not include_completed:
+            query += " AND ua.status != ?"
+            params.append(COMPLETED_STATUS)
+        return self._fetchall(query + " ORDER BY c.due_date, c.subject_code, c.title", params)
+
+    def query_assignments(self, discord_id, start_date=None, end_date=None, include_completed=False):
+        query = """
+            SELECT c.subject_code, c.title, c.due_date, ua.status
+            FROM user_assignments ua
+            JOIN assignment_catalog c ON c.id = ua.assignment_id
+            WHERE ua.discord_id = ?
+        """
+        params = [discord_id]
+        if start_date is not None:
+            query += " AND c.due_date >= ?"
+            params.append(start_date)
+        if end_date is not None:
+            query += " AND c.due_date <= ?"
+            params.append(end_date)
+        if not include_completed:
+            query += " AND ua.status != ?"
+            params.append(COMPLETED_STATUS)
+        return self._fetchall(query + " ORDER BY c.due_date, c.subject_code, c.title", params)
+
+    def get_user_assignments_page(self, discord_id, after=None, limit=10, include_completed=False):
+        query = """
+            SELECT ua.id, c.subject_code, c.title, c.due_date, ua.status
+            FROM user_assignments ua
+            JOIN assignment_catalog c ON c.id = ua.assignment_id
+            WHERE ua.discord_id = ?
+        """
+        params = [discord_id]
+        if not include_completed:
+            query += " AND ua.status != ?"
+            params.append(COMPLETED_STATUS)
+        if after is not None:
+            query += " AND (c.due_date, ua.id) > (?, ?)"
+            params.extend(after)
+        return self._fetchall(query + " ORDER BY c.due_date, ua.id LIMIT ?", params + [limit])
+
+    def search_assignments(self, discord_id, terms, limit=10, include_completed=False):
+        terms = [term for term in terms if re.fullmatch(r"\w+", term)]
+        if not terms:
+            return []
+        completed = "" if include_completed else " AND ua.status != ?"
+        completed_params = [] if include_completed else [COMPLETED_STATUS]
+        if self._has_search_index():
+            # Any term, as a prefix; bm25 ranks rows matching more (and rarer) terms first
+            match = " OR ".join(f'"{term}"*' for term in terms)
+            return self._fetchall(
+                f"""
+                SELECT c.subject_code, c.title, c.due_date, ua.status
+                FROM assignment_search s
+                JOIN assignment_catalog c ON c.id = s.rowid
+                JOIN user_assignments ua ON ua.assignment_id = c.id AND ua.discord_id = ?
+                WHERE assignment_search MATCH ?{completed}
+                ORDER BY bm25(assignment_search, 0.5, 1.0), c.due_date
+                LIMIT ?
+                """,
+                [discord_id, match] + completed_params + [limit]
+            )
+        # No full-text index: narrow down with LIKE and rank in Python
+        like = " OR ".join("c.title LIKE ? OR c.subject_code LIKE ?" for _ in terms)
+        rows = self._fetchall(
+            f"""
+            SELECT c.subject_code, c.title, c.due_date, ua.status
+            FROM user_assignments ua
+            JOIN assignment_catalog c ON c.id = ua.assignment_id
+            WHERE ua.discord_id = ?{completed} AND ({like})
+            """,
+            [discord_id] + completed_params + [f"%{term}%" for term in terms for _ in range(2)]
+        )
+        return rank_search_matches(rows, terms, limit)
+
+    # Whether the full-text index exists; once found it stays, as only migrate() adds it
+    def _has_search_index(self):
+        if not self._search_index:
+            conn = self._connect()
+            try:
+                self._search_index = self._object_type(conn.cursor(), "assignment_search") is not None
+            finally:
+                conn.close()
+        return self._search_index
+
+    def enqueue_outbox(self, entries, created_at):
+        def write(cursor):
+            added = 0
+            for idempotency_key, reminder_id, discord_id, assignment_name, due_date in entries:
+                cursor.execute(
+                    """
+                    INSERT OR IGNORE INTO reminder_outbox
+                    (idempotency_key, reminder_id, discord_id, assignment_name, due_date, next_attempt_at, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (idempotency_key, reminder_id, discord_id, assignment_name, due_date, created_at, created_at)
+                )
+                added += cursor.rowcount
+            return added
+        return self._write(write)
+
+    def get_ready_outbox(self, now, limit=100):
+        return self._fetchall(
+            """
+            SELECT id, reminder_id, discord_id, assignment_name, due_date, attempts FROM reminder_outbox
+            WHERE status = ? AND next_attempt_at <= ?
+            ORDER BY next_attempt_at, discord_id, id LIMIT ?
+            """,
+            (OUTBOX_PENDING, now, limit)
+        )
+
+    def get_next_outbox_attempt(self):
+        return self._fetchone(
+            "SELECT MIN(next_attempt_at) FROM reminder_outbox WHERE status = ?", (OUTBOX_PENDING,)
+        )[0]
+
+    def claim_outbox(self, outbox_ids, now, claimed_until, fence=None):
+        outbox_ids = list(outbox_ids)
+        if not outbox_ids:
+            return []
+        placeholders = ", ".join("?" for _ in outbox_ids)
+        def write(cursor):
+            # Checked inside the write transaction, so a replica that lost the lease can't claim anything
+            if fence is not None:
+                row = cursor.execute("SELECT token FROM leases WHERE name = ?", (fence[0],)).fetchone()
+                if row is None or row[0] != fence[1]:
+                    return []
+            claimable = [
+                row[0] for row in cursor.execute(
+                    f"SELECT id FROM reminder_outbox WHERE id IN ({placeholders}) AND status = ? AND next_attempt_at <= ?",
+                    outbox_ids + [OUTBOX_PENDING, now]
+                ).fetchall()
+            ]
+            if claimable:
+                cursor.execute(
+                    f"UPDATE reminder_outbox SET next_attempt_at = ? WHERE id IN ({', '.join('?' for _ in claimable)})",
+                    [claimed_until] + claimable
+                )
+            return claimable
+        return self._write(write)
+
+    def mark_outbox_delivered(self, outbox_ids, delivered_at):
+        outbox_ids = list(outbox_ids)
+        if not outbox_ids:
+            return 0
+        placeholders = ", ".join("?" for _ in outbox_ids)
+        def write(cursor):
+            cursor.execute(
+                f"""
+                UPDATE user_assignments SET sent = 1
+                WHERE id IN (SELECT reminder_id FROM reminder_outbox WHERE id IN ({placeholders}))
+                """,
+                outbox_ids
+            )
+            cursor.execute(
+                f"""
+                UPDATE reminder_outbox SET status = ?, delivered_at = ?, attempts = attempts + 1, last_error = NULL
+                WHERE id IN ({placeholders})
+                """,
+                [OUTBOX_DELIVERED, delivered_at] + outbox_ids
+            )
+            return cursor.rowcount
+        return self._write(write)
+
+    def mark_outbox_failed(self, outbox_ids, error, next_attempt_at):
+        outbox_ids = list(outbox_ids)
+        if not outbox_ids:
+            return 0
+        placeholders = ", ".join("?" for _ in outbox_ids)
+        if next_attempt_at is None:
+            query = f"""
+                UPDATE reminder_outbox SET status = ?, attempts = attempts + 1, last_error = ?
+                WHERE id IN ({placeholders})
+            """
+            params = [OUTBOX_FAILED, error] + outbox_ids
+        else:
+            query = f"""
+                UPDATE reminder_outbox SET attempts = attempts + 1, last_error = ?, next_attempt_at = ?
+                WHERE id IN ({placeholders})
+            """
+            params = [error, next_attempt_at] + outbox_ids
+        return self._execute(query, params)
+
+    def count_outbox(self, status=None):
+        if status is None:
+            return self._fetchone("SELECT COUNT(*) FROM reminder_outbox")[0]
+        return self._fetchone("SELECT COUNT(*) FROM reminder_outbox WHERE status = ?", (status,))[0]
+
+    def purge_outbox(self, before):
+        return self._execute(
+            "DELETE FROM reminder_outbox WHERE status IN (?, ?) AND created_at < ?",
+            (OUTBOX_DELIVERED, OUTBOX_FAILED, before)
+        )
+
+    def acquire_lease(self, name, holder, now, expires_at):
+        def write(cursor):
+            row = cursor.execute("SELECT holder, token, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                cursor.execute(
+                    "INSERT INTO leases (name, holder, token, expires_at) VALUES (?, ?, 1, ?)",
+                    (name, holder, expires_at)
+                )
+                return 1
+            current_holder, token, current_expiry = row
+            if current_holder == holder and current_expiry >= now:
+                # Renewal keeps the token
+                cursor.execute("UPDATE leases SET expires_at = ? WHERE name = ?", (expires_at, name))
+                return token
+            if current_expiry < now:
+                cursor.execute(
+                    "UPDATE leases SET holder = ?, token = ?, expires_at = ? WHERE name = ?",
+                    (holder, token + 1, expires_at, name)
+                )
+                return token + 1
+            return None
+        return self._write(write)
+
+    def release_lease(self, name, holder):
+        return self._execute("UPDATE leases SET expires_at = '' WHERE name = ? AND holder = ?", (name, holder))
+
+    def get_lease(self, name):
+        return self._fetchone("SELECT holder, token, expires_at FROM leases WHERE name = ?", (name,))
+
+    def get_setting(self, key, default=None):
+        row = self._fetchone("SELECT value FROM settings WHERE key = ?", (key,))
+        return row[0] if row else default
+
+    def set_setting(self, key, value):
+        return self._execute(
+            "INSERT INTO settings (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+    def get_table_columns(self, table):
+        # PRAGMA arguments can't be bound, so only allow identifiers
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table}")
+        return {row[1] for row in self._fetchall(f"PRAGMA table_info({table})")}
+
+    def count_orphaned_reminders(self):
+        return self._fetchone(
+            """
+            SELECT COUNT(*) FROM user_assignments ua
+            WHERE NOT EXISTS (SELECT 1 FROM users u WHERE u.discord_id = ua.discord_id)
+            """
+        )[0]
+
+    def purge_sent_reminders(self, before_date, archive=False):
+        # Links are finished once the assignment left the Arbor list; one still listed (say overdue with
+        # its reminder sent) would only be re-created with a new first_seen by the next scrape
+        finished = """
+            FROM user_assignments
+            WHERE status = ?
+            AND assignment_id IN (SELECT id FROM assignment_catalog WHERE due_date < ?)
+        """
+        def write(cursor):
+            if archive:
+                cursor.execute(
+                    f"""
+                    INSERT OR REPLACE INTO reminders_archive (id, discord_id, assignment_name, due_date, reminder_date)
+                    SELECT id, discord_id, assignment_name, due_date, reminder_date FROM reminders
+                    WHERE id IN (SELECT id {finished})
+                    """,
+                    (COMPLETED_STATUS, before_date)
+                )
+            cursor.execute(f"DELETE {finished}", (COMPLETED_STATUS, before_date))
+            deleted = cursor.rowcount
+            self._prune_catalog(cursor)
+            return deleted
+        return self._write(write)
+
+    def delete_orphaned_reminders(self):
+        def write(cursor):
+            cursor.execute(
+                """
+                DELETE FROM user_assignments
+                WHERE NOT EXISTS (SELECT 1 FROM users u WHERE u.discord_id = user_assignments.discord_id)
+                """
+            )
+            deleted = cursor.rowcount
+            self._prune_catalog(cursor)
+            return deleted
+        return self._write(write)
+
+    def compact(self):
+        # Runs on the writer connection between batches, outside any transaction
+        def vacuum(conn):
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+            # executescript steps the vacuum to completion; a plain execute frees a single page
+            conn.executescript("PRAGMA optimize; PRAGMA incremental_vacuum;")
+            pages_after = conn.execute("PRAGMA page_count").fetchone()[0]
+            return max(pages_before - pages_after, 0) * page_size
+        return self.submit_write(vacuum, transaction=False).result()
+
+
+class MemoryStorage(StorageBackend):
+    """Pure in-memory storage for tests and simulated load; nothing survives a restart"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users = {}
+        self._settings = {}
+        self._archive = {}
+        # (subject_code, title, due_date) -> catalog id, and the reverse
+        self._catalog = {}
+        self._catalog_rows = {}
+        # link id -> per-user assignment state, plus a (discord_id, assignment_id) index
+        self._links = {}
+        self._link_index = {}
+        # outbox id -> entry, plus the idempotency keys already queued
+        self._outbox = {}
+        self._outbox_keys = set()
+        self._next_outbox_id = 1
+        # lease name -> [holder, token, expires_at]
+        self._leases = {}
+        self._next_user_id = 1
+        self._next_catalog_id = 1
+        self._next_link_id = 1
+
+    def init_schema(self):
+        pass
+
+    def migrate(self):
+        pass
+
+    def _catalog_id(self, subject_code, title, due_date):
+        key = (subject_code, title, due_date)
+        if key not in self._catalog:
+            self._catalog[key] = self._next_catalog_id
+            self._catalog_rows[self._next_catalog_id] = key
+            self._next_catalog_id += 1
+        return self._catalog[key]
+
+    def _link(self, discord_id, assignment_id, status, seen_at):
+        link_id = self._link_index.get((discord_id, assignment_id))
+        if link_id is None:
+            link_id = self._next_link_id
+            self._next_link_id += 1
+            self._link_index[(discord_id, assignment_id)] = link_id
+            self._links[link_id] = {
+                "id": link_id,
+                "discord_id": discord_id,
+                "assignment_id": assignment_id,
+                "status": status,
+                "first_seen": seen_at,
+                "last_seen": seen_at,
+                "reminder_date": None,
+                "sent": 0
+            }
+        return self._links[link_id]
+
+    def _delete_links(self, links):
+        for link in links:
+            del self._links[link["id"]]
+            del self._link_index[(link["discord_id"], link["assignment_id"])]
+        self._prune_catalog()
+        return len(links)
+
+    def _prune_catalog(self):
+        used = {link["assignment_id"] for link in self._links.values()}
+        for assignment_id in [a for a in self._catalog_rows if a not in used]:
+            del self._catalog[self._catalog_rows.pop(assignment_id)]
+
+    def _select_links(self, predicate):
+        return [link for link in self._links.values() if predicate(link)]
+
+    def _reminder_row(self, link):
+        subject_code, title, due_date = self._catalog_rows[link["assignment_id"]]
+        return {
+            "id": link["id"],
+            "discord_id": link["discord_id"],
+            "assignment_name": join_assignment_name(subject_code, title),
+            "due_date": due_date,
+            "reminder_date": link["reminder_date"],
+            "sent": link["sent"]
+        }
+
+    def _select_reminders(self, predicate):
+        rows = [self._reminder_row(link) for link in self._links.values() if link["reminder_date"] is not None]
+        return [r for r in rows if predicate(r)]
+
+    def get_user(self, discord_id):
+        with self._lock:
+            user = self._users.get(discord_id)
+            if user is None:
+                return None
+            return user["username"], user["password"], user["reminder_days"]
+
+    def save_user(self, discord_id, username, encrypted_password):
+        with self._lock:
+            user = self._users.get(discord_id)
+            if user:
+                user["username"] = username
+                user["password"] = encrypted_password
+            else:
+                self._users[discord_id] = {
+                    "id": self._next_user_id,
+                    "username": username,
+                    "password": encrypted_password,
+                    "reminder_days": 1
+                }
+                self._next_user_id += 1
+
+    def delete_user(self, discord_id):
+        with self._lock:
+            self._delete_links(self._select_links(lambda link: link["discord_id"] == discord_id))
+            for entry in [entry for entry in self._outbox.values() if entry["discord_id"] == discord_id]:
+                del self._outbox[entry["id"]]
+                self._outbox_keys.discard(entry["idempotency_key"])
+            self._settings.pop(f"assignments_synced_at:{discord_id}", None)
+            self._users.pop(discord_id, None)
+
+    def set_reminder_days(self, discord_id, days_before):
+        with self._lock:
+            if discord_id in self._users:
+                self._users[discord_id]["reminder_days"] = days_before
+
+    def list_user_ids(self):
+        with self._lock:
+            return list(self._users)
+
+    def count_users(self):
+        with self._lock:
+            return len(self._users)
+
+    def add_reminder(self, discord_id, assignment_name, due_date, reminder_date):
+        subject_code, title = split_assignment_name(assignment_name)
+        with self._lock:
+            assignment_id = self._catalog_id(subject_code, title, due_date)
+            link = self._link(discord_id, assignment_id, "upcoming", get_clock().now().isoformat(sep=' '))
+            # Keep the sent flag if this exact reminder already went out
+            if link["reminder_date"] != reminder_date:
+                link["sent"] = 0
+            link["reminder_date"] = reminder_date
+
+    def get_user_reminders(self, discord_id):
+        with self._lock:
+            rows = self._select_reminders(lambda r: r["discord_id"] == discord_id and not r["sent"])
+            rows.sort(key=lambda r: r["due_date"])
+            return [(r["assignment_name"], r["due_date"], r["reminder_date"]) for r in rows]
+
+    def get_user_reminders_page(self, discord_id, after=None, limit=10):
+        with self._lock:
+            rows = self._select_reminders(
+                lambda r: r["discord_id"] == discord_id and not r["sent"]
+                and (after is None or (r["due_date"], r["id"]) > tuple(after))
+            )
+            rows.sort(key=lambda r: (r["due_date"], r["id"]))
+            return [(r["id"], r["assignment_name"], r["due_date"], r["reminder_date"]) for r in rows[:limit]]
+
+    def clear_user_reminders(self, discord_id):
+        with self._lock:
+            for link in self._select_links(lambda link: link["discord_id"] == discord_id and not link["sent"]):
+                link["reminder_date"] = None
+
+    def delete_reminder(self, discord_id, assignment_name):
+        subject_code, title = split_assignment_name(assignment_name)
+        with self._lock:
+            self._delete_links(self._select_links(
+                lambda link: link["discord_id"] == discord_id
+                and self._catalog_rows[link["assignment_id"]][:2] == (subject_code, title)
+            ))
+
+    def get_due_reminders(self, date):
+        with self._lock:
+            rows = self._select_reminders(lambda r: r["reminder_date"] == date and not r["sent"])
+            return [(r["discord_id"], r["assignment_name"], r["due_date"]) for r in rows]
+
+    def mark_reminder_sent(self, discord_id, assignment_name, due_date):
+        subject_code, title = split_assignment_name(assignment_name)
+        with self._lock:
+            assignment_id = self._catalog.get((subject_code, title, due_date))
+            link_id = self._link_index.get((discord_id, assignment_id))
+            if link_id is not None and self._links[link_id]["reminder_date"] is not None:
+                self._links[link_id]["sent"] = 1
+
+    def mark_reminders_sent(self, reminder_ids):
+        with self._lock:
+            updated = 0
+            for reminder_id in reminder_ids:
+                link = self._links.get(reminder_id)
+                if link is not None:
+                    link["sent"] = 1
+                    updated += 1
+            return updated
+
+    def get_pending_reminders(self, start_date, end_date):
+        with self._lock:
+            rows = self._select_reminders(
+                lambda r: not r["sent"] and start_date <= r["reminder_date"] <= end_date
+            )
+            rows.sort(key=lambda r: (r["reminder_date"], r["discord_id"], r["due_date"]))
+            return [
+                (r["id"], r["discord_id"], r["assignment_name"], r["due_date"], r["reminder_date"]) for r in rows
+            ]
+
+    def get_pending_reminder_dates(self, start_date):
+        with self._lock:
+            return sorted({
+                link["reminder_date"] for link in self._links.values()
+                if not link["sent"] and link["reminder_date"] is not None and link["reminder_date"] >= start_date
+            })
+
+    def count_reminders(self, discord_id=None, sent=None):
+        with self._lock:
+            return len(self._select_reminders(
+                lambda r: (discord_id is None or r["discord_id"] == discord_id)
+                and (sent is None or bool(r["sent"]) == bool(sent))
+            ))
+
+    def sync_assignments(self, discord_id, assignments, seen_at):
+        with self._lock:
+            for subject_code, title, due_date, status in assignments:
+                link = self._link(discord_id, self._catalog_id(subject_code, title, due_date), status, seen_at)
+                link["status"] = status
+                link["last_seen"] = seen_at
+            for link in self._select_links(lambda link: link["discord_id"] == discord_id):
+                if link["last_seen"] < seen_at:
+                    link["status"] = COMPLETED_STATUS
+            self._settings[f"assignments_synced_at:{discord_id}"] = seen_at
+
+    def get_user_assignments(self, discord_id, include_completed=False):
+        with self._lock:
+            rows = [
+                self._catalog_rows[link["assignment_id"]] + (link["status"],)
+                for link in self._select_links(lambda link: link["discord_id"] == discord_id)
+                if include_completed or link["status"] != COMPLETED_STATUS
+            ]
+            rows.sort(key=lambda row: (row[2], row[0], row[1]))
+            return rows
+
+    def query_assignments(self, discord_id, start_date=None, end_date=None, include_completed=False):
+        return [
+            row for row in self.get_user_assignments(discord_id, include_completed)
+            if (start_date is None or row[2] >= start_date) and (end_date is None or row[2] <= end_date)
+        ]
+
+    def get_user_assignments_page(self, discord_id, after=None, limit=10, include_completed=False):
+        with self._lock:
+            rows = [
+                (link["id"],) + self._catalog_rows[link["assignment_id"]] + (link["status"],)
+                for link in self._select_links(lambda link: link["discord_id"] == discord_id)
+                if include_completed or link["status"] != COMPLETED_STATUS
+            ]
+        rows = [row for row in rows if after is None or (row[3], row[0]) > tuple(after)]
+        rows.sort(key=lambda row: (row[3], row[0]))
+        return rows[:limit]
+
+    def search_assignments(self, discord_id, terms, limit=10, include_completed=False):
+        return rank_search_matches(self.get_user_assignments(discord_id, include_completed), terms, limit)
+
+    def get_setting(self, key, default=None):
+        with self._lock:
+            return self._settings.get(key, default)
+
+    def set_setting(self, key, value):
+        with self._lock:
+            self._settings[key] = None if value is None else str(value)
+
+    def enqueue_outbox(self, entries, created_at):
+        with self._lock:
+            added = 0
+            for idempotency_key, reminder_id, discord_id, assignment_name, due_date in entries:
+                if idempotency_key in self._outbox_keys:
+                    continue
+                self._outbox_keys.add(idempotency_key)
+                self._outbox[self._next_outbox_id] = {
+                    "id": self._next_outbox_id,
+                    "idempotency_key": idempotency_key,
+                    "reminder_id": reminder_id,
+                    "discord_id": discord_id,
+                    "assignment_name": assignment_name,
+                    "due_date": due_date,
+                    "status": OUTBOX_PENDING,
+                    "attempts": 0,
+                    "next_attempt_at": created_at,
+                    "last_error": None,
+                    "created_at": created_at,
+                    "delivered_at": None
+                }
+                self._next_outbox_id += 1
+                added += 1
+            return added
+
+    def get_ready_outbox(self, now, limit=100):
+        with self._lock:
+            entries = sorted(
+                (entry for entry in self._outbox.values()
+                 if entry["status"] == OUTBOX_PENDING and entry["next_attempt_at"] <= now),
+                key=lambda entry: (entry["next_attempt_at"], entry["discord_id"], entry["id"])
+            )[:limit]
+            return [
+                (e["id"], e["reminder_id"], e["discord_id"], e["assignment_name"], e["due_date"], e["attempts"])
+                for e in entries
+            ]
+
+    def get_next_outbox_attempt(self):
+        with self._lock:
+            pending = [entry["next_attempt_at"] for entry in self._outbox.values() if entry["status"] == OUTBOX_PENDING]
+            return min(pending) if pending else None
+
+    def claim_outbox(self, outbox_ids, now, claimed_until, fence=None):
+        with self._lock:
+            if fence is not None:
+                lease = self._leases.get(fence[0])
+                if lease is None or lease[1] != fence[1]:
+                    return []
+            claimed = []
+            for outbox_id in outbox_ids:
+                entry = self._outbox.get(outbox_id)
+                if entry is not None and entry["status"] == OUTBOX_PENDING and entry["next_attempt_at"] <= now:
+                    entry["next_attempt_at"] = claimed_until
+                    claimed.append(outbox_id)
+            return claimed
+
+    def mark_outbox_delivered(self, outbox_ids, delivered_at):
+        with self._lock:
+            updated = 0
+            for outbox_id in outbox_ids:
+                entry = self._outbox.get(outbox_id)
+                if entry is None:
+                    continue
+                link = self._links.get(entry["reminder_id"])
+                if link is not None:
+                    link["sent"] = 1
+                entry.update(status=OUTBOX_DELIVERED, delivered_at=delivered_at, attempts=entry["attempts"] + 1, last_error=None)
+                updated += 1
+            return updated
+
+    def mark_outbox_failed(self, outbox_ids, error, next_attempt_at):
+        with self._lock:
+            updated = 0
+            for outbox_id in outbox_ids:
+                entry = self._outbox.get(outbox_id)
+                if entry is None:
+                    continue
+                entry["attempts"] += 1
+                entry["last_error"] = error
+                if next_attempt_at is None:
+                    entry["status"] = OUTBOX_FAILED
+                else:
+                    entry["next_attempt_at"] = next_attempt_at
+                updated += 1
+            return updated
+
+    def count_outbox(self, status=None):
+        with self._lock:
+            return sum(1 for entry in self._outbox.values() if status is None or entry["status"] == status)
+
+    def purge_outbox(self, before):
+        with self._lock:
+            finished = [
+                entry for entry in self._outbox.values()
+                if entry["status"] in (OUTBOX_DELIVERED, OUTBOX_FAILED) and entry["created_at"] < before
+            ]
+            for entry in finished:
+                del self._outbox[entry["id"]]
+                self._outbox_keys.discard(entry["idempotency_key"])
+            return len(finished)
+
+    def acquire_lease(self, name, holder, now, expires_at):
+        with self._lock:
+            lease = self._leases.get(name)
+            if lease is None:
+                self._leases[name] = [holder, 1, expires_at]
+                return 1
+            if lease[0] == holder and lease[2] >= now:
+                lease[2] = expires_at
+                return lease[1]
+            if lease[2] < now:
+                self._leases[name] = [holder, lease[1] + 1, expires_at]
+                return lease[1] + 1
+            return None
+
+    def release_lease(self, name, holder):
+        with self._lock:
+            lease = self._leases.get(name)
+            if lease is not None and lease[0] == holder:
+                lease[2] = ""
+
+    def get_lease(self, name):
+        with self._lock:
+            lease = self._leases.get(name)
+            return tuple(lease) if lease is not None else None
+
+    def get_table_columns(self, table):
+        return set(TABLE_COLUMNS.get(table, set()))
+
+    def count_orphaned_reminders(self):
+        with self._lock:
+            return len(self._select_links(lambda link: link["discord_id"] not in self._users))
+
+    def purge_sent_reminders(self, before_date, archive=False):
+        with self._lock:
+            links = self._select_links(
+                lambda link: link["status"] == COMPLETED_STATUS
+                and self._catalog_rows[link["assignment_id"]][2] < before_date
+            )
+            if archive:
+                for link in links:
+                    if link["reminder_date"] is not None:
+                        self._archive[link["id"]] = self._reminder_row(link)
+            return self._delete_links(links)
+
+    def delete_orphaned_reminders(self):
+        with self._lock:
+            return self._delete_links(self._select_links(lambda link: link["discord_id"] not in self._users))
+
+    def compact(self):
+        return 0
+
+
+# Available backends, selected with the STORAGE_BACKEND environment variable
+BACKENDS = {
+    "sqlite": lambda: SQLiteStorage(os.getenv("DATABASE_PATH", "arbor_users.db")),
+    "memory": MemoryStorage
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def create_storage(backend=None):
+    """Create a new storage backend by name (defaults to the configured one)"""
+    backend = (backend or os.getenv("STORAGE_BACKEND", "sqlite")).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}'. Choose one of: {', '.join(BACKENDS)}")
+    return BACKENDS[backend]()
+
+def get_storage():
+    """Return the process-wide storage backend, creating it from configuration on first use"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage()
+    return _storage
+
+def set_storage(storage):
+    """Replace the process-wide storage backend (used by tests and simulations)"""
+    global _storage
+    with _storage_lock:
+        _storage = storage
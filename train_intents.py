@@ -0,0 +1,81 @@
+# Train the intent classifier from the labelled corpus
+#
+#   python train_intents.py                   # train on everything and write intent_model.npz
+#   python train_intents.py --holdout         # train on the training split only
+import argparse
+import os
+import zlib
+import numpy as np
+
+from intent_classifier import IntentClassifier, hash_features, DEFAULT_DIMENSIONS, MODEL_PATH
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_corpus.tsv")
+
+# One in this many utterances is held out for evaluation, chosen by hash so the split is stable
+HOLDOUT_EVERY = 5
+
+# Read (label, message) pairs, skipping blank lines and comments
+def read_corpus(path=CORPUS_PATH):
+    examples = []
+    with open(path, encoding="utf-8") as corpus:
+        for line in corpus:
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            label, text = line.split("\t", 1)
+            examples.append((label, text))
+    return examples
+
+def is_held_out(text):
+    return zlib.crc32(text.lower().encode("utf-8")) % HOLDOUT_EVERY == 0
+
+# Split examples into (train, test)
+def split_corpus(examples):
+    train = [example for example in examples if not is_held_out(example[1])]
+    test = [example for example in examples if is_held_out(example[1])]
+    return train, test
+
+def train(examples, dimensions=DEFAULT_DIMENSIONS, epochs=300, learning_rate=20.0, l2=1e-4):
+    """Fit a softmax regression over hashed features with full-batch gradient descent"""
+    labels = sorted({label for label, _ in examples})
+    label_index = {label: i for i, label in enumerate(labels)}
+
+    features = np.zeros((len(examples), dimensions), dtype=np.float32)
+    for row, (_, text) in enumerate(examples):
+        indexes, values = hash_features(text, dimensions)
+        np.add.at(features[row], indexes, values)
+    targets = np.zeros((len(examples), len(labels)), dtype=np.float32)
+    targets[np.arange(len(examples)), [label_index[label] for label, _ in examples]] = 1.0
+
+    weights = np.zeros((len(labels), dimensions), dtype=np.float32)
+    bias = np.zeros(len(labels), dtype=np.float32)
+    for _ in range(epochs):
+        scores = features @ weights.T + bias
+        scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+        probabilities = scores / scores.sum(axis=1, keepdims=True)
+        error = (probabilities - targets) / len(examples)
+        weights -= learning_rate * (error.T @ features + l2 * weights)
+        bias -= learning_rate * error.sum(axis=0)
+    return IntentClassifier(labels, weights, bias, dimensions)
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the intent classifier")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--output", default=MODEL_PATH)
+    parser.add_argument("--dimensions", type=int, default=DEFAULT_DIMENSIONS)
+    parser.add_argument("--epochs", type=int, default=300)
+    parser.add_argument("--holdout", action="store_true", help="leave the evaluation split out of training")
+    args = parser.parse_args()
+
+    examples = read_corpus(args.corpus)
+    if args.holdout:
+        examples, _ = split_corpus(examples)
+    classifier = train(examples, args.dimensions, args.epochs)
+    classifier.save(args.output)
+
+    correct = sum(classifier.predict(text)[0] == label for label, text in examples)
+    print(f"Trained on {len(examples)} utterances, {len(classifier.labels)} intents; training accuracy {correct / len(examples):.1%}")
+    print(f"Model written to {args.output} ({os.path.getsize(args.output) / 1024:.0f} KB)")
+
+if __name__ == "__main__":
+    main()
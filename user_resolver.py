@@ -0,0 +1,75 @@
+# Cached resolution of Discord users and their DM channels for outbound messages
+import os
+import discord
+from cache_utils import LRUCache, MISSING
+
+class UserResolver:
+    """Resolves discord ids to users and DM channels with as few REST calls as possible.
+
+    Looks in the gateway cache (bot.get_user) first, then in a bounded LRU of users fetched
+    over REST and the DM channels opened for them. Entries are dropped when Discord reports
+    the user can no longer be messaged (blocked the bot, left, or deleted their account).
+    """
+
+    def __init__(self, bot, maxsize=None):
+        if maxsize is None:
+            maxsize = int(os.getenv("DM_CACHE_SIZE", "1024"))
+        self.bot = bot
+        self.users = LRUCache(maxsize)
+        self.channels = LRUCache(maxsize)
+        self.fetches = 0
+
+    async def get_user(self, discord_id):
+        discord_id = int(discord_id)
+        user = self.bot.get_user(discord_id)
+        if user is not None:
+            return user
+
+        user = self.users.get(discord_id)
+        if user is MISSING:
+            self.fetches += 1
+            user = await self.bot.fetch_user(discord_id)
+            self.users.put(discord_id, user)
+        return user
+
+    async def get_dm_channel(self, discord_id):
+        discord_id = int(discord_id)
+        channel = self.channels.get(discord_id)
+        if channel is not MISSING:
+            return channel
+
+        user = await self.get_user(discord_id)
+        channel = user.dm_channel
+        if channel is None:
+            channel = await user.create_dm()
+        self.channels.put(discord_id, channel)
+        return channel
+
+    # Send a DM, forgetting the user if Discord says they can't be messaged any more
+    async def send(self, discord_id, *args, **kwargs):
+        try:
+            channel = await self.get_dm_channel(discord_id)
+            return await channel.send(*args, **kwargs)
+        except (discord.Forbidden, discord.NotFound):
+            self.forget(discord_id)
+            raise
+
+    def forget(self, discord_id):
+        self.users.invalidate(int(discord_id))
+        self.channels.invalidate(int(discord_id))
+
+    def stats(self):
+        return {
+            "fetches": self.fetches,
+            "users": self.users.stats(),
+            "channels": self.channels.stats()
+        }
+
+_resolver = None
+
+# Shared resolver for the running bot
+def get_user_resolver(bot):
+    global _resolver
+    if _resolver is None or _resolver.bot is not bot:
+        _resolver = UserResolver(bot)
+    return _resolver